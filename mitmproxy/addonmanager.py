@@ -2,6 +2,7 @@ import types
 import typing
 import traceback
 import contextlib
+import functools
 import sys
 
 from mitmproxy import exceptions
@@ -69,7 +70,8 @@ def safecall():
         raise
     except Exception as e:
         etype, value, tb = sys.exc_info()
-        tb = cut_traceback(tb, "invoke_addon")
+        # Handlers are called either by invoke_addon or by invoke_handlers.
+        tb = cut_traceback(cut_traceback(tb, "invoke_addon"), "invoke_handlers")
         ctx.log.error(
             "Addon error: %s" % "".join(
                 traceback.format_exception(etype, value, tb)
@@ -127,11 +129,59 @@ def traverse(chain):
             yield from traverse(a.addons)
 
 
+def _threadsafe(addon):
+    return getattr(addon, "threadsafe", False) is True
+
+
+# Events that only ever run on the master, never inline.
+_master_events = frozenset([
+    "configure", "done", "load", "log", "running", "tick", "update"
+])
+
+
+def _check_threadsafe(addon):
+    """
+        Handlers of thread-safe addons run outside of a handler context, so
+        they must not use mitmproxy.ctx. Catch the handlers that use it
+        directly.
+    """
+    for name in eventsequence.Events - _master_events:
+        code = getattr(_handler(addon, name), "__code__", None)
+        if code and "ctx" in code.co_names:
+            raise exceptions.AddonManagerError(
+                "Thread-safe addon '%s' uses mitmproxy.ctx in its %s handler." % (
+                    _get_name(addon), name
+                )
+            )
+
+
+def _handler(addon, name):
+    func = getattr(addon, name, None)
+    # Modules imported under the name of a hook are not handlers, see
+    # invoke_addon.
+    if func and not isinstance(func, types.ModuleType):
+        return func
+    return None
+
+
 class AddonManager:
     def __init__(self, master):
         self.lookup = {}
         self.chain = []
         self.master = master
+        # Maps event names to the addons that handle them. This is replaced
+        # as a whole whenever addons are registered or removed, so that
+        # proxy threads can read it without locking.
+        self.subscriptions = {}  # type: typing.Dict[str, typing.Tuple[typing.Any, ...]]
+        # Maps event names to the handlers trigger() calls, see dispatch_table.
+        self.dispatch = {}  # type: typing.Dict[str, typing.List[typing.Tuple[typing.Callable, ...]]]
+        # The same, without the handlers that run inline.
+        self.dispatch_inlined = {}  # type: typing.Dict[str, typing.List[typing.Tuple[typing.Callable, ...]]]
+        # Maps event names to the handlers of thread-safe addons at the start
+        # of the chain, and whether the master has handlers left to run, see
+        # inline_handlers. Connection threads read this, so it is built in
+        # one go on the master thread and then replaced as a whole.
+        self.inline = {}  # type: typing.Dict[str, typing.Tuple[typing.Tuple[typing.Callable, ...], bool]]
         master.options.changed.connect(self._configure_all)
 
     def _configure_all(self, options, updated):
@@ -144,6 +194,48 @@ class AddonManager:
         for i in self.chain:
             self.remove(i)
 
+    def invalidate(self):
+        """
+            Rebuild the handler tables. Addons that manage sub-addons must
+            call this when they change their addons attribute without
+            registering or removing an addon, for instance when they reorder
+            them. Must be called on the master thread.
+        """
+        self.dispatch = {}
+        self.dispatch_inlined = {}
+        inline = {}
+        for name in eventsequence.Events - _master_events:
+            leading = []
+            for a, func in self._handlers(self.chain, name):
+                if not _threadsafe(a):
+                    break
+                leading.append(func)
+            if leading:
+                inline[name] = (
+                    tuple(leading),
+                    bool(self.dispatch_table(name, inlined=True))
+                )
+        self.inline = inline
+
+    def _addons_changed(self):
+        self.invalidate()
+        subscriptions = {}
+        for name in eventsequence.Events:
+            addons = tuple(a for a in self.lookup.values() if _handler(a, name))
+            if addons:
+                subscriptions[name] = addons
+        self.subscriptions = subscriptions
+        # Give new addons their first tick right away. Scripts, for
+        # instance, are only loaded on tick.
+        self.master.wake()
+
+    def handles(self, name):
+        """
+            Is there an addon with a handler for the given event? Safe to
+            call from any thread.
+        """
+        return name in self.subscriptions
+
     def get(self, name):
         """
             Retrieve an addon by name. Addon names are equal to the .name
@@ -168,6 +260,8 @@ class AddonManager:
                 raise exceptions.AddonManagerError(
                     "An addon called '%s' already exists." % name
                 )
+            if _threadsafe(a):
+                _check_threadsafe(a)
         l = Loader(self.master)
         self.invoke_addon(addon, "load", l)
         for a in traverse([addon]):
@@ -175,6 +269,7 @@ class AddonManager:
             self.lookup[name] = a
         for a in traverse([addon]):
             self.master.commands.collect_commands(a)
+        self._addons_changed()
         return addon
 
     def add(self, *addons):
@@ -185,6 +280,7 @@ class AddonManager:
         with self.master.handlecontext():
             for i in addons:
                 self.chain.append(self.register(i))
+        self.invalidate()
 
     def remove(self, addon):
         """
@@ -200,6 +296,7 @@ class AddonManager:
                 raise exceptions.AddonManagerError("No such addon: %s" % n)
             self.chain = [i for i in self.chain if i is not a]
             del self.lookup[_get_name(a)]
+        self._addons_changed()
         with self.master.handlecontext():
             self.invoke_addon(a, "done")
 
@@ -228,7 +325,11 @@ class AddonManager:
         if isinstance(message.reply, controller.DummyReply):
             message.reply.reset()
 
-        self.trigger(name, message)
+        if message.reply.inlined:
+            # Thread-safe addons have already handled the message.
+            self._trigger(self.dispatch_table(name, inlined=True), message)
+        else:
+            self.trigger(name, message)
 
         if message.reply.state != "taken":
             message.reply.take()
@@ -242,6 +343,22 @@ class AddonManager:
         if isinstance(message, flow.Flow):
             self.trigger("update", [message])
 
+    def _invoke(self, a, name, *args, **kwargs):
+        func = getattr(a, name, None)
+        if func:
+            if callable(func):
+                func(*args, **kwargs)
+            elif isinstance(func, types.ModuleType):
+                # we gracefully exclude module imports with the same name as hooks.
+                # For example, a user may have "from mitmproxy import log" in an addon,
+                # which has the same name as the "log" hook. In this particular case,
+                # we end up in an error loop because we "log" this error.
+                pass
+            else:
+                raise exceptions.AddonManagerError(
+                    "Addon handler {} ({}) not callable".format(name, a)
+                )
+
     def invoke_addon(self, addon, name, *args, **kwargs):
         """
             Invoke an event on an addon and all its children. This method must
@@ -250,29 +367,100 @@ class AddonManager:
         if name not in eventsequence.Events:
             name = "event_" + name
         for a in traverse([addon]):
-            func = getattr(a, name, None)
+            self._invoke(a, name, *args, **kwargs)
+
+    def _handlers(self, chain, hname):
+        for a in traverse(chain):
+            # Skip addons that have been removed, but are still referenced by
+            # their parent.
+            if self.lookup.get(_get_name(a)) is not a:
+                continue
+            func = _handler(a, hname)
             if func:
-                if callable(func):
-                    func(*args, **kwargs)
-                elif isinstance(func, types.ModuleType):
-                    # we gracefully exclude module imports with the same name as hooks.
-                    # For example, a user may have "from mitmproxy import log" in an addon,
-                    # which has the same name as the "log" hook. In this particular case,
-                    # we end up in an error loop because we "log" this error.
-                    pass
-                else:
-                    raise exceptions.AddonManagerError(
-                        "Addon handler {} ({}) not callable".format(name, a)
-                    )
+                if not callable(func):
+                    # Let _invoke report the error, or pick up a handler
+                    # assigned later.
+                    func = functools.partial(self._invoke, a, hname)
+                yield a, func
+
+    def dispatch_table(self, name, inlined=False):
+        """
+            Return the handlers for an event: a tuple of handlers for each
+            addon in the chain that has any, covering the addon and its
+            children in traversal order. If inlined is True, the handlers
+            returned by inline_handlers are left out. Tables are cached until
+            addons are registered or removed.
+        """
+        dispatch = self.dispatch_inlined if inlined else self.dispatch
+        table = dispatch.get(name)
+        if table is None:
+            hname = name if name in eventsequence.Events else "event_" + name
+            table = []
+            leading = inlined
+            for i in self.chain:
+                handlers = []
+                for a, func in self._handlers([i], hname):
+                    if leading and _threadsafe(a):
+                        continue
+                    leading = False
+                    handlers.append(func)
+                if handlers:
+                    table.append(tuple(handlers))
+            dispatch[name] = table
+        return table
+
+    def inline_handlers(self, name):
+        """
+            Return the handlers of the thread-safe addons at the start of the
+            chain for an event, up to the first addon that handles the event
+            and is not thread-safe. Addons declare themselves thread-safe
+            with a threadsafe attribute set to True. Their handlers for
+            events sent with Channel.ask run on the connection thread, before
+            the message is handed to the master. Handlers further down the
+            chain run on the master, so that handlers always run in chain
+            order.
+
+            The message only skips the master if no other addon handles the
+            event. In the default addon chain, other addons follow for every
+            flow event, so this moves work off the master thread but does not
+            save the round-trip through the event queue.
+        """
+        return self.inline.get(name, ((), True))[0]
+
+    def invoke_inline(self, name, message):
+        """
+            Run the handlers of thread-safe addons for an event on the calling
+            thread. Errors are logged through the master's event queue.
+
+            Returns True if the master has handlers left to run.
+        """
+        handlers, rest = self.inline.get(name, ((), True))
+        for func in handlers:
+            try:
+                func(message)
+            except exceptions.AddonHalt:
+                return False
+            except Exception:
+                self.master.tell("log", log.LogEntry(
+                    "Addon error: %s" % traceback.format_exc(), "error"
+                ))
+        return rest
+
+    def invoke_handlers(self, handlers, *args, **kwargs):
+        for func in handlers:
+            func(*args, **kwargs)
 
     def trigger(self, name, *args, **kwargs):
         """
             Establish a handler context and trigger an event across all addons
         """
+        self._trigger(self.dispatch_table(name), *args, **kwargs)
+
+    def _trigger(self, table, *args, **kwargs):
         with self.master.handlecontext():
-            for i in self.chain:
+            for handlers in table:
                 try:
                     with safecall():
-                        self.invoke_addon(i, name, *args, **kwargs)
+                        self.invoke_handlers(handlers, *args, **kwargs)
                 except exceptions.AddonHalt:
                     return
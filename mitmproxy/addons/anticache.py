@@ -2,6 +2,16 @@ from mitmproxy import ctx
 
 
 class AntiCache:
+    # Runs on connection threads, see AddonManager.inline_handlers.
+    threadsafe = True
+
+    def __init__(self):
+        self.enabled = False
+
+    def configure(self, updated):
+        if "anticache" in updated:
+            self.enabled = ctx.options.anticache
+
     def request(self, flow):
-        if ctx.options.anticache:
+        if self.enabled:
             flow.request.anticache()
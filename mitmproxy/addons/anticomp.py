@@ -2,6 +2,16 @@ from mitmproxy import ctx
 
 
 class AntiComp:
+    # Runs on connection threads, see AddonManager.inline_handlers.
+    threadsafe = True
+
+    def __init__(self):
+        self.enabled = False
+
+    def configure(self, updated):
+        if "anticomp" in updated:
+            self.enabled = ctx.options.anticomp
+
     def request(self, flow):
-        if ctx.options.anticomp:
+        if self.enabled:
             flow.request.anticomp()
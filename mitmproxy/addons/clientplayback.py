@@ -54,6 +54,11 @@ class ClientPlayback:
                 raise exceptions.OptionsError(str(e))
             self.start_replay(flows)
 
+    def start_next(self):
+        f = self.flows.pop(0)
+        self.current_thread = ctx.master.replay_request(f)
+        ctx.master.addons.trigger("update", [f])
+
     def tick(self):
         current_is_done = self.current_thread and not self.current_thread.is_alive()
         can_start_new = not self.current_thread or current_is_done
@@ -63,8 +68,17 @@ class ClientPlayback:
             self.current_thread = None
             ctx.master.addons.trigger("update", [])
         if will_start_new:
-            f = self.flows.pop(0)
-            self.current_thread = ctx.master.replay_request(f)
-            ctx.master.addons.trigger("update", [f])
+            self.start_next()
         if current_is_done and not will_start_new:
             ctx.master.addons.trigger("processing_complete")
+
+    def response(self, f):
+        # Once the current replay has its response, start the next one right
+        # away instead of on the next tick. The replay thread only has to
+        # clean up. A flow that is still live can't be replayed yet, tick()
+        # takes care of that.
+        if self.flows and not self.flows[0].live and self.current_thread and f is self.current_thread.f:
+            self.start_next()
+
+    def error(self, f):
+        self.response(f)
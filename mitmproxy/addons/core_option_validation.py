@@ -2,6 +2,8 @@
     The core addon is responsible for verifying core settings that are not
     checked by other addons.
 """
+import socket
+
 from mitmproxy import exceptions
 from mitmproxy import platform
 from mitmproxy import ctx
@@ -27,6 +29,14 @@ class CoreOptionValidation:
                     "Invalid body size limit specification: %s" %
                     opts.body_size_limit
                 )
+        if "body_spill_size" in updated:
+            try:
+                human.parse_size(opts.body_spill_size)
+            except ValueError:
+                raise exceptions.OptionsError(
+                    "Invalid body spill size specification: %s" %
+                    opts.body_spill_size
+                )
         if "mode" in updated:
             mode = opts.mode
             if mode.startswith("reverse:") or mode.startswith("upstream:"):
@@ -43,3 +53,22 @@ class CoreOptionValidation:
                 raise exceptions.OptionsError(
                     "Invalid mode specification: %s" % mode
                 )
+        if "concurrent_threads" in updated:
+            if opts.concurrent_threads < 1:
+                raise exceptions.OptionsError(
+                    "Invalid number of concurrent threads: %s" % opts.concurrent_threads
+                )
+        if "workers" in updated or "listen_port" in updated:
+            if opts.workers < 1:
+                raise exceptions.OptionsError(
+                    "Invalid number of workers: %s" % opts.workers
+                )
+            if opts.workers > 1:
+                if not hasattr(socket, "SO_REUSEPORT"):
+                    raise exceptions.OptionsError(
+                        "Multiple workers are not supported on this platform."
+                    )
+                if not opts.listen_port:
+                    raise exceptions.OptionsError(
+                        "Multiple workers require an explicit listen port."
+                    )
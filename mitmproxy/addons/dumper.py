@@ -163,10 +163,10 @@ class Dumper:
             bold=True
         )
 
-        if flow.response.raw_content is None:
+        if flow.response.raw_content_view is None:
             size = "(content missing)"
         else:
-            size = human.pretty_size(len(flow.response.raw_content))
+            size = human.pretty_size(len(flow.response.raw_content_view))
         size = click.style(size, bold=True)
 
         arrows = click.style(" <<", bold=True)
@@ -44,8 +44,12 @@ def parse_hook(s):
 
 
 class Replace:
+    # Runs on connection threads, see AddonManager.inline_handlers.
+    threadsafe = True
+
     def __init__(self):
         self.lst = []
+        self._log = None
 
     def configure(self, updated):
         """
@@ -78,6 +82,8 @@ class Replace:
                     )
                 lst.append((rex, s, flt))
             self.lst = lst
+        # ctx is only set up on the master thread.
+        self._log = ctx.log
 
     def execute(self, f):
         for rex, s, flt in self.lst:
@@ -102,6 +108,6 @@ class Replace:
                 with open(s, "rb") as f:
                     s = f.read()
             except IOError:
-                ctx.log.warn("Could not read replacement file: %s" % s)
+                self._log.warn("Could not read replacement file: %s" % s)
                 return
         obj.replace(rex, s, flags=re.DOTALL)
@@ -12,6 +12,8 @@ from mitmproxy import flow
 from mitmproxy import command
 from mitmproxy import eventsequence
 from mitmproxy import ctx
+from mitmproxy.script.concurrent import pool as concurrent_pool
+from mitmproxy.script.concurrent import stats as concurrent_stats
 
 
 def load_script(path: str) -> types.ModuleType:
@@ -75,6 +77,7 @@ class Script:
                     ns = load_script(self.fullpath)
                     ctx.master.addons.register(ns)
                     self.ns = ns
+                    ctx.master.addons.invalidate()
                 if self.ns:
                     # We're already running, so we have to explicitly register and
                     # configure the addon
@@ -92,13 +95,29 @@ class ScriptLoader:
     """
         An addon that manages loading scripts from options.
     """
+    # Seconds between @concurrent hook statistics in the debug log.
+    stats_interval = 5
+
     def __init__(self):
         self.is_running = False
         self.addons = []
+        self.next_stats = 0.0
 
     def running(self):
         self.is_running = True
 
+    def tick(self):
+        now = time.monotonic()
+        if now >= self.next_stats:
+            self.next_stats = now + self.stats_interval
+            self.log_stats()
+
+    def log_stats(self):
+        for name, s in sorted(concurrent_stats.items()):
+            if s.count:
+                ctx.log.debug("@concurrent {}: {}".format(name, s))
+                s.reset()
+
     @command.command("script.run")
     def script_run(self, flows: typing.Sequence[flow.Flow], path: str) -> None:
         """
@@ -120,6 +139,10 @@ class ScriptLoader:
             raise exceptions.CommandError("Error running script: %s" % e) from e
 
     def configure(self, updated):
+        if "concurrent_threads" in updated:
+            concurrent_pool.max_workers = ctx.options.concurrent_threads
+        if "concurrent_queue_size" in updated:
+            concurrent_pool.max_queue = ctx.options.concurrent_queue_size
         if "scripts" in updated:
             for s in ctx.options.scripts:
                 if ctx.options.scripts.count(s) > 1:
@@ -151,7 +174,9 @@ class ScriptLoader:
                     ordered.append(sc)
                     newscripts.append(sc)
 
-            self.addons = ordered
+            if ordered != self.addons:
+                self.addons = ordered
+                ctx.master.addons.invalidate()
 
             for s in newscripts:
                 ctx.master.addons.register(s)
@@ -41,12 +41,15 @@ def parse_setheader(s):
 
 
 class SetHeaders:
+    # Runs on connection threads, see AddonManager.inline_handlers.
+    threadsafe = True
+
     def __init__(self):
         self.lst = []
 
     def configure(self, updated):
         if "setheaders" in updated:
-            self.lst = []
+            lst = []
             for shead in ctx.options.setheaders:
                 fpatt, header, value = parse_setheader(shead)
 
@@ -55,7 +58,8 @@ class SetHeaders:
                     raise exceptions.OptionsError(
                         "Invalid setheader filter pattern %s" % fpatt
                     )
-                self.lst.append((fpatt, header, value, flt))
+                lst.append((fpatt, header, value, flt))
+            self.lst = lst
 
     def run(self, f, hdrs):
         for _, header, value, flt in self.lst:
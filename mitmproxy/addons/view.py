@@ -86,10 +86,10 @@ class OrderRequestURL(_OrderKey):
 class OrderKeySize(_OrderKey):
     def generate(self, f: http.HTTPFlow) -> int:
         s = 0
-        if f.request.raw_content:
-            s += len(f.request.raw_content)
-        if f.response and f.response.raw_content:
-            s += len(f.response.raw_content)
+        if f.request.raw_content_view:
+            s += len(f.request.raw_content_view)
+        if f.response and f.response.raw_content_view:
+            s += len(f.response.raw_content_view)
         return s
 
 
@@ -1,5 +1,10 @@
+import collections
+import concurrent.futures
+import hashlib
 import os
 import ssl
+import tempfile
+import threading
 import time
 import datetime
 import ipaddress
@@ -10,6 +15,9 @@ from pyasn1.type import univ, constraint, char, namedtype, tag
 from pyasn1.codec.der.decoder import decode
 from pyasn1.error import PyAsn1Error
 import OpenSSL
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
 
 from mitmproxy.types import serializable
 
@@ -34,9 +42,41 @@ rD693XKIHUCWOjMh1if6omGXKHH40QuME2gNa50+YPn1iYDl88uDbbMCAQI=
 """
 
 
-def create_ca(o, cn, exp):
-    key = OpenSSL.crypto.PKey()
-    key.generate_key(OpenSSL.crypto.TYPE_RSA, 2048)
+# Key algorithms for the CA and generated certificates. ECDSA keys are much
+# cheaper to use in handshakes, RSA keys are supported by all clients.
+KEY_TYPES = ("rsa", "ecdsa")
+
+
+def create_key(key_type="rsa"):
+    """
+        Generates an RSA-2048 or ECDSA P-256 private key.
+    """
+    if key_type == "ecdsa":
+        # PKey.from_cryptography_key doesn't support EC keys.
+        key = ec.generate_private_key(ec.SECP256R1(), default_backend())
+        pem = key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.TraditionalOpenSSL,
+            serialization.NoEncryption(),
+        )
+        return OpenSSL.crypto.load_privatekey(OpenSSL.crypto.FILETYPE_PEM, pem)
+    elif key_type == "rsa":
+        key = OpenSSL.crypto.PKey()
+        key.generate_key(OpenSSL.crypto.TYPE_RSA, 2048)
+        return key
+    raise ValueError("Unknown key type: %s" % key_type)
+
+
+def get_key_type(key):
+    # OpenSSL.crypto.TYPE_EC is missing from older pyOpenSSL releases.
+    k = key.to_cryptography_key()
+    if isinstance(k, (ec.EllipticCurvePrivateKey, ec.EllipticCurvePublicKey)):
+        return "ecdsa"
+    return "rsa"
+
+
+def create_ca(o, cn, exp, key_type="rsa"):
+    key = create_key(key_type)
     cert = OpenSSL.crypto.X509()
     cert.set_serial_number(int(time.time() * 10000))
     cert.set_version(2)
@@ -78,7 +118,7 @@ def create_ca(o, cn, exp):
     return key, cert
 
 
-def dummy_cert(privkey, cacert, commonname, sans):
+def dummy_cert(privkey, cacert, commonname, sans, key=None):
     """
         Generates a dummy certificate.
 
@@ -86,6 +126,7 @@ def dummy_cert(privkey, cacert, commonname, sans):
         cacert: CA certificate
         commonname: Common name for the generated certificate.
         sans: A list of Subject Alternate Names.
+        key: The key of the generated certificate, defaults to the CA key.
 
         Returns cert if operation succeeded, None if not.
     """
@@ -110,7 +151,7 @@ def dummy_cert(privkey, cacert, commonname, sans):
         cert.set_version(2)
         cert.add_extensions(
             [OpenSSL.crypto.X509Extension(b"subjectAltName", False, ss)])
-    cert.set_pubkey(cacert.get_pubkey())
+    cert.set_pubkey(key or cacert.get_pubkey())
     cert.sign(privkey, "sha256")
     return SSLCert(cert)
 
@@ -123,38 +164,162 @@ class CertStoreEntry:
         self.chain_file = chain_file
 
 
+class CertDiskCache:
+
+    """
+        Stores generated certificates on disk, so that they can be reused
+        after a restart and by other processes using the same CA.
+
+        Certificates are written atomically and can be shared by concurrent
+        processes. Certificates that expire soon are ignored, and once there
+        are more than size certificates, the least recently used ones are
+        removed.
+    """
+    # Don't use certificates that expire within this many seconds.
+    MIN_VALIDITY = 24 * 60 * 60
+
+    def __init__(self, path, ca, size):
+        self.path = path
+        self.size = size
+        self.ca_digest = ca.digest("sha256")
+        self.lock = threading.Lock()
+        self.writes = 0
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(path, exist_ok=True)
+
+    def _filename(self, commonname, sans, key=None):
+        h = hashlib.sha256(self.ca_digest)
+        if key:
+            # Certificates with their own key rather than the CA key.
+            h.update(OpenSSL.crypto.dump_publickey(OpenSSL.crypto.FILETYPE_ASN1, key))
+        for i in [commonname or b""] + sans:
+            h.update(b"\0" + i)
+        return os.path.join(self.path, h.hexdigest() + ".pem")
+
+    def get(self, commonname: typing.Optional[bytes], sans: typing.List[bytes], key=None) -> typing.Optional["SSLCert"]:
+        filename = self._filename(commonname, sans, key)
+        try:
+            with open(filename, "rb") as f:
+                cert = SSLCert.from_pem(f.read())
+            deadline = datetime.datetime.utcnow() + datetime.timedelta(seconds=self.MIN_VALIDITY)
+            if cert.notafter < deadline:
+                raise ValueError("Certificate expires soon.")
+            # Used for cleanup, see below.
+            os.utime(filename)
+        except (OSError, ValueError, OpenSSL.crypto.Error):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return cert
+
+    def put(self, commonname: typing.Optional[bytes], sans: typing.List[bytes], cert: "SSLCert", key=None) -> None:
+        filename = self._filename(commonname, sans, key)
+        try:
+            fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=self.path)
+            with os.fdopen(fd, "wb") as f:
+                f.write(cert.to_pem())
+            # Readers in other processes never see a partially written file.
+            os.replace(tmp, filename)
+        except OSError:
+            return
+        with self.lock:
+            self.writes += 1
+            cleanup = self.writes % (self.size // 10 + 1) == 0
+        if cleanup:
+            self.cleanup()
+
+    def cleanup(self) -> None:
+        """
+            Remove the least recently used certificates, as well as leftovers
+            of interrupted writes.
+        """
+        now = time.time()
+        files = []
+        for entry in os.scandir(self.path):
+            try:
+                mtime = entry.stat().st_mtime
+                if entry.name.endswith(".tmp"):
+                    if mtime < now - 3600:
+                        os.remove(entry.path)
+                elif entry.name.endswith(".pem"):
+                    files.append((mtime, entry.path))
+            except OSError:
+                # Removed by another process in the meantime.
+                pass
+        files.sort()
+        for _, path in files[:max(len(files) - self.size, 0)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
 TCustomCertId = bytes  # manually provided certs (e.g. mitmproxy's --certs)
-TGeneratedCertId = typing.Tuple[typing.Optional[bytes], typing.Tuple[bytes, ...]]  # (common_name, sans)
+# (common_name, sans) or (common_name, sans, key_type)
+TGeneratedCertId = typing.Union[
+    typing.Tuple[typing.Optional[bytes], typing.Tuple[bytes, ...]],
+    typing.Tuple[typing.Optional[bytes], typing.Tuple[bytes, ...], str],
+]
 TCertId = typing.Union[TCustomCertId, TGeneratedCertId]
+# (common_name, sans, alpn) of an upstream certificate, see UpstreamCertCache.
+TUpstreamCertDetails = typing.Tuple[typing.Optional[bytes], typing.Tuple[bytes, ...], typing.Optional[bytes]]
 
 
 class CertStore:
 
     """
         Implements an in-memory certificate store.
+
+        Generated certificates are cached, up to capacity of them. When the
+        cache is full, the least recently used certificate is evicted.
     """
-    STORE_CAP = 100
+    STORE_CAP = 10000
+    # Threads that generate certificates in the background, see prefetch().
+    PREFETCH_WORKERS = 2
 
     def __init__(
             self,
             default_privatekey,
             default_ca,
             default_chain_file,
-            dhparams):
+            dhparams,
+            key_path=None):
         self.default_privatekey = default_privatekey
+        self.default_key_type = get_key_type(default_privatekey)
+        # Keys of generated certificates that don't use the CA key are
+        # stored at key_path-{key type}.pem.
+        self.key_path = key_path
+        self.leaf_keys = {self.default_key_type: default_privatekey}
         self.default_ca = default_ca
         self.default_chain_file = default_chain_file
         self.dhparams = dhparams
         self.certs = {}  # type: typing.Dict[TCertId, CertStoreEntry]
-        self.expire_queue = []
-
-    def expire(self, entry):
-        self.expire_queue.append(entry)
-        if len(self.expire_queue) > self.STORE_CAP:
-            d = self.expire_queue.pop(0)
-            for k, v in list(self.certs.items()):
-                if v == d:
+        # Generated entries and the names they are stored under, least
+        # recently used first.
+        self.expire_queue = collections.OrderedDict()  # type: typing.MutableMapping[CertStoreEntry, typing.List[TCertId]]
+        self.capacity = self.STORE_CAP
+        self.disk_cache = None  # type: typing.Optional[CertDiskCache]
+        # Certificates that are being generated right now.
+        self.pending = {}  # type: typing.Dict[TCertId, concurrent.futures.Future]
+        self.executor = None  # type: typing.Optional[concurrent.futures.Executor]
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def expire(self, entry, *names):
+        """
+            Add a generated entry to the cache, evicting the least recently
+            used ones if it is full.
+        """
+        self.expire_queue[entry] = list(names)
+        while len(self.expire_queue) > self.capacity:
+            d, keys = self.expire_queue.popitem(last=False)
+            for k in keys:
+                if self.certs.get(k) is d:
                     del self.certs[k]
+            self.evictions += 1
 
     @staticmethod
     def load_dhparam(path):
@@ -176,11 +341,46 @@ class CertStore:
             dh = OpenSSL.SSL._ffi.gc(dh, OpenSSL.SSL._lib.DH_free)
             return dh
 
+    def leaf_key(self, key_type):
+        """
+            Returns the private key for generated certificates of the given
+            type. This is the CA key if it has that type, otherwise a separate
+            key that is created once and kept in the store directory.
+        """
+        with self.lock:
+            key = self.leaf_keys.get(key_type)
+            if not key:
+                key = self.leaf_keys[key_type] = self._load_leaf_key(key_type)
+        return key
+
+    def _load_leaf_key(self, key_type):
+        if not self.key_path:
+            return create_key(key_type)
+        path = "{}-{}.pem".format(self.key_path, key_type)
+        if not os.path.exists(path):
+            key = create_key(key_type)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, "wb") as f:
+                f.write(OpenSSL.crypto.dump_privatekey(OpenSSL.crypto.FILETYPE_PEM, key))
+            try:
+                # Unlike a rename, this fails if another process has created
+                # the key in the meantime, and we use that one instead.
+                os.link(tmp, path)
+            except FileExistsError:
+                pass
+            finally:
+                os.remove(tmp)
+        with open(path, "rb") as f:
+            return OpenSSL.crypto.load_privatekey(OpenSSL.crypto.FILETYPE_PEM, f.read())
+
     @classmethod
-    def from_store(cls, path, basename):
+    def from_store(cls, path, basename, key_type="rsa"):
+        """
+            Loads the CA from path, or creates one with a key of key_type.
+        """
         ca_path = os.path.join(path, basename + "-ca.pem")
         if not os.path.exists(ca_path):
-            key, ca = cls.create_store(path, basename)
+            key, ca = cls.create_store(path, basename, key_type=key_type)
         else:
             with open(ca_path, "rb") as f:
                 raw = f.read()
@@ -192,17 +392,17 @@ class CertStore:
                 raw)
         dh_path = os.path.join(path, basename + "-dhparam.pem")
         dh = cls.load_dhparam(dh_path)
-        return cls(key, ca, ca_path, dh)
+        return cls(key, ca, ca_path, dh, os.path.join(path, basename))
 
     @staticmethod
-    def create_store(path, basename, o=None, cn=None, expiry=DEFAULT_EXP):
+    def create_store(path, basename, o=None, cn=None, expiry=DEFAULT_EXP, key_type="rsa"):
         if not os.path.exists(path):
             os.makedirs(path)
 
         o = o or basename
         cn = cn or basename
 
-        key, ca = create_ca(o=o, cn=cn, exp=expiry)
+        key, ca = create_ca(o=o, cn=cn, exp=expiry, key_type=key_type)
         # Dump the CA plus private key
         with open(os.path.join(path, basename + "-ca.pem"), "wb") as f:
             f.write(
@@ -288,7 +488,12 @@ class CertStore:
             ret.append(b"*." + b".".join(parts[i:]))
         return ret
 
-    def get_cert(self, commonname: typing.Optional[bytes], sans: typing.List[bytes]):
+    def _generated_id(self, commonname, sans, key_type) -> TGeneratedCertId:
+        if key_type and key_type != self.default_key_type:
+            return commonname, tuple(sans), key_type
+        return commonname, tuple(sans)
+
+    def get_cert(self, commonname: typing.Optional[bytes], sans: typing.List[bytes], key_type=None):
         """
             Returns an (cert, privkey, cert_chain) tuple.
 
@@ -296,6 +501,9 @@ class CertStore:
             valid, plain-ASCII, IDNA-encoded domain name.
 
             sans: A list of Subject Alternate Names.
+
+            key_type: The key type of a generated certificate, see KEY_TYPES.
+            Defaults to the type of the CA key.
         """
 
         potential_keys = []  # type: typing.List[TCertId]
@@ -304,28 +512,144 @@ class CertStore:
         for s in sans:
             potential_keys.extend(self.asterisk_forms(s))
         potential_keys.append(b"*")
-        potential_keys.append((commonname, tuple(sans)))
-
-        name = next(
-            filter(lambda key: key in self.certs, potential_keys),
-            None
-        )
-        if name:
-            entry = self.certs[name]
+        key = self._generated_id(commonname, sans, key_type)
+        potential_keys.append(key)
+
+        with self.lock:
+            entry = next(
+                filter(None, map(self.certs.get, potential_keys)),
+                None
+            )
+            if entry:
+                self.hits += 1
+                if entry in self.expire_queue:
+                    self.expire_queue.move_to_end(entry)
+                return entry.cert, entry.privatekey, entry.chain_file
+            self.misses += 1
+            # If another thread is already generating this certificate, wait
+            # for it instead of generating it twice.
+            pending = self.pending.get(key)
+            if not pending:
+                self.pending[key] = future = concurrent.futures.Future()
+
+        if pending:
+            entry = pending.result()
         else:
-            entry = CertStoreEntry(
-                cert=dummy_cert(
-                    self.default_privatekey,
-                    self.default_ca,
-                    commonname,
-                    sans),
-                privatekey=self.default_privatekey,
-                chain_file=self.default_chain_file)
-            self.certs[(commonname, tuple(sans))] = entry
-            self.expire(entry)
+            try:
+                entry = self._generate(commonname, sans, key_type)
+            except BaseException as e:
+                with self.lock:
+                    del self.pending[key]
+                future.set_exception(e)
+                raise
+            with self.lock:
+                self.certs[key] = entry
+                self.expire(entry, key)
+                del self.pending[key]
+            future.set_result(entry)
 
         return entry.cert, entry.privatekey, entry.chain_file
 
+    def _generate(self, commonname, sans, key_type):
+        if key_type and key_type != self.default_key_type:
+            key = self.leaf_key(key_type)
+        else:
+            key = None
+        cert = self.disk_cache and self.disk_cache.get(commonname, sans, key)
+        if not cert:
+            cert = dummy_cert(
+                self.default_privatekey,
+                self.default_ca,
+                commonname,
+                sans,
+                key)
+            if self.disk_cache:
+                self.disk_cache.put(commonname, sans, cert, key)
+        return CertStoreEntry(
+            cert=cert,
+            privatekey=key or self.default_privatekey,
+            chain_file=self.default_chain_file)
+
+    def prefetch(self, commonname: typing.Optional[bytes], sans: typing.List[bytes], key_type=None) -> None:
+        """
+            Generate a certificate in the background, so that it is ready by
+            the time it is needed. Takes the same arguments as get_cert.
+        """
+        with self.lock:
+            key = self._generated_id(commonname, sans, key_type)
+            if key in self.certs or key in self.pending:
+                return
+            if not self.executor:
+                self.executor = concurrent.futures.ThreadPoolExecutor(self.PREFETCH_WORKERS)
+        self.executor.submit(self.get_cert, commonname, sans, key_type)
+
+    def shutdown(self, wait=True) -> None:
+        """
+            Stop the prefetch threads once their queued certificates are
+            generated. A later prefetch() starts new ones.
+        """
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor:
+            executor.shutdown(wait)
+
+
+class UpstreamCertCache:
+    """
+        Remembers the details of upstream certificates that we copy into
+        generated certificates, so that later connections to the same server
+        don't have to wait for the server handshake.
+
+        Entries are (common name, alt names, ALPN protocol selected by the
+        server) tuples, where the protocol is None if we didn't offer any.
+        At most size entries are kept, least recently used first out, and
+        entries are dropped after ttl seconds. A size of 0 disables the
+        cache.
+    """
+
+    def __init__(self, size=0, ttl=3600):
+        self.size = size
+        self.ttl = ttl
+        # Maps keys to (store time, details), least recently used first.
+        self._entries = collections.OrderedDict()  # type: typing.MutableMapping[typing.Any, typing.Tuple[float, TUpstreamCertDetails]]
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return "UpstreamCertCache({} entries, {} hits, {} misses)".format(
+            len(self), self.hits, self.misses
+        )
+
+    def get(self, key) -> typing.Optional[TUpstreamCertDetails]:
+        if not self.size:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] >= time.monotonic() - self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self._entries.pop(key, None)
+            self.misses += 1
+            return None
+
+    def put(self, key, cert: "SSLCert", alpn: typing.Optional[bytes]) -> None:
+        if not self.size:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), (cert.cn, tuple(cert.altnames), alpn))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
 
 class _GeneralName(univ.Choice):
     # We only care about dNSName and iPAddress
@@ -266,9 +266,9 @@ class ServerConnection(tcp.TCPClient, stateobject.StateObject):
             via=None
         ))
 
-    def connect(self):
+    def connect(self, resolver=None, attempt_delay=None):
         self.timestamp_start = time.time()
-        tcp.TCPClient.connect(self)
+        tcp.TCPClient.connect(self, resolver, attempt_delay)
         self.timestamp_tcp_setup = time.time()
 
     def send(self, message):
@@ -1,4 +1,5 @@
-import queue
+import threading
+
 from mitmproxy import exceptions
 
 
@@ -7,9 +8,21 @@ class Channel:
         The only way for the proxy server to communicate with the master
         is to use the channel it has been given.
     """
-    def __init__(self, q, should_exit):
+    def __init__(self, q, should_exit, handles=None, inline=None):
+        """
+        handles: An optional callable that tells whether the master has a
+        handler for an event. Messages that would not be handled are not
+        sent to the master by ask().
+
+        inline: An optional callable that runs the handlers of the
+        thread-safe addons at the start of the chain for a message on the
+        calling thread, and returns whether the master has handlers left to
+        run. See AddonManager.invoke_inline.
+        """
         self.q = q
         self.should_exit = should_exit
+        self.handles = handles
+        self.inline = inline
 
     def ask(self, mtype, m):
         """
@@ -19,13 +32,25 @@ class Channel:
         Raises:
             exceptions.Kill: All connections should be closed immediately.
         """
+        if self.handles and not self.handles(mtype):
+            return m
         m.reply = Reply(m)
-        self.q.put((mtype, m))
+        if not self.inline:
+            self.q.put((mtype, m))
+        else:
+            m.reply.inlined = True
+            if self.inline(mtype, m):
+                self.q.put((mtype, m))
+            elif m.reply.state == "start":
+                # Thread-safe addons were the only ones to handle the event.
+                m.reply.take()
+                if not m.reply.has_message:
+                    m.reply.ack()
+                m.reply.commit()
         while not self.should_exit.is_set():
-            try:
-                # The timeout is here so we can handle a should_exit event.
-                g = m.reply.q.get(timeout=0.5)
-            except queue.Empty:  # pragma: no cover
+            # The timeout is here so we can handle a should_exit event.
+            g = m.reply.wait(timeout=0.5)
+            if g is NO_REPLY:  # pragma: no cover
                 continue
             if g == exceptions.Kill:
                 raise exceptions.Kill()
@@ -52,10 +77,18 @@ class Reply:
     """
     def __init__(self, obj):
         self.obj = obj
-        self.q = queue.Queue()  # type: queue.Queue
+        # A one-shot future: the lock is held until the reply is committed,
+        # which is much cheaper than a queue per reply.
+        self._done = threading.Lock()
+        self._done.acquire()
+        self._result = NO_REPLY
 
         self._state = "start"  # "start" -> "taken" -> "committed"
 
+        # Set by the channel if the handlers of thread-safe addons have already
+        # run on the connection thread, so that the master skips them.
+        self.inlined = False
+
         # Holds the reply value. May change before things are actually commited.
         self.value = NO_REPLY
 
@@ -102,7 +135,18 @@ class Reply:
         if not self.has_message:
             raise exceptions.ControlException("There is no reply message.")
         self._state = "committed"
-        self.q.put(self.value)
+        self._result = self.value
+        self._done.release()
+
+    def wait(self, timeout=None):
+        """
+        Wait until the reply has been committed and return the committed
+        value, or NO_REPLY if that does not happen within timeout seconds.
+        """
+        if not self._done.acquire(timeout=-1 if timeout is None else timeout):
+            return NO_REPLY
+        self._done.release()
+        return self._result
 
     def ack(self, force=False):
         if self.state not in {"start", "taken"}:
@@ -145,6 +189,8 @@ class DummyReply(Reply):
         if self._should_reset:
             self._state = "start"
             self.value = NO_REPLY
+            self._result = NO_REPLY
+            self._done.acquire(blocking=False)
 
     def __del__(self):
         pass
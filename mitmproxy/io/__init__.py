@@ -1,7 +1,7 @@
 
-from .io import FlowWriter, FlowReader, FilteredFlowWriter, read_flows_from_paths
+from .io import FlowWriter, FlowReader, FilteredFlowWriter, read_flows_from_paths, FLOW_TYPES
 
 
 __all__ = [
-    "FlowWriter", "FlowReader", "FilteredFlowWriter", "read_flows_from_paths"
+    "FlowWriter", "FlowReader", "FilteredFlowWriter", "read_flows_from_paths", "FLOW_TYPES"
 ]
@@ -10,6 +10,7 @@ from mitmproxy import websocket
 
 from mitmproxy.io import compat
 from mitmproxy.io import tnetstring
+from mitmproxy.net.http import spool
 
 FLOW_TYPES = dict(
     http=http.HTTPFlow,
@@ -18,13 +19,22 @@ FLOW_TYPES = dict(
 )  # type: Dict[str, Type[flow.Flow]]
 
 
+def _dump_flow(f: flow.Flow, fo) -> None:
+    d = f.get_state()
+    # Write message bodies that are stored on disk without loading them
+    # into memory.
+    for m in ("request", "response"):
+        if d.get(m) and isinstance(d[m]["content"], spool.SpooledContent):
+            d[m]["content"] = d[m]["content"].view()
+    tnetstring.dump(d, fo)
+
+
 class FlowWriter:
     def __init__(self, fo):
         self.fo = fo
 
     def add(self, flow):
-        d = flow.get_state()
-        tnetstring.dump(d, self.fo)
+        _dump_flow(flow, self.fo)
 
 
 class FlowReader:
@@ -63,8 +73,7 @@ class FilteredFlowWriter:
     def add(self, f: flow.Flow):
         if self.flt and not flowfilter.match(self.flt, f):
             return
-        d = f.get_state()
-        tnetstring.dump(d, self.fo)
+        _dump_flow(f, self.fo)
 
 
 def read_flows_from_paths(paths):
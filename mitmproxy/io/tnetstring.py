@@ -43,7 +43,7 @@ all other strings are returned as plain bytes.
 import collections
 import typing
 
-TSerializable = typing.Union[None, str, bool, int, float, bytes, list, tuple, dict]
+TSerializable = typing.Union[None, str, bool, int, float, bytes, memoryview, list, tuple, dict]
 
 
 def dumps(value: TSerializable) -> bytes:
@@ -63,7 +63,11 @@ def dump(value: TSerializable, file_handle: typing.BinaryIO) -> None:
     This function dumps a python object as a tnetstring and
     writes it to the given file.
     """
-    file_handle.write(dumps(value))
+    # Write the fragments one by one, so that large memoryviews are not
+    # copied.
+    q = collections.deque()  # type: collections.deque
+    _rdumpq(q, 0, value)
+    file_handle.writelines(q)
 
 
 def _rdumpq(q: collections.deque, size: int, value: TSerializable) -> int:
@@ -108,7 +112,7 @@ def _rdumpq(q: collections.deque, size: int, value: TSerializable) -> int:
         span = str(ldata).encode()
         write(b'%s:%s^' % (span, data))
         return size + 2 + len(span) + ldata
-    elif isinstance(value, bytes):
+    elif isinstance(value, (bytes, memoryview)):
         data = value
         ldata = len(data)
         span = str(ldata).encode()
@@ -1,6 +1,7 @@
 import threading
 import contextlib
 import queue
+import time
 
 from mitmproxy import addonmanager
 from mitmproxy import options
@@ -29,18 +30,73 @@ class ServerThread(basethread.BaseThread):
         self.server.serve_forever()
 
 
+class EventQueue(queue.Queue):
+    """
+        The master's event queue. Keeps track of how long events wait in the
+        queue before the master gets to them, and of the queue depth.
+
+        Statistics accumulate until reset_stats() is called. The current
+        depth is qsize().
+    """
+    def __init__(self):
+        super().__init__()
+        self.wait = 0.0  # Queue wait time of the last event taken
+        self.reset_stats()
+
+    def __repr__(self):
+        return "EventQueue({} pending, {} max, {} handled, wait {:.1f}ms avg, {:.1f}ms max)".format(
+            self.qsize(),
+            self.max_depth,
+            self.count,
+            self.total_wait / self.count * 1000 if self.count else 0,
+            self.max_wait * 1000,
+        )
+
+    def reset_stats(self):
+        with self.mutex:
+            self.count = 0
+            self.total_wait = 0.0
+            self.max_wait = 0.0
+            self.max_depth = len(self.queue)
+
+    def _put(self, item):
+        self.queue.append((time.monotonic(), item))
+        self.max_depth = max(self.max_depth, len(self.queue))
+
+    def _get(self):
+        t, item = self.queue.popleft()
+        self.wait = time.monotonic() - t
+        self.count += 1
+        self.total_wait += self.wait
+        self.max_wait = max(self.max_wait, self.wait)
+        return item
+
+
 class Master:
     """
         The master handles mitmproxy's main event loop.
     """
+    # Seconds between tick events, independent of the number of events
+    # handled.
+    tick_interval = 0.1
+    # Seconds between event queue statistics in the debug log, see
+    # Master.event_queue for the numbers themselves.
+    stats_interval = 5
+
     def __init__(self, opts):
         self.options = opts or options.Options()  # type: options.Options
         self.commands = command.CommandManager(self)
         self.addons = addonmanager.AddonManager(self)
-        self.event_queue = queue.Queue()
+        self.event_queue = EventQueue()
         self.should_exit = threading.Event()
         self._server = None
         self.first_tick = True
+        # The thread that runs the event loop, set on the first tick.
+        self.thread = None  # type: threading.Thread
+        self.next_tick = 0.0
+        self.next_stats = time.monotonic() + self.stats_interval
+        # Events handled as of the last stats log entry.
+        self.logged_count = 0
 
     @property
     def server(self):
@@ -49,7 +105,12 @@ class Master:
     @server.setter
     def server(self, server):
         server.set_channel(
-            controller.Channel(self.event_queue, self.should_exit)
+            controller.Channel(
+                self.event_queue,
+                self.should_exit,
+                self.addons.handles,
+                self.addons.invoke_inline,
+            )
         )
         self._server = server
 
@@ -76,8 +137,14 @@ class Master:
     def add_log(self, e, level):
         """
             level: debug, info, warn, error
+
+            Entries logged from other threads than the event loop are sent
+            through the event queue.
         """
-        self.addons.trigger("log", log.LogEntry(e, level))
+        if self.thread and threading.current_thread() is not self.thread:
+            self.tell("log", log.LogEntry(e, level))
+        else:
+            self.addons.trigger("log", log.LogEntry(e, level))
 
     def start(self):
         self.should_exit.clear()
@@ -92,24 +159,62 @@ class Master:
         finally:
             self.shutdown()
 
+    def wake(self):
+        """
+            Make the tick event due, so that the next call to tick() runs it
+            regardless of the tick interval.
+        """
+        self.next_tick = 0.0
+
     def tick(self, timeout):
+        """
+            Run the tick event if it is due, then handle a batch of events.
+            Waits up to timeout seconds for the first event, but not past the
+            next tick. The batch ends when the queue is empty, or when the
+            event_batch_size or event_batch_time budget is used up.
+
+            Returns True if any events were handled.
+        """
         if self.first_tick:
             self.first_tick = False
+            self.thread = threading.current_thread()
             self.addons.trigger("running")
-        self.addons.trigger("tick")
-        changed = False
-        try:
-            mtype, obj = self.event_queue.get(timeout=timeout)
+        now = time.monotonic()
+        if now >= self.next_tick:
+            self.next_tick = now + self.tick_interval
+            self.addons.trigger("tick")
+        if now >= self.next_stats:
+            self.next_stats = now + self.stats_interval
+            self.log_stats()
+
+        max_events = max(self.options.event_batch_size, 1)
+        deadline = now + self.options.event_batch_time / 1000
+        timeout = max(min(timeout, self.next_tick - now), 0)
+        handled = 0
+        while handled < max_events:
+            try:
+                if handled:
+                    mtype, obj = self.event_queue.get_nowait()
+                else:
+                    mtype, obj = self.event_queue.get(timeout=timeout)
+            except queue.Empty:
+                break
             if mtype not in eventsequence.Events:
                 raise exceptions.ControlException(
                     "Unknown event %s" % repr(mtype)
                 )
             self.addons.handle_lifecycle(mtype, obj)
             self.event_queue.task_done()
-            changed = True
-        except queue.Empty:
-            pass
-        return changed
+            handled += 1
+            if time.monotonic() >= deadline:
+                break
+        return handled > 0
+
+    def log_stats(self):
+        q = self.event_queue
+        if q.count != self.logged_count:
+            self.logged_count = q.count
+            self.add_log(repr(q), "debug")
 
     def shutdown(self):
         if self.server:
@@ -0,0 +1,212 @@
+import collections
+import concurrent.futures
+import ipaddress
+import socket
+import threading
+import time
+import typing
+
+TAddrInfo = typing.List[tuple]
+# An expiry time and either a getaddrinfo result or the error it raised.
+TEntry = typing.Tuple[float, typing.Union[TAddrInfo, OSError]]
+
+
+def _is_ip_address(host) -> bool:
+    try:
+        ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return True
+
+
+def _copy_error(e: BaseException) -> BaseException:
+    # Errors from the cache are raised on many threads. Raise a copy each
+    # time, so that the tracebacks don't pile up on the cached instance.
+    return type(e)(*e.args)
+
+
+def interleave_families(addrinfo: TAddrInfo, first_family: typing.Optional[int] = None) -> TAddrInfo:
+    """
+        Reorders getaddrinfo results so that address families alternate,
+        starting with first_family if it is present.
+    """
+    by_family = collections.OrderedDict()  # type: typing.MutableMapping[int, typing.List[tuple]]
+    if first_family is not None:
+        by_family[first_family] = []
+    for info in addrinfo:
+        by_family.setdefault(info[0], []).append(info)
+    ret = []  # type: TAddrInfo
+    queues = [collections.deque(q) for q in by_family.values() if q]
+    while queues:
+        for q in queues:
+            ret.append(q.popleft())
+        queues = [q for q in queues if q]
+    return ret
+
+
+class ResolverCache:
+    """
+        Caches the results of socket.getaddrinfo, so that connections to busy
+        hosts don't have to wait for the system resolver every time.
+
+        Successful lookups are kept for ttl seconds and failed ones for
+        negative_ttl seconds. At most size lookups are kept, least recently
+        used first out, and concurrent lookups of the same name share a
+        single query. A size of 0 disables the cache.
+
+        Pinned names are kept regardless of size and ttl. They either resolve
+        to fixed IP addresses or, if no addresses are given, are looked up
+        once.
+
+        The cache also remembers which address family we last connected to
+        a host with, see sort_addresses(). This works even if lookups are not
+        cached, and keeps at most families_size hosts.
+    """
+
+    def __init__(self, size=0, ttl=60, negative_ttl=5, families_size=1000):
+        self.size = size
+        self.families_size = families_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        # Maps lookups to entries, least recently used first.
+        self._entries = collections.OrderedDict()  # type: typing.MutableMapping[tuple, TEntry]
+        self._pinned_entries = {}  # type: typing.Dict[tuple, TEntry]
+        self.pinned = {}  # type: typing.Dict[str, typing.List[str]]
+        # Lookups that are in progress right now.
+        self._pending = {}  # type: typing.Dict[tuple, concurrent.futures.Future]
+        # Maps hosts to the address family that worked last, least recently used first.
+        self._families = collections.OrderedDict()  # type: typing.MutableMapping[str, int]
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries) + len(self._pinned_entries)
+
+    def __repr__(self):
+        return "ResolverCache({} entries, {} pinned names, {} hits, {} misses)".format(
+            len(self), len(self.pinned), self.hits, self.misses
+        )
+
+    def pin(self, host: str, addresses: typing.Sequence[str] = ()) -> None:
+        with self._lock:
+            self.pinned[host] = list(addresses)
+            self._drop(host)
+
+    def unpin(self, host: str) -> None:
+        with self._lock:
+            self.pinned.pop(host, None)
+            self._drop(host)
+
+    def _drop(self, host):
+        for entries in (self._entries, self._pinned_entries):
+            for key in [k for k in entries if k[0] == host]:
+                del entries[key]
+
+    def clear(self) -> None:
+        """
+            Forget all lookups, including those of pinned names, and all
+            remembered address families.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._pinned_entries.clear()
+            self._families.clear()
+
+    def set_family(self, host: str, family: int) -> None:
+        """
+            Remember that we could connect to host using the given address family.
+        """
+        if not self.families_size:
+            return
+        with self._lock:
+            self._families[host] = family
+            self._families.move_to_end(host)
+            while len(self._families) > self.families_size:
+                self._families.popitem(last=False)
+
+    def sort_addresses(self, host: str, addrinfo: TAddrInfo) -> TAddrInfo:
+        """
+            Orders getaddrinfo results for connection attempts as described
+            in RFC 8305: Address families alternate, starting with the family
+            that worked last for this host, or else with the first family in
+            the list.
+        """
+        with self._lock:
+            family = self._families.get(host)
+        return interleave_families(addrinfo, family)
+
+    def _resolve(self, host, port, family, type) -> TAddrInfo:
+        addresses = self.pinned.get(host)
+        if addresses:
+            ret = []  # type: TAddrInfo
+            for address in addresses:
+                ret.extend(socket.getaddrinfo(address, port, family, type, 0, socket.AI_NUMERICHOST))
+            return ret
+        return socket.getaddrinfo(host, port, family, type)
+
+    def getaddrinfo(self, host: str, port: int, family: int = 0, type: int = 0) -> TAddrInfo:
+        """
+            Like socket.getaddrinfo, but served from the cache if possible.
+        """
+        pinned = host in self.pinned
+        if not (self.size or pinned) or _is_ip_address(host):
+            return socket.getaddrinfo(host, port, family, type)
+
+        key = (host, port, family, type)
+        with self._lock:
+            entries = self._pinned_entries if pinned else self._entries
+            entry = entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                if not pinned:
+                    self._entries.move_to_end(key)
+                self.hits += 1
+                result = entry[1]
+                future = None
+            else:
+                self.misses += 1
+                future = self._pending.get(key)
+                if not future:
+                    future = self._pending[key] = concurrent.futures.Future()
+                    owner = True
+                else:
+                    owner = False
+
+        if future and not owner:
+            error = future.exception()
+            if error:
+                raise _copy_error(error)
+            return future.result()
+        if future:
+            try:
+                try:
+                    result = self._resolve(host, port, family, type)
+                except OSError as e:
+                    result = e
+                    expiry = time.monotonic() + self.negative_ttl
+                else:
+                    expiry = float("inf") if pinned else time.monotonic() + self.ttl
+                with self._lock:
+                    if pinned:
+                        self._pinned_entries[key] = (expiry, result)
+                    elif self.size:
+                        self._entries[key] = (expiry, result)
+                        self._entries.move_to_end(key)
+                        while len(self._entries) > self.size:
+                            self._entries.popitem(last=False)
+            except BaseException as e:
+                # Other errors, e.g. a UnicodeError for an invalid name, are not
+                # cached. Lookups waiting for this one get them as well.
+                future.set_exception(e)
+                raise
+            finally:
+                with self._lock:
+                    del self._pending[key]
+            if isinstance(result, OSError):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+        if isinstance(result, OSError):
+            raise _copy_error(result)
+        return result
@@ -104,6 +104,10 @@ class Headers(multidict.MultiDict):
         else:
             return b""
 
+    def __contains__(self, key):
+        key = _always_bytes(key)
+        return super().__contains__(key)
+
     def __delitem__(self, key):
         key = _always_bytes(key)
         super().__delitem__(key)
@@ -1,12 +1,13 @@
 import mitmproxy.net.http.url
 from mitmproxy import exceptions
+from mitmproxy.net.http import spool
 
 
 def assemble_request(request):
     if request.data.content is None:
         raise exceptions.HttpException("Cannot assemble flow with missing content")
     head = assemble_request_head(request)
-    body = b"".join(assemble_body(request.data.headers, [request.data.content]))
+    body = b"".join(assemble_body(request.data.headers, spool.iter_chunks(request.data.content)))
     return head + body
 
 
@@ -20,7 +21,7 @@ def assemble_response(response):
     if response.data.content is None:
         raise exceptions.HttpException("Cannot assemble flow with missing content")
     head = assemble_response_head(response)
-    body = b"".join(assemble_body(response.data.headers, [response.data.content]))
+    body = b"".join(assemble_body(response.data.headers, spool.iter_chunks(response.data.content)))
     return head + body
 
 
@@ -1,3 +1,4 @@
+import io
 import time
 import sys
 import re
@@ -10,6 +11,16 @@ from mitmproxy.net import check
 from mitmproxy import exceptions
 
 
+# Body chunks start at MIN_CHUNK_SIZE bytes and grow up to MAX_CHUNK_SIZE bytes.
+MIN_CHUNK_SIZE = 4096
+MAX_CHUNK_SIZE = 1024 * 1024
+# Message heads that have fully arrived within the first HEAD_PEEK_SIZE
+# bytes are read in one go, see _read_head.
+HEAD_PEEK_SIZE = 64 * 1024
+# A line break followed by an empty line.
+_HEAD_END = re.compile(br"\n\r?\n")
+
+
 def get_header_tokens(headers, key):
     """
         Retrieve all tokens for a header key. A number of different headers
@@ -49,8 +60,11 @@ def read_request_head(rfile):
     if hasattr(rfile, "reset_timestamps"):
         rfile.reset_timestamps()
 
-    form, method, scheme, host, port, path, http_version = _read_request_line(rfile)
-    headers = _read_headers(rfile)
+    head = _read_head(rfile, True)
+    form, method, scheme, host, port, path, http_version = _read_request_line(head)
+    if head is rfile:
+        head = _read_head(rfile, False)
+    headers = _read_headers(head)
 
     if hasattr(rfile, "first_byte_timestamp"):
         # more accurate timestamp_start
@@ -89,8 +103,11 @@ def read_response_head(rfile):
     if hasattr(rfile, "reset_timestamps"):
         rfile.reset_timestamps()
 
-    http_version, status_code, message = _read_response_line(rfile)
-    headers = _read_headers(rfile)
+    head = _read_head(rfile, True)
+    http_version, status_code, message = _read_response_line(head)
+    if head is rfile:
+        head = _read_head(rfile, False)
+    headers = _read_headers(head)
 
     if hasattr(rfile, "first_byte_timestamp"):
         # more accurate timestamp_start
@@ -99,7 +116,7 @@ def read_response_head(rfile):
     return response.Response(http_version, status_code, message, headers, None, timestamp_start)
 
 
-def read_body(rfile, expected_size, limit=None, max_chunk_size=4096):
+def read_body(rfile, expected_size, limit=None, max_chunk_size=MAX_CHUNK_SIZE):
     """
         Read an HTTP message body
 
@@ -111,12 +128,12 @@ def read_body(rfile, expected_size, limit=None, max_chunk_size=4096):
 
         Returns:
             A generator that yields byte chunks of the content.
+            Chunks are yielded as soon as data arrives. Their size starts
+            small and grows up to max_chunk_size while data keeps arriving
+            faster than it is consumed.
 
         Raises:
             exceptions.HttpException, if an error occurs
-
-        Caveats:
-            max_chunk_size is not considered if the transfer encoding is chunked.
     """
     if not limit or limit < 0:
         limit = sys.maxsize
@@ -124,7 +141,7 @@ def read_body(rfile, expected_size, limit=None, max_chunk_size=4096):
         max_chunk_size = limit
 
     if expected_size is None:
-        for x in _read_chunked(rfile, limit):
+        for x in _read_chunked(rfile, limit, max_chunk_size):
             yield x
     elif expected_size >= 0:
         if limit is not None and expected_size > limit:
@@ -133,25 +150,41 @@ def read_body(rfile, expected_size, limit=None, max_chunk_size=4096):
                 "Limit is {}, content length was advertised as {}".format(limit, expected_size)
             )
         bytes_left = expected_size
-        while bytes_left:
-            chunk_size = min(bytes_left, max_chunk_size)
-            content = rfile.read(chunk_size)
-            if len(content) < chunk_size:
-                raise exceptions.HttpException("Unexpected EOF")
-            yield content
-            bytes_left -= chunk_size
+        for chunk in _read_chunks(rfile, expected_size, max_chunk_size):
+            yield chunk
+            bytes_left -= len(chunk)
+        if bytes_left:
+            raise exceptions.HttpException("Unexpected EOF")
     else:
         bytes_left = limit
-        while bytes_left:
-            chunk_size = min(bytes_left, max_chunk_size)
-            content = rfile.read(chunk_size)
-            if not content:
-                return
-            yield content
-            bytes_left -= chunk_size
-        not_done = rfile.read(1)
-        if not_done:
-            raise exceptions.HttpException("HTTP body too large. Limit is {}.".format(limit))
+        for chunk in _read_chunks(rfile, limit, max_chunk_size):
+            yield chunk
+            bytes_left -= len(chunk)
+        if not bytes_left:
+            not_done = rfile.read(1)
+            if not_done:
+                raise exceptions.HttpException("HTTP body too large. Limit is {}.".format(limit))
+
+
+def _read_chunks(rfile, length, max_chunk_size):
+    """
+        Read up to length bytes from rfile, yielding chunks as soon as they arrive.
+
+        Data is read with readinto1() into a buffer that is reused for every
+        read. The buffer starts at MIN_CHUNK_SIZE and doubles up to
+        max_chunk_size whenever a read fills it completely.
+    """
+    buf = bytearray(min(length, max_chunk_size, MIN_CHUNK_SIZE))
+    while length:
+        with memoryview(buf) as view:
+            n = rfile.readinto1(view[:length])
+            chunk = bytes(view[:n])
+        if not n:
+            return
+        yield chunk
+        length -= n
+        if n == len(buf) and n < max_chunk_size:
+            buf = bytearray(min(2 * n, max_chunk_size))
 
 
 def connection_close(http_version, headers):
@@ -225,6 +258,59 @@ def expected_http_body_size(request, response=None):
     return -1
 
 
+def _find_head_end(data, first_line):
+    """
+        Returns the length of the message head at the start of data, or None
+        if data does not contain all of it. If first_line is False, data is
+        expected to start with the headers instead of the first line.
+
+        The head ends where _get_first_line and _read_headers would stop
+        reading, so that both see exactly the same lines.
+    """
+    start = 0
+    if first_line:
+        # Possible leftover from previous message, see _get_first_line
+        if data.startswith(b"\r\n"):
+            start = 2
+        elif data.startswith(b"\n"):
+            start = 1
+    elif data.startswith(b"\r\n"):
+        return 2
+    elif data.startswith(b"\n"):
+        return 1
+    m = _HEAD_END.search(data, start)
+    if m:
+        return m.end()
+    return None
+
+
+def _read_head(rfile, first_line):
+    """
+        Reading a head line by line costs at least one read call per line.
+        If the complete head has already arrived, we instead read it from
+        rfile in one go and return it as a file-like object, so that it can be
+        parsed by the same code without further reads.
+        Otherwise, rfile is returned unchanged.
+
+        Args:
+            first_line: Whether the head starts with the request or status line.
+    """
+    peek = getattr(rfile, "peek", None)
+    if peek is None:
+        return rfile
+    try:
+        data = peek(HEAD_PEEK_SIZE)
+    except exceptions.TcpTimeout:
+        raise
+    except (NotImplementedError, exceptions.TcpException, exceptions.TlsException):
+        # Other errors are raised again, and handled, once we read from rfile.
+        return rfile
+    end = _find_head_end(data, first_line)
+    if end is None:
+        return rfile
+    return io.BytesIO(rfile.read(end))
+
+
 def _get_first_line(rfile):
     try:
         line = rfile.readline()
@@ -349,13 +435,14 @@ def _read_headers(rfile):
     return headers.Headers(ret)
 
 
-def _read_chunked(rfile, limit=sys.maxsize):
+def _read_chunked(rfile, limit=sys.maxsize, max_chunk_size=MAX_CHUNK_SIZE):
     """
     Read a HTTP body with chunked transfer encoding.
 
     Args:
         rfile: the input file
         limit: A positive integer
+        max_chunk_size: Maximium chunk size that gets yielded
     """
     total = 0
     while True:
@@ -373,10 +460,10 @@ def _read_chunked(rfile, limit=sys.maxsize):
                     "HTTP Body too large. Limit is {}, "
                     "chunked content longer than {}".format(limit, total)
                 )
-            chunk = rfile.read(length)
+            for chunk in _read_chunks(rfile, length, max_chunk_size):
+                yield chunk
             suffix = rfile.readline(5)
             if suffix != b"\r\n":
                 raise exceptions.HttpSyntaxException("Malformed chunked body")
             if length == 0:
                 return
-            yield chunk
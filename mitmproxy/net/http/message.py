@@ -1,14 +1,16 @@
+import io
 import re
-from typing import Optional, Union  # noqa
+from typing import BinaryIO, Optional, Union  # noqa
 
 from mitmproxy.utils import strutils
 from mitmproxy.net.http import encoding
+from mitmproxy.net.http import spool
 from mitmproxy.types import serializable
 from mitmproxy.net.http import headers
 
 
 class MessageData(serializable.Serializable):
-    content = None  # type: bytes
+    content = None  # type: spool.TContent
 
     def __eq__(self, other):
         if isinstance(other, MessageData):
@@ -70,14 +72,47 @@ class Message(serializable.Serializable):
         """
         The raw (encoded) HTTP message body
 
-        See also: :py:attr:`content`, :py:class:`text`
+        See also: :py:attr:`content`, :py:class:`text`, :py:attr:`raw_content_view`
         """
+        if isinstance(self.data.content, spool.SpooledContent):
+            return self.data.content.read()
         return self.data.content
 
     @raw_content.setter
     def raw_content(self, content):
         self.data.content = content
 
+    @property
+    def raw_content_view(self) -> Optional[memoryview]:
+        """
+        The raw (encoded) HTTP message body as a memoryview.
+        Unlike :py:attr:`raw_content`, this does not load bodies that are stored on disk into memory.
+        """
+        if self.data.content is None:
+            return None
+        if isinstance(self.data.content, spool.SpooledContent):
+            return self.data.content.view()
+        return memoryview(self.data.content)
+
+    def open_raw_content(self) -> Optional[BinaryIO]:
+        """
+        Returns a read-only file-like object for the raw (encoded) HTTP message body.
+        Unlike :py:attr:`raw_content`, this does not load bodies that are stored on disk into memory.
+        """
+        if self.data.content is None:
+            return None
+        if isinstance(self.data.content, spool.SpooledContent):
+            return self.data.content.open()
+        return io.BytesIO(self.data.content)
+
+    @property
+    def is_spooled(self) -> bool:
+        """
+        True, if the message body is stored in a temporary file rather than in memory.
+        See the body_spill_size option.
+        """
+        return isinstance(self.data.content, spool.SpooledContent)
+
     def get_content(self, strict: bool=True) -> bytes:
         """
         The HTTP message body decoded with the content-encoding header (e.g. gzip)
@@ -52,10 +52,10 @@ class Response(message.Message):
         self.data = ResponseData(*args, **kwargs)
 
     def __repr__(self):
-        if self.raw_content:
+        if self.raw_content_view:
             details = "{}, {}".format(
                 self.headers.get("content-type", "unknown content type"),
-                human.pretty_size(len(self.raw_content))
+                human.pretty_size(len(self.raw_content_view))
             )
         else:
             details = "no content"
@@ -0,0 +1,151 @@
+import io
+import mmap
+import tempfile
+import typing
+
+
+class _ViewReader(io.RawIOBase):
+    """
+        A read-only file-like object for a memoryview, with its own position.
+    """
+
+    def __init__(self, view: memoryview) -> None:
+        super().__init__()
+        self._view = view
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        data = self._view[self._pos:self._pos + len(b)]
+        n = len(data)
+        b[:n] = data
+        self._pos += n
+        return n
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        self._pos = max(offset, 0)
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+
+class SpooledContent:
+    """
+        A message body that is stored in a temporary file instead of memory.
+
+        read() loads the body into memory, view() and open() give access to
+        it without copying. The file is mapped into memory once, on first
+        access. close() releases the map and removes the file, which also
+        happens once the object is garbage collected.
+    """
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, file: typing.BinaryIO, size: int) -> None:
+        self.file = file
+        self.size = size
+        self._mmap = None  # type: typing.Optional[mmap.mmap]
+
+    def __len__(self):
+        return self.size
+
+    def __eq__(self, other):
+        if isinstance(other, SpooledContent):
+            other = other.view()
+        if isinstance(other, (bytes, bytearray, memoryview)):
+            return self.view() == other
+        return False
+
+    def __repr__(self):
+        return "SpooledContent({} bytes)".format(self.size)
+
+    def __reduce__(self):
+        # Temporary files can't be pickled, e.g. to send flows to another
+        # process. Those get the body as bytes.
+        return bytes, (self.read(),)
+
+    def __del__(self):
+        self.close()
+
+    def close(self) -> None:
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # There are views of the map left. It is closed once they
+                # are gone.
+                pass
+            self._mmap = None
+        if self.file:
+            self.file.close()
+
+    def view(self) -> memoryview:
+        if not self.size:
+            # Empty files can't be mapped.
+            return memoryview(b"")
+        if self._mmap is None:
+            self._mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        return memoryview(self._mmap)
+
+    def open(self) -> typing.BinaryIO:
+        """
+            Returns a read-only file-like object for the body.
+        """
+        return io.BufferedReader(_ViewReader(self.view()))  # type: ignore
+
+    def read(self) -> bytes:
+        return bytes(self.view())
+
+    def chunks(self, chunk_size: int = CHUNK_SIZE) -> typing.Iterator[bytes]:
+        view = self.view()
+        for i in range(0, self.size, chunk_size):
+            yield bytes(view[i:i + chunk_size])
+
+
+TContent = typing.Union[bytes, SpooledContent]
+
+
+def spool(chunks: typing.Iterable[bytes], threshold: typing.Optional[int]) -> TContent:
+    """
+        Joins body chunks like b"".join(chunks), but moves the body to a
+        temporary file once it grows beyond threshold bytes. If threshold is
+        None, the body is always kept in memory.
+    """
+    if threshold is None:
+        return b"".join(chunks)
+    buf = []  # type: typing.List[bytes]
+    size = 0
+    file = None
+    for chunk in chunks:
+        size += len(chunk)
+        if file:
+            file.write(chunk)
+        else:
+            buf.append(chunk)
+            if size > threshold:
+                file = tempfile.TemporaryFile()
+                file.writelines(buf)
+                buf = []
+    if file is None:
+        return b"".join(buf)
+    file.flush()
+    return SpooledContent(file, size)
+
+
+def iter_chunks(content: TContent) -> typing.Iterable[bytes]:
+    """
+        Returns the body in chunks that can be sent without loading spooled
+        bodies into memory.
+    """
+    if isinstance(content, SpooledContent):
+        return content.chunks()
+    return [content]
@@ -1,12 +1,17 @@
+import asyncio
+import collections
+import errno
+import itertools
 import os
 import select
+import selectors
 import socket
 import sys
 import threading
 import time
 import traceback
 
-from typing import Optional  # noqa
+from typing import List, Optional  # noqa
 
 from mitmproxy.net import tls
 
@@ -23,6 +28,11 @@ socket_fileobject = socket.SocketIO
 IPPROTO_IPV6 = getattr(socket, "IPPROTO_IPV6", 41)
 
 EINTR = 4
+# Return values of a non-blocking connect() that is still in progress.
+# 10035 is WSAEWOULDBLOCK, which Windows returns instead of EINPROGRESS.
+CONNECT_IN_PROGRESS = {errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EAGAIN, 10035}
+# Maximum number of buffers we pass to a single sendmsg() call (IOV_MAX on Linux).
+SENDMSG_MAX_BUFFERS = 1024
 
 
 class _FileLike:
@@ -72,12 +82,69 @@ class _FileLike:
         self.first_byte_timestamp = None
 
 
+def _sendmsg_all(sock, buffers):
+    """
+        Like sock.sendall(b"".join(buffers)), but without copying the buffers
+        into a single one first.
+    """
+    views = collections.deque(memoryview(b) for b in buffers)
+    while views:
+        sent = sock.sendmsg(list(itertools.islice(views, SENDMSG_MAX_BUFFERS)))
+        while sent:
+            if sent >= len(views[0]):
+                sent -= len(views.popleft())
+            else:
+                views[0] = views[0][sent:]
+                sent = 0
+
+
 class Writer(_FileLike):
+    # Queued data is sent once it grows beyond this many bytes.
+    QUEUE_LIMIT = 64 * 1024
+
+    def __init__(self, o):
+        super().__init__(o)
+        self._queue = []  # type: List[bytes]
+        self._queued_bytes = 0
+
+    def _send_queue(self):
+        parts = self._queue
+        self._queue = []
+        self._queued_bytes = 0
+        self.first_byte_timestamp = self.first_byte_timestamp or time.time()
+        try:
+            if isinstance(self.o, socket_fileobject) and hasattr(self.o._sock, "sendmsg"):
+                _sendmsg_all(self.o._sock, parts)
+            elif hasattr(self.o, "sendall"):
+                # With TLS, this also means that small writes end up in a single record.
+                self.o.sendall(b"".join(parts))
+            else:
+                self.o.write(b"".join(parts))
+        except (SSL.Error, socket.error) as e:
+            raise exceptions.TcpDisconnect(str(e))
+        for part in parts:
+            self.add_log(part)
+
+    def queue(self, v):
+        """
+            Queues v to be sent together with the next write() or flush(),
+            so that a message that is written in parts leaves in as few
+            syscalls, packets and TLS records as possible.
+
+            May raise exceptions.TcpDisconnect
+        """
+        if v:
+            self._queue.append(v)
+            self._queued_bytes += len(v)
+            if self._queued_bytes > self.QUEUE_LIMIT:
+                self._send_queue()
 
     def flush(self):
         """
             May raise exceptions.TcpDisconnect
         """
+        if self._queue:
+            self._send_queue()
         if hasattr(self.o, "flush"):
             try:
                 self.o.flush()
@@ -88,6 +155,11 @@ class Writer(_FileLike):
         """
             May raise exceptions.TcpDisconnect
         """
+        if self._queue:
+            self.queue(v)
+            if self._queue:
+                self._send_queue()
+            return
         if v:
             self.first_byte_timestamp = self.first_byte_timestamp or time.time()
             try:
@@ -104,22 +176,20 @@ class Writer(_FileLike):
 
 class Reader(_FileLike):
 
-    def read(self, length):
+    def _readinto1(self, view, start):
         """
-            If length is -1, we read until connection closes.
+            Reads whatever is available into view, using a single successful
+            read on the underlying file object. Returns 0 if the connection is closed.
         """
-        result = b''
-        start = time.time()
-        while length == -1 or length > 0:
-            if length == -1 or length > self.BLOCKSIZE:
-                rlen = self.BLOCKSIZE
-            else:
-                rlen = length
+        while True:
             try:
-                data = self.o.read(rlen)
+                if isinstance(self.o, SSL.Connection):
+                    n = self.o.recv_into(view)
+                else:
+                    n = self.o.readinto(view)
             except SSL.ZeroReturnError:
                 # TLS connection was shut down cleanly
-                break
+                return 0
             except (SSL.WantWriteError, SSL.WantReadError):
                 # From the OpenSSL docs:
                 # If the underlying BIO is non-blocking, SSL_read() will also return when the
@@ -137,20 +207,72 @@ class Reader(_FileLike):
                 raise exceptions.TcpDisconnect(str(e))
             except SSL.SysCallError as e:
                 if e.args == (-1, 'Unexpected EOF'):
-                    break
+                    return 0
                 raise exceptions.TlsException(str(e))
             except SSL.Error as e:
                 raise exceptions.TlsException(str(e))
             self.first_byte_timestamp = self.first_byte_timestamp or time.time()
-            if not data:
+            return n or 0
+
+    def readinto1(self, buf):
+        """
+            Reads up to len(buf) bytes into the writable bytes-like object buf,
+            returning as soon as some data is available.
+
+            Returns:
+                The number of bytes read, 0 if the connection is closed.
+        """
+        with memoryview(buf) as view:
+            n = self._readinto1(view, time.time())
+            if self.is_logging():
+                self.add_log(bytes(view[:n]))
+        return n
+
+    def readinto(self, buf):
+        """
+            Reads into the writable bytes-like object buf until it is full or
+            the connection is closed.
+
+            Returns:
+                The number of bytes read.
+        """
+        start = time.time()
+        n = 0
+        with memoryview(buf) as view:
+            while n < len(view):
+                got = self._readinto1(view[n:], start)
+                if not got:
+                    break
+                n += got
+            if self.is_logging():
+                self.add_log(bytes(view[:n]))
+        return n
+
+    def read(self, length):
+        """
+            If length is -1, we read until connection closes.
+        """
+        start = time.time()
+        buf = bytearray(self.BLOCKSIZE if length == -1 else min(length, self.BLOCKSIZE))
+        n = 0
+        while length == -1 or n < length:
+            if n == len(buf):
+                # Double the buffer, so that large reads only take a few copies.
+                buf.extend(bytes(len(buf) if length == -1 else min(len(buf), length - n)))
+            with memoryview(buf) as view:
+                got = self._readinto1(view[n:], start)
+            if not got:
                 break
-            result += data
-            if length != -1:
-                length -= len(data)
+            n += got
+        del buf[n:]
+        result = bytes(buf)
         self.add_log(result)
         return result
 
     def readline(self, size=None):
+        result = self._peek_line(size)
+        if result is not None:
+            return result
         result = b''
         bytes_read = 0
         while True:
@@ -166,6 +288,26 @@ class Reader(_FileLike):
                     break
         return result
 
+    def _peek_line(self, size):
+        """
+            Reads a line in one go if it has already arrived in full, instead
+            of byte by byte. Returns None if that's not possible.
+        """
+        limit = self.BLOCKSIZE if size is None else min(size, self.BLOCKSIZE)
+        try:
+            data = self.peek(limit)
+        except exceptions.TcpTimeout:
+            raise
+        except (NotImplementedError, exceptions.TcpException, exceptions.TlsException):
+            # Other errors are raised again, and handled, once we read byte by byte.
+            return None
+        end = data.find(b"\n") + 1
+        if end:
+            return self.read(end)
+        if len(data) == size:
+            return self.read(size)
+        return None
+
     def safe_read(self, length):
         """
             Like .read, but is guaranteed to either return length bytes, or
@@ -189,13 +331,16 @@ class Reader(_FileLike):
             Up to the next N bytes if peeking is successful.
 
         Raises:
-            exceptions.TcpException if there was an error with the socket
+            exceptions.TcpException if there was an error with the socket,
+            exceptions.TcpTimeout if the socket timed out.
             TlsException if there was an error with pyOpenSSL.
             NotImplementedError if the underlying file object is not a [pyOpenSSL] socket
         """
         if isinstance(self.o, socket_fileobject):
             try:
                 return self.o._sock.recv(length, socket.MSG_PEEK)
+            except socket.timeout:
+                raise exceptions.TcpTimeout()
             except socket.error as e:
                 raise exceptions.TcpException(repr(e))
         elif isinstance(self.o, SSL.Connection):
@@ -365,6 +510,9 @@ class TCPClient(_Connection):
         self.server_certs = []
         self.sni = None
         self.spoof_source_address = spoof_source_address
+        self.tls_session_resumed = False
+        self._session_cache = None
+        self._session_key = None
 
     @property
     def ssl_verification_error(self) -> Optional[exceptions.InvalidCertificateException]:
@@ -381,25 +529,66 @@ class TCPClient(_Connection):
         else:
             close_socket(self.connection)
 
-    def convert_to_ssl(self, sni=None, alpn_protos=None, **sslctx_kwargs):
-        context = tls.create_client_context(
+    def finish(self):
+        # With TLS 1.3, session tickets arrive after the handshake, so we
+        # only get a resumable session once we have read from the connection.
+        self._save_session()
+        super().finish()
+
+    def _save_session(self):
+        if self._session_cache is not None and self.ssl_established:
+            session = self.connection.get_session()
+            if session:
+                self._session_cache.put(self._session_key, session)
+
+    def convert_to_ssl(self, sni=None, alpn_protos=None, session_cache=None, **sslctx_kwargs):
+        """
+        Convert connection to SSL.
+        For a list of parameters, see tls.create_client_context(...)
+
+        Args:
+            session_cache: A tls.SessionCache to resume sessions from.
+        """
+        self.connection = tls.context_cache.connection(
+            tls.create_client_context,
+            self.connection,
             alpn_protos=alpn_protos,
             sni=sni,
             **sslctx_kwargs
         )
-        self.connection = SSL.Connection(context, self.connection)
         if sni:
             self.sni = sni
             self.connection.set_tlsext_host_name(sni.encode("idna"))
+        if session_cache is not None:
+            # Only resume sessions that were established with the same
+            # identity and verification settings.
+            self._session_cache = session_cache
+            self._session_key = (
+                self.address,
+                sni,
+                sslctx_kwargs.get("cert"),
+                sslctx_kwargs.get("verify"),
+                sslctx_kwargs.get("ca_path"),
+                sslctx_kwargs.get("ca_pemfile"),
+            )
+            session = session_cache.get(self._session_key)
+            if session:
+                self.connection.set_session(session)
         self.connection.set_connect_state()
         try:
             self.connection.do_handshake()
         except SSL.Error as v:
+            if session_cache is not None:
+                session_cache.discard(self._session_key)
             if self.ssl_verification_error:
                 raise self.ssl_verification_error
             else:
                 raise exceptions.TlsException("SSL handshake error: %s" % repr(v))
 
+        self.tls_session_resumed = bool(SSL._lib.SSL_session_reused(self.connection._ssl))
+        if session_cache is not None and self.tls_session_resumed:
+            session_cache.record_resumption()
+
         self.cert = certs.SSLCert(self.connection.get_peer_certificate())
 
         # Keep all server certificates in a list
@@ -409,36 +598,66 @@ class TCPClient(_Connection):
         self.ssl_established = True
         self.rfile.set_descriptor(self.connection)
         self.wfile.set_descriptor(self.connection)
+        self._save_session()
 
     def makesocket(self, family, type, proto):
         # some parties (cuckoo sandbox) need to hook this
         return socket.socket(family, type, proto)
 
-    def create_connection(self, timeout=None):
+    def _prepare_socket(self, af, socktype, proto, timeout):
+        sock = self.makesocket(af, socktype, proto)
+        try:
+            if timeout:
+                sock.settimeout(timeout)
+            if self.source_address:
+                sock.bind(self.source_address)
+            if self.spoof_source_address:
+                try:
+                    if not sock.getsockopt(socket.SOL_IP, socket.IP_TRANSPARENT):
+                        sock.setsockopt(socket.SOL_IP, socket.IP_TRANSPARENT, 1)  # pragma: windows no cover  pragma: osx no cover
+                except Exception as e:
+                    # socket.IP_TRANSPARENT might not be available on every OS and Python version
+                    raise exceptions.TcpException(
+                        "Failed to spoof the source address: " + str(e)
+                    )
+        except:
+            sock.close()
+            raise
+        return sock
+
+    def create_connection(self, timeout=None, resolver=None, attempt_delay=None):
+        """
+        Args:
+            resolver: A dns.ResolverCache to look up the server address with.
+            attempt_delay: If set, race connection attempts to the server's
+                addresses as described in RFC 8305 (Happy Eyeballs). A new
+                attempt is started every attempt_delay seconds until one of
+                them succeeds.
+        """
+        if resolver is not None:
+            addrinfo = resolver.getaddrinfo(self.address[0], self.address[1], 0, socket.SOCK_STREAM)
+            addrinfo = resolver.sort_addresses(self.address[0], addrinfo)
+        else:
+            addrinfo = socket.getaddrinfo(self.address[0], self.address[1], 0, socket.SOCK_STREAM)
+
+        if attempt_delay and len(addrinfo) > 1:
+            sock = self._race_connections(addrinfo, timeout, attempt_delay)
+        else:
+            sock = self._connect_sequentially(addrinfo, timeout)
+        if resolver is not None:
+            resolver.set_family(self.address[0], sock.family)
+        return sock
+
+    def _connect_sequentially(self, addrinfo, timeout):
         # Based on the official socket.create_connection implementation of Python 3.6.
         # https://github.com/python/cpython/blob/3cc5817cfaf5663645f4ee447eaed603d2ad290a/Lib/socket.py
 
         err = None
-        for res in socket.getaddrinfo(self.address[0], self.address[1], 0, socket.SOCK_STREAM):
+        for res in addrinfo:
             af, socktype, proto, canonname, sa = res
             sock = None
             try:
-                sock = self.makesocket(af, socktype, proto)
-                if timeout:
-                    sock.settimeout(timeout)
-                if self.source_address:
-                    sock.bind(self.source_address)
-                if self.spoof_source_address:
-                    try:
-                        if not sock.getsockopt(socket.SOL_IP, socket.IP_TRANSPARENT):
-                            sock.setsockopt(socket.SOL_IP, socket.IP_TRANSPARENT, 1)  # pragma: windows no cover  pragma: osx no cover
-                    except Exception as e:
-                        # socket.IP_TRANSPARENT might not be available on every OS and Python version
-                        if sock is not None:
-                            sock.close()
-                        raise exceptions.TcpException(
-                            "Failed to spoof the source address: " + str(e)
-                        )
+                sock = self._prepare_socket(af, socktype, proto, timeout)
                 sock.connect(sa)
                 return sock
 
@@ -452,9 +671,68 @@ class TCPClient(_Connection):
         else:
             raise socket.error("getaddrinfo returns an empty list")  # pragma: no cover
 
-    def connect(self):
+    def _race_connections(self, addrinfo, timeout, attempt_delay):
+        addrinfo = collections.deque(addrinfo)
+        deadline = time.monotonic() + timeout if timeout else None
+        next_attempt = time.monotonic()
+        err = None
+        sel = selectors.DefaultSelector()
+        try:
+            while addrinfo or sel.get_map():
+                now = time.monotonic()
+                if addrinfo and (now >= next_attempt or not sel.get_map()):
+                    af, socktype, proto, canonname, sa = addrinfo.popleft()
+                    sock = None
+                    try:
+                        sock = self._prepare_socket(af, socktype, proto, timeout)
+                        sock.setblocking(False)
+                        ret = sock.connect_ex(sa)
+                        if ret == 0:
+                            sock.settimeout(timeout or socket.getdefaulttimeout())
+                            return sock
+                        if ret not in CONNECT_IN_PROGRESS:
+                            raise OSError(ret, os.strerror(ret))
+                    except socket.error as e:
+                        err = e
+                        if sock is not None:
+                            sock.close()
+                        # Start the next attempt right away.
+                        continue
+                    sel.register(sock, selectors.EVENT_WRITE)
+                    next_attempt = now + attempt_delay
+
+                wait = next_attempt - now if addrinfo else None
+                if deadline is not None:
+                    if now >= deadline:
+                        raise socket.timeout("timed out")
+                    wait = deadline - now if wait is None else min(wait, deadline - now)
+                for key, _ in sel.select(wait):
+                    sock = key.fileobj
+                    sel.unregister(sock)
+                    ret = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                    if ret == 0:
+                        sock.settimeout(timeout or socket.getdefaulttimeout())
+                        return sock
+                    err = OSError(ret, os.strerror(ret))
+                    sock.close()
+        finally:
+            for key in list(sel.get_map().values()):
+                key.fileobj.close()
+            sel.close()
+
+        if err is not None:
+            raise err
+        else:
+            raise socket.error("getaddrinfo returns an empty list")  # pragma: no cover
+
+    def connect(self, resolver=None, attempt_delay=None):
+        """
+        Args:
+            resolver: A dns.ResolverCache to look up the server address with.
+            attempt_delay: See create_connection.
+        """
         try:
-            connection = self.create_connection()
+            connection = self.create_connection(resolver=resolver, attempt_delay=attempt_delay)
         except (socket.error, IOError) as err:
             raise exceptions.TcpException(
                 'Error connecting to "%s": %s' %
@@ -497,11 +775,13 @@ class BaseHandler(_Connection):
         For a list of parameters, see tls.create_server_context(...)
         """
 
-        context = tls.create_server_context(
+        self.connection = tls.context_cache.connection(
+            tls.create_server_context,
+            self.connection,
             cert=cert,
             key=key,
-            **sslctx_kwargs)
-        self.connection = SSL.Connection(context, self.connection)
+            **sslctx_kwargs
+        )
         self.connection.set_accept_state()
         try:
             self.connection.do_handshake()
@@ -546,8 +826,138 @@ class Counter:
             self._count -= 1
 
 
+class WorkerPool:
+    """
+        A pool of daemon threads that runs submitted tasks.
+
+        Worker threads are started lazily whenever no idle worker is available
+        and are kept around afterwards, so that threads are reused across
+        tasks. If max_workers is None, the pool grows without bound.
+
+        If max_queue is set, submit() blocks while that many tasks are
+        waiting for a worker, and try_submit() refuses new tasks.
+    """
+
+    def __init__(self, name, max_workers=None, max_queue=None):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.workers = 0
+        self.idle = 0
+        self._tasks = collections.deque()  # type: collections.deque
+        lock = threading.Lock()
+        self._cond = threading.Condition(lock)
+        self._not_full = threading.Condition(lock)
+
+    @property
+    def busy(self):
+        with self._cond:
+            return self.workers - self.idle
+
+    def _full(self):
+        return (
+            self.max_queue and
+            self.max_workers is not None and
+            self.workers >= self.max_workers and
+            len(self._tasks) - self.idle >= self.max_queue
+        )
+
+    def submit(self, func, *args):
+        with self._cond:
+            while self._full():
+                self._not_full.wait()
+            self._add(func, args)
+
+    def try_submit(self, func, *args) -> bool:
+        """
+            Like submit(), but returns False instead of blocking when the
+            queue is full.
+        """
+        with self._cond:
+            if self._full():
+                return False
+            self._add(func, args)
+            return True
+
+    def _add(self, func, args):
+        self._tasks.append((func, args))
+        if len(self._tasks) > self.idle:
+            if self.max_workers is None or self.workers < self.max_workers:
+                self._start_worker()
+        self._cond.notify()
+
+    def shutdown(self):
+        """
+            Stop all idle workers. Busy workers exit once their current task is done.
+        """
+        with self._cond:
+            self._tasks.clear()
+            for _ in range(self.workers):
+                self._tasks.append(None)
+            self._cond.notify_all()
+            self._not_full.notify_all()
+
+    def _start_worker(self):
+        t = basethread.BaseThread(
+            "{} worker {}".format(self.name, self.workers),
+            target=self._work
+        )
+        t.daemon = True
+        t.start()
+        self.workers += 1
+
+    def handle_error(self, func, fp=sys.stderr):
+        """
+            Called when a task raises an exception.
+        """
+        # If a thread has persisted after interpreter exit, the module might be
+        # none.
+        if traceback:
+            exc = str(traceback.format_exc())
+            print(u'-' * 40, file=fp)
+            print(u"Error in %s task %r" % (self.name, func), file=fp)
+            print(exc, file=fp)
+            print(u'-' * 40, file=fp)
+
+    def _work(self):
+        try:
+            while True:
+                with self._cond:
+                    self.idle += 1
+                    while not self._tasks:
+                        self._cond.wait()
+                    self.idle -= 1
+                    task = self._tasks.popleft()
+                    if task is None:
+                        return
+                    self._not_full.notify()
+                func, args = task
+                try:
+                    func(*args)
+                except Exception:
+                    self.handle_error(func)
+        finally:
+            with self._cond:
+                self.workers -= 1
+
+
 class TCPServer:
     request_queue_size = 20
+    # Set SO_REUSEPORT on the listen socket, so that several processes can
+    # accept connections on the same address.
+    reuse_port = False
+
+    # Admission control. If connection_limit is set, at most that many
+    # connections are handled at the same time. When the limit is reached,
+    # connection_overflow decides what happens to new connections:
+    #   queue: wait for a free slot, up to connection_queue_size connections,
+    #          then reject.
+    #   reject: call handle_overload and close the connection.
+    #   pause: stop accepting until a slot frees up, so that new connections
+    #          wait in the listen backlog (request_queue_size).
+    connection_limit = 0
+    connection_queue_size = 0
+    connection_overflow = "queue"
 
     def __init__(self, address):
         self.address = address
@@ -567,6 +977,8 @@ class TCPServer:
             self.socket = socket.socket(socket.AF_INET6, socket.SOCK_STREAM)
             self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
             self.socket.setsockopt(IPPROTO_IPV6, socket.IPV6_V6ONLY, 0)
+            if self.reuse_port:
+                self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
             self.socket.bind(self.address)
         except socket.error:
             if self.socket:
@@ -577,25 +989,118 @@ class TCPServer:
             # Binding to an IPv6 socket failed, lets fall back to IPv4.
             self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if self.reuse_port:
+                self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
             self.socket.bind(self.address)
 
         self.address = self.socket.getsockname()
         self.socket.listen(self.request_queue_size)
         self.handler_counter = Counter()
 
-    def connection_thread(self, connection, client_address):
-        with self.handler_counter:
+        self.active_connections = 0
+        self.rejected_connections = 0
+        self.pending = collections.deque()  # type: collections.deque
+        self._slots = threading.Condition()
+
+    @property
+    def queued_connections(self):
+        return len(self.pending)
+
+    def saturated(self):
+        """
+            True if no further connections can be handled right now.
+        """
+        return bool(self.connection_limit) and self.active_connections >= self.connection_limit
+
+    def admit(self, connection, client_address):
+        """
+            Start handling a new connection, queue it or reject it, depending
+            on the current load and the overflow policy.
+        """
+        with self._slots:
+            if not self.saturated():
+                self.active_connections += 1
+                start = True
+            elif (
+                self.connection_overflow == "queue" and
+                len(self.pending) < self.connection_queue_size
+            ):
+                self.pending.append((connection, client_address))
+                return
+            else:
+                self.rejected_connections += 1
+                start = False
+        if start:
+            while True:
+                try:
+                    self.start_handler(connection, client_address)
+                    return
+                except threading.ThreadError:
+                    self.handle_error(connection, client_address)
+                    close_socket(connection)
+                # The slot may go to a queued connection instead.
+                nxt = self.release_slot()
+                if nxt is None:
+                    return
+                connection, client_address = nxt
+        else:
             try:
-                self.handle_client_connection(connection, client_address)
-            except:
-                self.handle_error(connection, client_address)
+                self.handle_overload(connection, client_address)
             finally:
                 close_socket(connection)
 
+    def release_slot(self):
+        """
+            Called when a handler is done. Returns the next queued connection,
+            or None if the slot has been released.
+        """
+        with self._slots:
+            if self.pending:
+                return self.pending.popleft()
+            self.active_connections -= 1
+            self._slots.notify()
+        self.handle_slot_released()
+        return None
+
+    def start_handler(self, connection, client_address):
+        t = basethread.BaseThread(
+            "TCPConnectionHandler (%s: %s:%s -> %s:%s)" % (
+                self.__class__.__name__,
+                client_address[0],
+                client_address[1],
+                self.address[0],
+                self.address[1],
+            ),
+            target=self.connection_thread,
+            args=(connection, client_address),
+        )
+        t.setDaemon(1)
+        t.start()
+
+    def connection_thread(self, connection, client_address):
+        while True:
+            with self.handler_counter:
+                try:
+                    self.handle_client_connection(connection, client_address)
+                except:
+                    self.handle_error(connection, client_address)
+                finally:
+                    close_socket(connection)
+            nxt = self.release_slot()
+            if nxt is None:
+                return
+            connection, client_address = nxt
+
     def serve_forever(self, poll_interval=0.1):
         self.__is_shut_down.clear()
         try:
             while not self.__shutdown_request:
+                if self.connection_overflow == "pause":
+                    with self._slots:
+                        if self.saturated():
+                            # Leave new connections in the listen backlog.
+                            self._slots.wait(poll_interval)
+                            continue
                 try:
                     r, w_, e_ = select.select(
                         [self.socket], [], [], poll_interval)
@@ -606,23 +1111,7 @@ class TCPServer:
                         raise
                 if self.socket in r:
                     connection, client_address = self.socket.accept()
-                    t = basethread.BaseThread(
-                        "TCPConnectionHandler (%s: %s:%s -> %s:%s)" % (
-                            self.__class__.__name__,
-                            client_address[0],
-                            client_address[1],
-                            self.address[0],
-                            self.address[1],
-                        ),
-                        target=self.connection_thread,
-                        args=(connection, client_address),
-                    )
-                    t.setDaemon(1)
-                    try:
-                        t.start()
-                    except threading.ThreadError:
-                        self.handle_error(connection, client_address)
-                        connection.close()
+                    self.admit(connection, client_address)
         finally:
             self.__shutdown_request = False
             self.__is_shut_down.set()
@@ -653,6 +1142,17 @@ class TCPServer:
         """
         raise NotImplementedError
 
+    def handle_overload(self, connection, client_address):
+        """
+            Called before a connection is rejected because the server is at
+            its connection limit. The connection is closed afterwards.
+        """
+
+    def handle_slot_released(self):
+        """
+            Called after a handler finished and no queued connection was waiting.
+        """
+
     def handle_shutdown(self):
         """
             Called after server shutdown.
@@ -668,3 +1168,107 @@ class TCPServer:
                 )
             if self.handler_counter.count == 0:
                 return
+
+
+class AsyncTCPServer(TCPServer):
+    """
+        A TCPServer that accepts connections on an asyncio event loop.
+
+        New connections stay parked on the event loop until the client has sent
+        its first bytes, and only then are handed to a pool of reusable handler
+        threads. Clients that connect without sending anything (e.g. browser
+        preconnects) therefore do not occupy a thread. Once a connection has
+        been handed off, it keeps its worker until the handler returns.
+
+        With the "pause" overflow policy, readable connections are held back on
+        the event loop and accepting is suspended until a worker is free.
+    """
+    max_workers = None  # type: Optional[int]
+    accept_batch = 100
+
+    def __init__(self, address):
+        super().__init__(address)
+        self.loop = asyncio.SelectorEventLoop()
+        self.pool = WorkerPool(self.__class__.__name__, self.max_workers)
+        self.parked = {}  # type: dict
+        self.ready = collections.deque()  # type: collections.deque
+        self.paused = False
+        self._is_shut_down = threading.Event()
+        self._is_shut_down.set()
+
+    def serve_forever(self, poll_interval=0.1):
+        self._is_shut_down.clear()
+        self.socket.setblocking(False)
+        try:
+            self.loop.add_reader(self.socket.fileno(), self._accept)
+            self.loop.run_forever()
+        finally:
+            self.loop.remove_reader(self.socket.fileno())
+            for connection in list(self.parked.values()):
+                self.loop.remove_reader(connection.fileno())
+                close_socket(connection)
+            self.parked.clear()
+            for connection, _ in self.ready:
+                close_socket(connection)
+            self.ready.clear()
+            self.pool.shutdown()
+            self._is_shut_down.set()
+
+    def _accept(self):
+        for _ in range(self.accept_batch):
+            if self.connection_overflow == "pause" and self.saturated():
+                self._pause()
+                return
+            try:
+                connection, client_address = self.socket.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except socket.error:
+                # e.g. EMFILE - try again on the next loop iteration.
+                self.handle_error(None, None)
+                return
+            connection.setblocking(True)
+            self.parked[connection.fileno()] = connection
+            self.loop.add_reader(
+                connection.fileno(),
+                self._dispatch,
+                connection,
+                client_address
+            )
+
+    def _dispatch(self, connection, client_address):
+        self.loop.remove_reader(connection.fileno())
+        del self.parked[connection.fileno()]
+        if self.connection_overflow == "pause" and self.saturated():
+            self.ready.append((connection, client_address))
+            self._pause()
+        else:
+            self.admit(connection, client_address)
+
+    def _pause(self):
+        if not self.paused:
+            self.paused = True
+            self.loop.remove_reader(self.socket.fileno())
+
+    def _resume(self):
+        while self.ready and not self.saturated():
+            self.admit(*self.ready.popleft())
+        if self.paused and not self.saturated():
+            self.paused = False
+            self.loop.add_reader(self.socket.fileno(), self._accept)
+
+    def start_handler(self, connection, client_address):
+        self.pool.submit(self.connection_thread, connection, client_address)
+
+    def handle_slot_released(self):
+        self.loop.call_soon_threadsafe(self._resume)
+
+    @property
+    def parked_count(self):
+        return len(self.parked)
+
+    def shutdown(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._is_shut_down.wait()
+        self.socket.close()
+        self.handle_shutdown()
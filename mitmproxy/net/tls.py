@@ -2,8 +2,10 @@
 # then add options to disable certain methods
 # https://bugs.launchpad.net/pyopenssl/+bug/1020632/comments/3
 import binascii
+import collections
 import os
 import threading
+import time
 import typing
 from ssl import match_hostname, CertificateError
 
@@ -337,4 +339,180 @@ def create_server_context(
     if dhparams:
         SSL._lib.SSL_CTX_set_tmp_dh(context._context, dhparams)
 
+    # Contexts are shared between connections, so clients may resume
+    # sessions. OpenSSL refuses to do that for client certificate
+    # authentication without a session id context.
+    context.set_session_id(b"mitmproxy")
+
     return context
+
+
+def _dispatch_handle_sni(conn):
+    return conn.get_app_data()["handle_sni"](conn)
+
+
+def _dispatch_alpn_select_callback(conn, options):
+    return conn.get_app_data()["alpn_select_callback"](conn, options)
+
+
+class ContextCache:
+    """
+        A cache of SSL contexts, keyed by the arguments they were created
+        with. Creating a context is expensive, mostly because the trusted CA
+        certificates are loaded every time.
+
+        Callbacks usually belong to a single connection, so they are not part
+        of the key. Instead, the context calls the callbacks of the
+        connection it is handling.
+
+        At most size contexts are kept, least recently used first out. A size
+        of 0 disables the cache.
+    """
+    callbacks = {
+        "handle_sni": _dispatch_handle_sni,
+        "alpn_select_callback": _dispatch_alpn_select_callback,
+    }
+
+    def __init__(self, size=100):
+        self.size = size
+        # Maps keys to (context, arguments). We hold on to the arguments so
+        # that the ids of argument objects in the keys are not reused.
+        self._contexts = collections.OrderedDict()  # type: typing.MutableMapping[typing.Any, typing.Tuple[SSL.Context, dict]]
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._contexts)
+
+    def __repr__(self):
+        return "ContextCache({} contexts, {} hits, {} misses)".format(
+            len(self), self.hits, self.misses
+        )
+
+    @classmethod
+    def _key(cls, value):
+        if value is None or isinstance(value, (bool, int, str, bytes)):
+            return value
+        if isinstance(value, (list, tuple)):
+            return tuple(cls._key(i) for i in value)
+        if isinstance(value, certs.SSLCert):
+            return "cert", value.digest("sha256")
+        return type(value).__name__, id(value)
+
+    def connection(self, create, sock, **kwargs) -> SSL.Connection:
+        """
+            Wrap sock in an SSL connection with a context from
+            create(**kwargs), or an equivalent cached one.
+        """
+        if not self.size:
+            return SSL.Connection(create(**kwargs), sock)
+        callbacks = {}
+        for name, dispatch in self.callbacks.items():
+            if callable(kwargs.get(name)):
+                callbacks[name] = kwargs[name]
+                kwargs[name] = dispatch
+        # Contexts pick up the master secret logger when they are created.
+        key = (create, log_master_secret, tuple(sorted((k, self._key(v)) for k, v in kwargs.items())))
+        with self._lock:
+            entry = self._contexts.get(key)
+            if entry:
+                self._contexts.move_to_end(key)
+                self.hits += 1
+        if entry:
+            context = entry[0]
+        else:
+            # Create the context outside of the lock, two threads creating
+            # the same context at once is cheaper than serializing handshakes.
+            context = create(**kwargs)
+            with self._lock:
+                self.misses += 1
+                self._contexts[key] = (context, kwargs)
+                while len(self._contexts) > self.size:
+                    self._contexts.popitem(last=False)
+        conn = SSL.Connection(context, sock)
+        conn.set_app_data(callbacks)
+        return conn
+
+    def clear(self) -> None:
+        with self._lock:
+            self._contexts.clear()
+
+
+context_cache = ContextCache()
+
+
+class SessionCache:
+    """
+        A cache of client-side TLS sessions, used to resume sessions with
+        servers we have already talked to and skip the full handshake.
+
+        At most size sessions are kept, least recently used first out, and
+        sessions are dropped after ttl seconds. A size of 0 disables the
+        cache.
+    """
+
+    def __init__(self, size=0, ttl=300):
+        self.size = size
+        self.ttl = ttl
+        # Maps keys to (store time, session), least recently used first.
+        self._sessions = collections.OrderedDict()  # type: typing.MutableMapping[typing.Any, typing.Tuple[float, SSL.Session]]
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        # Handshakes with and without a cached session to offer.
+        self.hits = 0
+        self.misses = 0
+        # Handshakes in which the server accepted the cached session.
+        self.resumed = 0
+
+    @property
+    def hit_rate(self) -> float:
+        """
+            The share of handshakes that resumed a session.
+        """
+        total = self.hits + self.misses
+        return self.resumed / total if total else 0.0
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __repr__(self):
+        return "SessionCache({} sessions, {} hits, {} misses, {} resumed)".format(
+            len(self), self.hits, self.misses, self.resumed
+        )
+
+    def get(self, key) -> typing.Optional[SSL.Session]:
+        if not self.size:
+            return None
+        with self._lock:
+            entry = self._sessions.get(key)
+            if entry and entry[0] >= time.monotonic() - self.ttl:
+                self._sessions.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self._sessions.pop(key, None)
+            self.misses += 1
+            return None
+
+    def put(self, key, session: SSL.Session) -> None:
+        if not self.size:
+            return
+        with self._lock:
+            self._sessions[key] = (time.monotonic(), session)
+            self._sessions.move_to_end(key)
+            while len(self._sessions) > self.size:
+                self._sessions.popitem(last=False)
+
+    def discard(self, key) -> None:
+        with self._lock:
+            self._sessions.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._sessions.clear()
+
+    def record_resumption(self) -> None:
+        with self._lock:
+            self.resumed += 1
@@ -1,5 +1,6 @@
 from typing import Optional, Sequence
 
+from mitmproxy import certs
 from mitmproxy import optmanager
 from mitmproxy import contentviews
 from mitmproxy.net import tls
@@ -34,12 +35,22 @@ class Options(optmanager.OptManager):
         anticache = None  # type: bool
         anticomp = None  # type: bool
         body_size_limit = None  # type: Optional[str]
+        body_spill_size = None  # type: Optional[str]
         cadir = None  # type: str
+        cert_cache_size = None  # type: int
+        cert_disk_cache_size = None  # type: int
+        cert_key_type = None  # type: str
+        cert_prefetch_hosts = None  # type: Sequence[str]
         certs = None  # type: Sequence[str]
         ciphers_client = None  # type: Optional[str]
         ciphers_server = None  # type: Optional[str]
         client_certs = None  # type: Optional[str]
         client_replay = None  # type: Sequence[str]
+        concurrent_queue_size = None  # type: int
+        concurrent_threads = None  # type: int
+        connection_limit = None  # type: int
+        connection_overflow = None  # type: str
+        connection_queue_size = None  # type: int
         console_focus_follow = None  # type: bool
         console_layout = None  # type: str
         console_layout_headers = None  # type: bool
@@ -49,7 +60,14 @@ class Options(optmanager.OptManager):
         console_palette = None  # type: str
         console_palette_transparent = None  # type: bool
         default_contentview = None  # type: str
+        dns_cache_negative_ttl = None  # type: int
+        dns_cache_size = None  # type: int
+        dns_cache_ttl = None  # type: int
+        dns_pin = None  # type: Sequence[str]
+        event_batch_size = None  # type: int
+        event_batch_time = None  # type: int
         flow_detail = None  # type: int
+        happy_eyeballs_delay = None  # type: int
         http2 = None  # type: bool
         http2_priority = None  # type: bool
         ignore_hosts = None  # type: Sequence[str]
@@ -57,6 +75,7 @@ class Options(optmanager.OptManager):
         intercept_active = None  # type: bool
         keep_host_header = None  # type: bool
         keepserving = None  # type: bool
+        listen_backlog = None  # type: int
         listen_host = None  # type: str
         listen_port = None  # type: int
         mode = None  # type: str
@@ -73,6 +92,7 @@ class Options(optmanager.OptManager):
         save_stream_filter = None  # type: Optional[str]
         scripts = None  # type: Sequence[str]
         server = None  # type: bool
+        server_event_loop = None  # type: bool
         server_replay = None  # type: Sequence[str]
         server_replay_ignore_content = None  # type: bool
         server_replay_ignore_host = None  # type: bool
@@ -84,6 +104,8 @@ class Options(optmanager.OptManager):
         showhost = None  # type: bool
         spoof_source_address = None  # type: bool
         ssl_insecure = None  # type: bool
+        ssl_session_cache_size = None  # type: int
+        ssl_session_cache_timeout = None  # type: int
         ssl_verify_upstream_trusted_ca = None  # type: Optional[str]
         ssl_verify_upstream_trusted_cadir = None  # type: Optional[str]
         ssl_version_client = None  # type: str
@@ -96,6 +118,11 @@ class Options(optmanager.OptManager):
         upstream_auth = None  # type: Optional[str]
         upstream_bind_address = None  # type: str
         upstream_cert = None  # type: bool
+        upstream_cert_cache_size = None  # type: int
+        upstream_cert_cache_timeout = None  # type: int
+        upstream_parallel_connect = None  # type: bool
+        upstream_pool_size = None  # type: int
+        upstream_pool_timeout = None  # type: int
         verbosity = None  # type: str
         view_filter = None  # type: Optional[str]
         web_debug = None  # type: bool
@@ -103,6 +130,7 @@ class Options(optmanager.OptManager):
         web_open_browser = None  # type: bool
         web_port = None  # type: int
         websocket = None  # type: bool
+        workers = None  # type: int
 
     def __init__(self, **kwargs) -> None:
         super().__init__()
@@ -152,6 +180,28 @@ class Options(optmanager.OptManager):
             "server", bool, True,
             "Start a proxy server. Enabled by default."
         )
+        self.add_option(
+            "event_batch_size", int, 100,
+            """
+            Maximum number of queued events the master handles in one go
+            before it runs periodic tasks again.
+            """
+        )
+        self.add_option(
+            "event_batch_time", int, 50,
+            """
+            Maximum time in milliseconds the master spends on a batch of queued
+            events before it runs periodic tasks again.
+            """
+        )
+        self.add_option(
+            "server_event_loop", bool, False,
+            """
+            Accept client connections on an asyncio event loop and only assign
+            a handler thread once a client has sent data. Idle connections do
+            not occupy a thread. Experimental.
+            """
+        )
         self.add_option(
             "server_replay_nopop", bool, False,
             """
@@ -176,6 +226,20 @@ class Options(optmanager.OptManager):
             Execute a script.
             """
         )
+        self.add_option(
+            "concurrent_threads", int, 16,
+            """
+            Number of threads that run script hooks decorated with @concurrent.
+            """
+        )
+        self.add_option(
+            "concurrent_queue_size", int, 100,
+            """
+            Number of @concurrent hook invocations that may wait for a free
+            thread. Once the queue is full, further invocations run on a new
+            thread each. Use 0 for no limit.
+            """
+        )
         self.add_option(
             "showhost", bool, False,
             "Use the Host header to construct URLs for display."
@@ -295,6 +359,14 @@ class Options(optmanager.OptManager):
             k/m/g suffixes, i.e. 3m for 3 megabytes.
             """
         )
+        self.add_option(
+            "body_spill_size", Optional[str], None,
+            """
+            Store HTTP request and response bodies larger than this in
+            temporary files rather than in memory. Understands k/m/g suffixes,
+            i.e. 3m for 3 megabytes.
+            """
+        )
         self.add_option(
             "cadir", str, CA_DIR,
             "Location of the default mitmproxy CA files."
@@ -310,6 +382,37 @@ class Options(optmanager.OptManager):
             certificate as the first entry.
             """
         )
+        self.add_option(
+            "cert_cache_size", int, 10000,
+            """
+            Number of generated certificates kept in memory. Once exceeded,
+            the least recently used certificate is discarded.
+            """
+        )
+        self.add_option(
+            "cert_disk_cache_size", int, 0,
+            """
+            Number of generated certificates kept on disk in the CA
+            directory, for reuse after a restart and by other mitmproxy
+            processes with the same CA. Use 0 to disable the disk cache.
+            """
+        )
+        self.add_option(
+            "cert_key_type", str, "rsa",
+            """
+            Key algorithm for generated certificates, and for the CA if a new
+            one is created. ECDSA handshakes are much cheaper for the proxy.
+            Clients that don't support ECDSA still get an RSA certificate.
+            """,
+            choices=list(certs.KEY_TYPES),
+        )
+        self.add_option(
+            "cert_prefetch_hosts", Sequence[str], [],
+            """
+            Hosts to generate certificates for in the background on startup,
+            so that the first connection to them does not wait for it.
+            """
+        )
         self.add_option(
             "ciphers_client", Optional[str], None,
             "Set supported ciphers for client connections using OpenSSL syntax."
@@ -322,6 +425,41 @@ class Options(optmanager.OptManager):
             "client_certs", Optional[str], None,
             "Client certificate file or directory."
         )
+        self.add_option(
+            "dns_cache_size", int, 0,
+            """
+            Number of upstream host name lookups kept in memory, so that
+            connections don't wait for the system resolver every time. Cached
+            lookups are used for dns_cache_ttl seconds, regardless of the TTL
+            of the DNS records. Use 0 to disable the cache.
+            """
+        )
+        self.add_option(
+            "dns_cache_ttl", int, 60,
+            "Seconds after which successful host name lookups are repeated."
+        )
+        self.add_option(
+            "dns_cache_negative_ttl", int, 5,
+            "Seconds after which failed host name lookups are repeated."
+        )
+        self.add_option(
+            "dns_pin", Sequence[str], [],
+            """
+            Host names of the form "host[=address,...]" whose lookups never
+            expire, e.g. reverse proxy backends. The host resolves to the given
+            IP addresses, or is looked up once if none are given.
+            """
+        )
+        self.add_option(
+            "happy_eyeballs_delay", int, 250,
+            """
+            Delay in milliseconds between connection attempts to different
+            addresses of an upstream server (RFC 8305). By default, attempts
+            to a server with several addresses run in parallel once this delay
+            has passed. The address family that worked is tried first on later
+            connections. Use 0 to try addresses one after another.
+            """
+        )
         self.add_option(
             "ignore_hosts", Sequence[str], [],
             """
@@ -340,6 +478,43 @@ class Options(optmanager.OptManager):
             "listen_port", int, LISTEN_PORT,
             "Proxy service port."
         )
+        self.add_option(
+            "listen_backlog", int, 20,
+            "Size of the operating system's queue of connections waiting to be accepted."
+        )
+        self.add_option(
+            "connection_limit", int, 0,
+            """
+            Maximum number of client connections handled at the same time.
+            Use 0 for no limit.
+            """
+        )
+        self.add_option(
+            "connection_overflow", str, "queue",
+            """
+            What to do with new client connections once connection_limit is
+            reached: "queue" them until a slot is free (up to
+            connection_queue_size, then reject), "reject" them with a 503
+            response, or "pause" accepting connections altogether.
+            """,
+            choices=["queue", "reject", "pause"]
+        )
+        self.add_option(
+            "connection_queue_size", int, 100,
+            """
+            Number of accepted client connections that may wait for a free slot
+            when connection_limit is reached and connection_overflow is "queue".
+            """
+        )
+        self.add_option(
+            "workers", int, 1,
+            """
+            Number of mitmdump processes that share the listen port through
+            SO_REUSEPORT. Each worker runs its own addon chain; flows and log
+            messages are collected by the main process, which writes the
+            terminal output and the save stream.
+            """
+        )
         self.add_option(
             "upstream_bind_address", str, "",
             "Address to bind upstream requests to."
@@ -356,6 +531,45 @@ class Options(optmanager.OptManager):
             "upstream_cert", bool, True,
             "Connect to upstream server to look up certificate details."
         )
+        self.add_option(
+            "upstream_cert_cache_size", int, 0,
+            """
+            Number of servers for which upstream certificate details are
+            remembered. Later connections to these servers don't need to wait
+            for the server handshake before answering the client, but get a
+            certificate based on the remembered details even if the server has
+            changed its certificate in the meantime. Use 0 to always look up
+            certificate details.
+            """
+        )
+        self.add_option(
+            "upstream_cert_cache_timeout", int, 3600,
+            "Seconds after which remembered upstream certificate details are discarded."
+        )
+        self.add_option(
+            "upstream_parallel_connect", bool, False,
+            """
+            Connect to the upstream server while the TLS handshake with the
+            client is still in progress, if the handshake does not depend on
+            the server. This saves a round trip to the server when setting up
+            connections. Since the server's protocol choice is not known
+            during the client handshake, connections set up this way use
+            HTTP/1.1 with clients that offer it, even if both sides support
+            HTTP/2.
+            """
+        )
+        self.add_option(
+            "upstream_pool_size", int, 0,
+            """
+            Number of idle HTTP/1 upstream connections kept open per server
+            for reuse by later requests, including requests from other
+            clients. Use 0 to disable the connection pool.
+            """
+        )
+        self.add_option(
+            "upstream_pool_timeout", int, 30,
+            "Seconds after which idle pooled upstream connections are closed."
+        )
         self.add_option(
             "keep_host_header", bool, False,
             """
@@ -433,6 +647,18 @@ class Options(optmanager.OptManager):
             "ssl_verify_upstream_trusted_ca", Optional[str], None,
             "Path to a PEM formatted trusted CA certificate."
         )
+        self.add_option(
+            "ssl_session_cache_size", int, 1000,
+            """
+            Number of upstream TLS sessions kept for resumption, which saves
+            a full handshake when connecting to the same server again. Use 0
+            to disable session resumption.
+            """
+        )
+        self.add_option(
+            "ssl_session_cache_timeout", int, 300,
+            "Seconds after which cached upstream TLS sessions are discarded."
+        )
         self.add_option(
             "tcp_hosts", Sequence[str], [],
             """
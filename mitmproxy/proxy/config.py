@@ -1,3 +1,4 @@
+import ipaddress
 import os
 import re
 import typing
@@ -7,11 +8,33 @@ from OpenSSL import SSL, crypto
 from mitmproxy import exceptions
 from mitmproxy import options as moptions
 from mitmproxy import certs
+from mitmproxy.net import dns
 from mitmproxy.net import tls
 from mitmproxy.net import server_spec
+from mitmproxy.net import tcp
+from mitmproxy.proxy import pool
 
 CONF_BASENAME = "mitmproxy"
 
+# Options that affect how upstream connections are set up. Idle pooled
+# connections may no longer match them, so the pool is cleared whenever one
+# of them changes.
+UPSTREAM_POOL_OPTIONS = {
+    "upstream_pool_size",
+    "upstream_pool_timeout",
+    "mode",
+    "upstream_auth",
+    "upstream_bind_address",
+    "spoof_source_address",
+    "http2",
+    "ssl_insecure",
+    "ssl_version_server",
+    "ciphers_server",
+    "client_certs",
+    "ssl_verify_upstream_trusted_ca",
+    "ssl_verify_upstream_trusted_cadir",
+}
+
 
 class HostMatcher:
 
@@ -43,6 +66,13 @@ class ProxyConfig:
         self.client_certs = None  # type: str
         self.openssl_verification_mode_server = None  # type: int
         self.upstream_server = None  # type: typing.Optional[server_spec.ServerSpec]
+        self.upstream_pool = pool.ConnectionPool()
+        # Runs server connects that overlap with the client handshake, see
+        # upstream_parallel_connect.
+        self.connect_pool = tcp.WorkerPool("TlsLayer connect")
+        self.tls_sessions = tls.SessionCache()
+        self.dns_cache = dns.ResolverCache()
+        self.upstream_certs = certs.UpstreamCertCache()
         self.configure(options, set(options.keys()))
         options.changed.connect(self.configure)
 
@@ -69,16 +99,55 @@ class ProxyConfig:
         self.openssl_method_server, self.openssl_options_server = \
             tls.VERSION_CHOICES[options.ssl_version_server]
 
-        certstore_path = os.path.expanduser(options.cadir)
-        if not os.path.exists(os.path.dirname(certstore_path)):
-            raise exceptions.OptionsError(
-                "Certificate Authority parent directory does not exist: %s" %
-                os.path.dirname(options.cadir)
+        # Recreating the certstore would discard all generated certificates.
+        if "cadir" in updated or "certs" in updated:
+            certstore_path = os.path.expanduser(options.cadir)
+            if not os.path.exists(os.path.dirname(certstore_path)):
+                raise exceptions.OptionsError(
+                    "Certificate Authority parent directory does not exist: %s" %
+                    os.path.dirname(options.cadir)
+                )
+            certstore = certs.CertStore.from_store(
+                certstore_path,
+                CONF_BASENAME,
+                options.cert_key_type
             )
-        self.certstore = certs.CertStore.from_store(
-            certstore_path,
-            CONF_BASENAME
-        )
+            for c in options.certs:
+                parts = c.split("=", 1)
+                if len(parts) == 1:
+                    parts = ["*", parts[0]]
+
+                cert = os.path.expanduser(parts[1])
+                if not os.path.exists(cert):
+                    raise exceptions.OptionsError(
+                        "Certificate file does not exist: %s" % cert
+                    )
+                try:
+                    certstore.add_cert_file(parts[0], cert)
+                except crypto.Error:
+                    raise exceptions.OptionsError(
+                        "Invalid certificate format: %s" % cert
+                    )
+            if self.certstore:
+                self.certstore.shutdown(wait=False)
+            self.certstore = certstore
+        self.certstore.capacity = options.cert_cache_size
+        if options.cert_disk_cache_size:
+            cache = self.certstore.disk_cache
+            if not cache:
+                cache = certs.CertDiskCache(
+                    os.path.join(os.path.expanduser(options.cadir), CONF_BASENAME + "-certs"),
+                    self.certstore.default_ca,
+                    options.cert_disk_cache_size
+                )
+            cache.size = options.cert_disk_cache_size
+            self.certstore.disk_cache = cache
+        else:
+            self.certstore.disk_cache = None
+        if "cert_prefetch_hosts" in updated or "cadir" in updated or "certs" in updated:
+            for h in options.cert_prefetch_hosts:
+                host = h.encode("idna")
+                self.certstore.prefetch(host, [host], options.cert_key_type)
 
         if options.client_certs:
             client_certs = os.path.expanduser(options.client_certs)
@@ -89,22 +158,43 @@ class ProxyConfig:
                 )
             self.client_certs = client_certs
 
-        for c in options.certs:
-            parts = c.split("=", 1)
-            if len(parts) == 1:
-                parts = ["*", parts[0]]
+        # Every connection has at most one parallel connect at a time.
+        self.connect_pool.max_workers = options.connection_limit or None
+        self.upstream_pool.max_idle = options.upstream_pool_size
+        self.upstream_pool.idle_timeout = options.upstream_pool_timeout
+        if UPSTREAM_POOL_OPTIONS.intersection(updated):
+            self.upstream_pool.clear()
+        self.tls_sessions.size = options.ssl_session_cache_size
+        self.tls_sessions.ttl = options.ssl_session_cache_timeout
+        if "ssl_insecure" in updated or "client_certs" in updated:
+            self.tls_sessions.clear()
+        self.upstream_certs.size = options.upstream_cert_cache_size
+        self.upstream_certs.ttl = options.upstream_cert_cache_timeout
+        if "http2" in updated:
+            # Remembered ALPN choices may no longer be allowed.
+            self.upstream_certs.clear()
+
+        self.dns_cache.size = options.dns_cache_size
+        self.dns_cache.ttl = options.dns_cache_ttl
+        self.dns_cache.negative_ttl = options.dns_cache_negative_ttl
+        if "dns_pin" in updated:
+            pins = {}
+            for p in options.dns_pin:
+                host, _, addresses = p.partition("=")
+                pins[host] = [a for a in addresses.split(",") if a]
+                for a in pins[host]:
+                    try:
+                        ipaddress.ip_address(a)
+                    except ValueError:
+                        raise exceptions.OptionsError(
+                            "Invalid IP address for pinned host %s: %s" % (host, a)
+                        )
+            for host in list(self.dns_cache.pinned):
+                if host not in pins:
+                    self.dns_cache.unpin(host)
+            for host, addresses in pins.items():
+                self.dns_cache.pin(host, addresses)
 
-            cert = os.path.expanduser(parts[1])
-            if not os.path.exists(cert):
-                raise exceptions.OptionsError(
-                    "Certificate file does not exist: %s" % cert
-                )
-            try:
-                self.certstore.add_cert_file(parts[0], cert)
-            except crypto.Error:
-                raise exceptions.OptionsError(
-                    "Invalid certificate format: %s" % cert
-                )
         m = options.mode
         if m.startswith("upstream:") or m.startswith("reverse:"):
             _, spec = server_spec.parse_with_mode(options.mode)
@@ -0,0 +1,132 @@
+import collections
+import threading
+import time
+import typing  # noqa
+
+from mitmproxy import connections  # noqa
+from mitmproxy import controller  # noqa
+from mitmproxy.net import tcp
+
+
+class ConnectionPool:
+    """
+        A pool of idle upstream connections, shared by all client connections
+        of a proxy server.
+
+        Connections are checked in under a key that describes everything a
+        later request needs to match to reuse them: address, TLS, SNI,
+        negotiated ALPN protocol and client certificate. Idle connections are
+        closed after idle_timeout seconds, and at most max_idle connections
+        are kept per key. A max_idle of 0 disables the pool.
+
+        Connections the pool closes are reported with a serverdisconnect
+        event through channel, if one is set.
+    """
+
+    def __init__(self, max_idle=0, idle_timeout=30):
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self.channel = None  # type: typing.Optional[controller.Channel]
+        # Maps keys to deques of (check-in time, connection), oldest first.
+        self._idle = {}  # type: typing.Dict[typing.Any, typing.Deque]
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        # Connections that were closed by the server or timed out while idle.
+        self.stale = 0
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(i) for i in self._idle.values())
+
+    def __repr__(self):
+        return "ConnectionPool({} idle, {} hits, {} misses, {} stale)".format(
+            len(self), self.hits, self.misses, self.stale
+        )
+
+    @staticmethod
+    def healthy(conn: "connections.ServerConnection") -> bool:
+        """
+            An idle connection is healthy if the server has neither closed it
+            nor sent unexpected data, i.e. if there is nothing to read.
+        """
+        if not conn.connected():
+            return False
+        try:
+            return not tcp.ssl_read_select([conn.connection], 0)
+        except (OSError, ValueError):
+            return False
+
+    def checkout(self, key) -> typing.Optional["connections.ServerConnection"]:
+        """
+            Take an idle, healthy connection for key out of the pool. Returns
+            None if there is none.
+        """
+        if not self.max_idle:
+            return None
+        deadline = time.monotonic() - self.idle_timeout
+        with self._lock:
+            idle = self._idle.get(key)
+            conn = None
+            while idle:
+                # Reuse the most recently used connection, it is the least
+                # likely to have been closed by the server.
+                t, c = idle.pop()
+                if t >= deadline and self.healthy(c):
+                    conn = c
+                    break
+                self.stale += 1
+                self._close(c)
+            if not idle:
+                self._idle.pop(key, None)
+            if conn:
+                self.hits += 1
+            else:
+                self.misses += 1
+            return conn
+
+    def checkin(self, key, conn: "connections.ServerConnection") -> bool:
+        """
+            Put an idle connection into the pool. Returns False if the pool
+            is disabled, in which case the caller remains responsible for
+            the connection.
+        """
+        if not self.max_idle:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            idle = self._idle.setdefault(key, collections.deque())
+            idle.append((now, conn))
+            while len(idle) > self.max_idle:
+                self._close(idle.popleft()[1])
+        return True
+
+    def clear(self):
+        """
+            Close all idle connections.
+        """
+        with self._lock:
+            for idle in self._idle.values():
+                for _, conn in idle:
+                    self._close(conn)
+            self._idle = {}
+
+    def _expire(self, now):
+        deadline = now - self.idle_timeout
+        for key in list(self._idle.keys()):
+            idle = self._idle[key]
+            while idle and idle[0][0] < deadline:
+                self.stale += 1
+                self._close(idle.popleft()[1])
+            if not idle:
+                del self._idle[key]
+
+    def _close(self, conn):
+        conn.finish()
+        conn.close()
+        if self.channel:
+            self.channel.tell("serverdisconnect", conn)
@@ -1,3 +1,5 @@
+import copy
+
 from mitmproxy import exceptions
 from mitmproxy import connections
 from mitmproxy import controller  # noqa
@@ -97,6 +99,9 @@ class ServerConnectionMixin:
         super().__init__()
 
         self.server_conn = self.__make_server_conn(server_address)
+        # If set, disconnect() returns the server connection to the upstream
+        # connection pool under this key instead of closing it.
+        self.server_pool_key = None
 
         self.__check_self_connect()
 
@@ -142,14 +147,44 @@ class ServerConnectionMixin:
         Deletes (and closes) an existing server connection.
         Must not be called if there is no existing connection.
         """
-        self.log("serverdisconnect", "debug", [repr(self.server_conn.address)])
         address = self.server_conn.address
-        self.server_conn.finish()
-        self.server_conn.close()
-        self.channel.tell("serverdisconnect", self.server_conn)
+        key, self.server_pool_key = self.server_pool_key, None
+        if key is not None and self.config.upstream_pool.checkin(key, self.server_conn):
+            self.log("Returned server connection to pool", "debug", [repr(address)])
+        else:
+            self.log("serverdisconnect", "debug", [repr(address)])
+            self.server_conn.finish()
+            self.server_conn.close()
+            self.channel.tell("serverdisconnect", self.server_conn)
 
         self.server_conn = self.__make_server_conn(address)
 
+    def reuse_server(self, key):
+        """
+        Replaces the server connection with an idle connection for key from
+        the upstream connection pool, if there is one.
+        Must not be called if there is an existing connection.
+
+        Returns:
+            True, if a pooled connection is used.
+        """
+        conn = self.config.upstream_pool.checkout(key)
+        if not conn:
+            return False
+        self.log("Reusing pooled server connection", "debug", [repr(conn.address)])
+        # Flows of the previous client keep the connection object they were
+        # recorded with, so that our changes to it don't show up in them.
+        self.server_conn = copy.copy(conn)
+        return True
+
+    def release_server(self, key):
+        """
+        Marks the server connection as idle after a complete exchange, so that
+        it can be reused by other client connections once this one is done
+        with it. Pass None to mark it as busy again.
+        """
+        self.server_pool_key = key
+
     def connect(self):
         """
         Establishes a server connection.
@@ -163,7 +198,10 @@ class ServerConnectionMixin:
         self.log("serverconnect", "debug", [repr(self.server_conn.address)])
         self.channel.ask("serverconnect", self.server_conn)
         try:
-            self.server_conn.connect()
+            self.server_conn.connect(
+                self.config.dns_cache,
+                self.config.options.happy_eyeballs_delay / 1000
+            )
         except exceptions.TcpException as e:
             raise exceptions.ProtocolException(
                 "Server connection to {} failed: {}".format(
@@ -9,6 +9,8 @@ from mitmproxy import flow
 from mitmproxy.proxy.protocol import base
 from mitmproxy.proxy.protocol.websocket import WebSocketLayer
 from mitmproxy.net import websockets
+from mitmproxy.net.http import spool
+from mitmproxy.utils import human
 
 
 class _HttpTransmissionLayer(base.Layer):
@@ -39,7 +41,7 @@ class _HttpTransmissionLayer(base.Layer):
         if response.data.content is None:
             raise exceptions.HttpException("Cannot assemble flow with missing content")
         self.send_response_headers(response)
-        self.send_response_body(response, [response.data.content])
+        self.send_response_body(response, spool.iter_chunks(response.data.content))
 
     def send_response_headers(self, response):
         raise NotImplementedError()
@@ -156,6 +158,10 @@ def validate_request_form(mode, request):
         raise exceptions.HttpException(err_message)
 
 
+# Methods that can safely be retried on a new connection, see RFC 7231 4.2.2.
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "TRACE", "PUT", "DELETE"}
+
+
 class HttpLayer(base.Layer):
 
     if False:
@@ -174,6 +180,10 @@ class HttpLayer(base.Layer):
         # Requests happening after CONNECT do not need Proxy-Authorization headers.
         self.connect_request = False
 
+    def _read_body(self, chunks):
+        # Bodies above body_spill_size are stored on disk rather than in memory.
+        return spool.spool(chunks, human.parse_size(self.config.options.body_spill_size))
+
     def __call__(self):
         if self.mode == HTTPMode.transparent:
             self.__initial_server_tls = self.server_tls
@@ -193,6 +203,7 @@ class HttpLayer(base.Layer):
 
         try:
             self.set_server((f.request.host, f.request.port))
+            self.prefetch_cert(f.request.host, f.request.port)
 
             if f.response:
                 resp = f.response
@@ -216,6 +227,18 @@ class HttpLayer(base.Layer):
 
         return False
 
+    def prefetch_cert(self, host, port):
+        """
+        Start generating the certificate for an intercepted CONNECT request
+        while the client is busy with our response and its ClientHello.
+        We can only predict the certificate if it does not depend on the
+        upstream certificate.
+        """
+        if self.config.options.upstream_cert or self.config.check_ignore((host, port)):
+            return
+        host = host.encode("idna")
+        self.config.certstore.prefetch(host, [host], self.config.options.cert_key_type)
+
     def handle_upstream_connect(self, f):
         # if the user specifies a response in the http_connect hook, we do not connect upstream here.
         # https://github.com/mitmproxy/mitmproxy/pull/2473
@@ -279,7 +302,7 @@ class HttpLayer(base.Layer):
             if f.request.stream:
                 f.request.data.content = None
             else:
-                f.request.data.content = b"".join(self.read_request_body(request))
+                f.request.data.content = self._read_body(self.read_request_body(request))
             request.timestamp_end = time.time()
         except exceptions.HttpException as e:
             # We optimistically guess there might be an HTTP client on the
@@ -326,7 +349,7 @@ class HttpLayer(base.Layer):
                 self.channel.ask("websocket_handshake", f)
 
             if not f.response:
-                self.establish_server_connection(
+                reused = self.establish_server_connection(
                     f.request.host,
                     f.request.port,
                     f.request.scheme
@@ -360,6 +383,7 @@ class HttpLayer(base.Layer):
                     self.disconnect()
                     self.connect()
                     self.send_request_headers(f.request)
+                    reused = False
 
                 # This is taken out of the try except block because when streaming
                 # we can't send the request body while retrying as the generator gets exhausted
@@ -369,9 +393,22 @@ class HttpLayer(base.Layer):
                         chunks = f.request.stream(chunks)
                     self.send_request_body(f.request, chunks)
                 else:
-                    self.send_request_body(f.request, [f.request.data.content])
+                    self.send_request_body(f.request, spool.iter_chunks(f.request.data.content))
 
-                f.response = self.read_response_headers()
+                try:
+                    f.response = self.read_response_headers()
+                except exceptions.HttpReadDisconnect:
+                    # A pooled connection may have been closed by the server
+                    # just before we reused it. Retry idempotent requests on
+                    # a new connection.
+                    if not (reused and f.request.method in IDEMPOTENT_METHODS and not f.request.stream):
+                        raise
+                    self.log("Pooled server connection closed, retrying request", "debug")
+                    self.disconnect()
+                    self.connect()
+                    self.send_request_headers(f.request)
+                    self.send_request_body(f.request, spool.iter_chunks(f.request.data.content))
+                    f.response = self.read_response_headers()
 
                 # call the appropriate script hook - this is an opportunity for
                 # an inline script to set f.stream = True
@@ -380,7 +417,7 @@ class HttpLayer(base.Layer):
                 if f.response.stream:
                     f.response.data.content = None
                 else:
-                    f.response.data.content = b"".join(
+                    f.response.data.content = self._read_body(
                         self.read_response_body(f.request, f.response)
                     )
                 f.response.timestamp_end = time.time()
@@ -417,6 +454,19 @@ class HttpLayer(base.Layer):
             if self.check_close_connection(f):
                 return False
 
+            if (
+                self.mode is not HTTPMode.upstream and
+                f.server_conn is self.server_conn and
+                self.server_conn.connected() and
+                f.response.status_code != 101 and
+                self.server_conn.alpn_proto_negotiated in (None, b"", b"http/1.1")
+            ):
+                # The exchange is complete and the server keeps the connection
+                # open, so other clients may reuse it once we are done.
+                key = self.server_pool_key_for(self.server_conn.address, self.server_tls)
+                if key is not None:
+                    self.release_server(key)
+
             # Handle 101 Switching Protocols
             if f.response.status_code == 101:
                 # Handle a successful HTTP 101 Switching Protocols Response,
@@ -471,8 +521,13 @@ class HttpLayer(base.Layer):
             self.log("Changing upstream proxy to {} (not CONNECTed)".format(repr(address)), "debug")
             self.set_server(address)
 
-    def establish_server_connection(self, host: str, port: int, scheme: str):
+    def establish_server_connection(self, host: str, port: int, scheme: str) -> bool:
+        """
+        Returns:
+            True, if an idle connection from the upstream connection pool is used.
+        """
         tls = (scheme == "https")
+        reused = False
 
         if self.mode is HTTPMode.regular or self.mode is HTTPMode.transparent:
             # If there's an existing connection that doesn't match our expectations, kill it.
@@ -482,9 +537,32 @@ class HttpLayer(base.Layer):
                 self.set_server_tls(tls, address[0])
             # Establish connection is neccessary.
             if not self.server_conn.connected():
-                self.connect()
+                reused = self.reuse_server(self.server_pool_key_for(address, tls))
+                if not reused:
+                    self.connect()
+            self.release_server(None)
         else:
             if not self.server_conn.connected():
                 self.connect()
             if tls:
                 raise exceptions.HttpProtocolException("Cannot change scheme in upstream proxy mode.")
+        return reused
+
+    def server_pool_key_for(self, address, tls):
+        """
+        The upstream connection pool key for connections to address. Pooled
+        connections must match the TLS settings we would use for a new
+        connection, as well as the ALPN protocol negotiated with the client.
+        """
+        if self.config.options.spoof_source_address:
+            # The source address is the client's.
+            return None
+        if tls:
+            return (
+                address,
+                True,
+                self.server_sni,
+                self.client_conn.get_alpn_proto_negotiated(),
+                self.config.client_certs,
+            )
+        return address, False
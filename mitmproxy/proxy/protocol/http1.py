@@ -1,6 +1,7 @@
 from mitmproxy import http
 from mitmproxy.proxy.protocol import http as httpbase
 from mitmproxy.net.http import http1
+from mitmproxy.net.http.http1 import read as http1_read
 from mitmproxy.utils import human
 
 
@@ -15,12 +16,21 @@ class Http1Layer(httpbase._HttpTransmissionLayer):
             http1.read_request_head(self.client_conn.rfile)
         )
 
+    @staticmethod
+    def _max_chunk_size(message):
+        # Streamed bodies are passed on chunk by chunk, so keep those chunks small.
+        # Everything else is joined anyway and can be read in larger chunks.
+        if message.stream:
+            return http1_read.MIN_CHUNK_SIZE
+        return http1_read.MAX_CHUNK_SIZE
+
     def read_request_body(self, request):
         expected_size = http1.expected_http_body_size(request)
         return http1.read_body(
             self.client_conn.rfile,
             expected_size,
-            human.parse_size(self.config.options.body_size_limit)
+            human.parse_size(self.config.options.body_size_limit),
+            self._max_chunk_size(request)
         )
 
     def send_request_headers(self, request):
@@ -46,18 +56,23 @@ class Http1Layer(httpbase._HttpTransmissionLayer):
         return http1.read_body(
             self.server_conn.rfile,
             expected_size,
-            human.parse_size(self.config.options.body_size_limit)
+            human.parse_size(self.config.options.body_size_limit),
+            self._max_chunk_size(response)
         )
 
     def send_response_headers(self, response):
         raw = http1.assemble_response_head(response)
-        self.client_conn.wfile.write(raw)
-        self.client_conn.wfile.flush()
+        # Unless the body is streamed, the head is sent together with the body.
+        self.client_conn.wfile.queue(raw)
+        if response.stream:
+            self.client_conn.wfile.flush()
 
     def send_response_body(self, response, chunks):
         for chunk in http1.assemble_body(response.headers, chunks):
-            self.client_conn.wfile.write(chunk)
-            self.client_conn.wfile.flush()
+            self.client_conn.wfile.queue(chunk)
+            if response.stream:
+                self.client_conn.wfile.flush()
+        self.client_conn.wfile.flush()
 
     def check_close_connection(self, flow):
         request_close = http1.connection_close(
@@ -1,9 +1,11 @@
+import concurrent.futures
 import struct
 from typing import Optional  # noqa
 from typing import Union
 import io
 
 from kaitaistruct import KaitaiStream
+from mitmproxy import certs  # noqa
 from mitmproxy import exceptions
 from mitmproxy.contrib.kaitaistruct import tls_client_hello
 from mitmproxy.proxy.protocol import base
@@ -215,6 +217,18 @@ DEFAULT_CLIENT_CIPHERS = (
     "!EDH-DSS-DES-CBC3-SHA:!EDH-RSA-DES-CBC3-SHA:!KRB5-DES-CBC3-SHA"
 )
 
+# Cipher suites that can be used with an ECDSA certificate. TLS 1.3 suites
+# (0x1301-0x1305) are not tied to a key type, but all TLS 1.3 clients
+# support ECDSA.
+ECDSA_CIPHER_IDS = {
+    id for id, name in CIPHER_ID_NAME_MAP.items() if "ECDSA" in name
+} | set(range(0x1301, 0x1306))
+
+
+# Seconds the client handshake waits for a server connect that runs in
+# parallel with it.
+PARALLEL_CONNECT_TIMEOUT = 30
+
 
 def is_tls_record_magic(d):
     """
@@ -273,6 +287,10 @@ class TlsClientHello:
     def cipher_suites(self):
         return self._client_hello.cipher_suites.cipher_suites
 
+    @property
+    def supports_ecdsa(self):
+        return not ECDSA_CIPHER_IDS.isdisjoint(self.cipher_suites)
+
     @property
     def sni(self):
         if self._client_hello.extensions:
@@ -341,13 +359,19 @@ class TlsLayer(base.Layer):
 
         self._custom_server_sni = custom_server_sni
         self._client_hello = None  # type: Optional[TlsClientHello]
+        # Remembered details of the server certificate, if we have seen it before.
+        self._upstream_cert_details = None  # type: Optional[certs.TUpstreamCertDetails]
+        # While the server handshake runs concurrently with the client handshake, this
+        # is set to a future for the ALPN protocol negotiated with the server.
+        self._server_done = None  # type: Optional[concurrent.futures.Future]
 
     def __call__(self):
         """
         The strategy for establishing TLS is as follows:
             First, we determine whether we need the server cert to establish ssl with the client.
             If so, we first connect to the server and then to the client.
-            If not, we only connect to the client and do the server handshake lazily.
+            If not, we only connect to the client and do the server handshake lazily,
+            or concurrently with the client handshake if upstream_parallel_connect is set.
 
         An additional complexity is that we need to mirror SNI and ALPN from the client when connecting to the server.
         We manually peek into the connection and parse the ClientHello message to obtain these values.
@@ -359,6 +383,14 @@ class TlsLayer(base.Layer):
             except exceptions.TlsProtocolException as e:
                 self.log("Cannot parse Client Hello: %s" % repr(e), "error")
 
+        if (
+            self._client_tls and self._server_tls and
+            self.config.options.upstream_cert and
+            not self.config.options.add_upstream_certs_to_client_chain and
+            self.server_conn.address
+        ):
+            self._upstream_cert_details = self.config.upstream_certs.get(self._upstream_cert_key)
+
         # Do we need to do a server handshake now?
         # There are two reasons why we would want to establish TLS with the server now:
         #  1. If we already have an existing server connection and server_tls is True,
@@ -372,14 +404,19 @@ class TlsLayer(base.Layer):
         #  2.4 The client wants to negotiate an alternative protocol in its handshake, we need to find out
         #      what is supported by the server
         #  2.5 The client did not sent a SNI value, we don't know the certificate subject.
+        #  2.6 We don't need to ask the server for 2.4 and 2.5 if we remember its certificate and ALPN choice,
+        #      unless the client gets h2: the HTTP/2 layer needs a server connection right away.
         client_tls_requires_server_connection = (
             self._server_tls and
             self.config.options.upstream_cert and
             (
                 self.config.options.add_upstream_certs_to_client_chain or
                 self._client_tls and (
-                    self._client_hello.alpn_protocols or
-                    not self._client_hello.sni
+                    self._client_hello.alpn_protocols and (
+                        not self._upstream_alpn_known or
+                        self._default_alpn(self._client_hello.alpn_protocols) == b"h2"
+                    ) or
+                    not self._client_hello.sni and not self._upstream_cert_details
                 )
             )
         )
@@ -388,8 +425,20 @@ class TlsLayer(base.Layer):
             client_tls_requires_server_connection
         )
 
+        # The server connection can be established early if the client handshake does not depend on it
+        # and we know where to connect to. Both sides then get the protocol we pick for the client
+        # without asking the server, see _default_alpn.
+        establish_server_tls_in_parallel = (
+            self._server_tls and
+            self.config.options.upstream_parallel_connect and
+            not self.config.options.add_upstream_certs_to_client_chain and
+            self.server_conn.address
+        )
+
         if self._client_tls and establish_server_tls_now:
             self._establish_tls_with_client_and_server()
+        elif self._client_tls and establish_server_tls_in_parallel:
+            self._establish_tls_with_client_and_server_in_parallel()
         elif self._client_tls:
             self._establish_tls_with_client()
         elif establish_server_tls_now:
@@ -447,18 +496,41 @@ class TlsLayer(base.Layer):
 
     @property
     def alpn_for_client_connection(self):
+        server_done = self._server_done
+        if server_done:
+            # The server handshake runs on another thread, which owns the server
+            # connection until it is done.
+            if server_done.done() and not server_done.exception():
+                return server_done.result()
+            return None
         return self.server_conn.get_alpn_proto_negotiated()
 
-    def __alpn_select_callback(self, conn_, options):
-        # This gets triggered if we haven't established an upstream connection yet.
+    @property
+    def _upstream_cert_key(self):
+        return self.server_conn.address, self.server_sni
+
+    @property
+    def _upstream_alpn_known(self):
+        # The ALPN choice is only remembered if we offered protocols to the server.
+        return bool(self._upstream_cert_details) and self._upstream_cert_details[2] is not None
+
+    def _default_alpn(self, options):
+        # The protocol we pick for the client if the server hasn't picked one yet.
         default_alpn = b'http/1.1'
 
+        if self._upstream_alpn_known and self._upstream_cert_details[2] in options:
+            return self._upstream_cert_details[2]
+        elif default_alpn in options:
+            return default_alpn
+        else:
+            return options[0]
+
+    def __alpn_select_callback(self, conn_, options):
+        # This gets triggered if we haven't established an upstream connection yet.
         if self.alpn_for_client_connection in options:
             choice = bytes(self.alpn_for_client_connection)
-        elif default_alpn in options:
-            choice = bytes(default_alpn)
         else:
-            choice = options[0]
+            choice = bytes(self._default_alpn(options))
         self.log("ALPN for client: %s" % choice, "debug")
         return choice
 
@@ -477,9 +549,65 @@ class TlsLayer(base.Layer):
 
         self._establish_tls_with_client()
 
-    def _establish_tls_with_client(self):
+    def _establish_tls_with_client_and_server_in_parallel(self):
+        # Pick the certificate up front, so that it does not depend on whether the server
+        # handshake happens to finish first.
+        cert = self._find_cert()
+        server_done = concurrent.futures.Future()  # type: concurrent.futures.Future
+
+        def establish_tls_with_server():
+            if not server_done.set_running_or_notify_cancel():
+                # We stopped waiting before a worker was free.
+                return
+            try:
+                self.ctx.connect()
+                self._establish_tls_with_server()
+            except Exception as e:
+                server_done.set_exception(e)
+            else:
+                server_done.set_result(self.server_conn.get_alpn_proto_negotiated())
+
+        self._server_done = server_done
+        self.config.connect_pool.submit(establish_tls_with_server)
+        try:
+            self._establish_tls_with_client(cert)
+        except Exception:
+            try:
+                self._wait_for_server(server_done)
+            except exceptions.ProtocolException as e:
+                # Report the client's error, which is what went wrong first.
+                self.log("Parallel server connect failed: {}".format(e), "debug")
+            raise
+        self._wait_for_server(server_done)
+
+    def _wait_for_server(self, server_done):
+        def disconnect_late(f):
+            if not f.exception() and self.server_conn.connected():
+                self.disconnect()
+
+        try:
+            server_done.result(PARALLEL_CONNECT_TIMEOUT)
+        except concurrent.futures.TimeoutError:
+            if not server_done.cancel():
+                # The worker still owns the server connection, let it close the
+                # connection once it is done with it.
+                server_done.add_done_callback(disconnect_late)
+                raise exceptions.ProtocolException(
+                    "Timed out connecting to {}:{}".format(*self.server_conn.address)
+                )
+            self.log("Parallel server connect did not start in time", "debug")
+        except exceptions.ProtocolException as e:
+            # The connection is retried when it is first needed, which reports
+            # errors the same way as if we hadn't connected early.
+            self.log("Parallel server connect failed: {}".format(e), "debug")
+            if self.server_conn.connected():
+                self.disconnect()
+        finally:
+            self._server_done = None
+
+    def _establish_tls_with_client(self, cert=None):
         self.log("Establish TLS with client", "debug")
-        cert, key, chain_file = self._find_cert()
+        cert, key, chain_file = cert or self._find_cert()
 
         if self.config.options.add_upstream_certs_to_client_chain:
             extra_certs = self.server_conn.server_certs
@@ -514,6 +642,8 @@ class TlsLayer(base.Layer):
         self.log("Establish TLS with server", "debug")
         try:
             alpn = None
+            # Whether the server's ALPN choice is dictated by the client connection.
+            alpn_forced = False
             if self._client_tls:
                 if self._client_hello.alpn_protocols:
                     # We only support http/1.1 and h2.
@@ -524,7 +654,13 @@ class TlsLayer(base.Layer):
                 if alpn and b"h2" in alpn and not self.config.options.http2:
                     alpn.remove(b"h2")
 
-            if self.client_conn.ssl_established and self.client_conn.get_alpn_proto_negotiated():
+            if self._server_done:
+                # The client handshake runs concurrently and won't wait for the server's choice,
+                # so we only offer the protocol the client will get.
+                if self._client_hello.alpn_protocols:
+                    alpn = [self._default_alpn(self._client_hello.alpn_protocols)]
+                    alpn_forced = True
+            elif self.client_conn.ssl_established and self.client_conn.get_alpn_proto_negotiated():
                 # If the client has already negotiated an ALP, then force the
                 # server to use the same. This can only happen if the host gets
                 # changed after the initial connection was established. E.g.:
@@ -534,6 +670,7 @@ class TlsLayer(base.Layer):
                 #   * but after the server_conn change, the new host offers h2
                 #   * which results in garbage because the layers don' match.
                 alpn = [self.client_conn.get_alpn_proto_negotiated()]
+                alpn_forced = True
 
             ciphers_server = self.config.options.ciphers_server
             if not ciphers_server and self._client_tls:
@@ -553,11 +690,20 @@ class TlsLayer(base.Layer):
                 ca_pemfile=self.config.options.ssl_verify_upstream_trusted_ca,
                 cipher_list=ciphers_server,
                 alpn_protos=alpn,
+                session_cache=self.config.tls_sessions,
             )
+            if self.server_conn.tls_session_resumed:
+                self.log("Resumed TLS session with server", "debug")
             tls_cert_err = self.server_conn.ssl_verification_error
             if tls_cert_err is not None:
                 self.log(str(tls_cert_err), "warn")
                 self.log("Ignoring server verification error, continuing with connection", "warn")
+            if self.config.options.upstream_cert and not alpn_forced:
+                self.config.upstream_certs.put(
+                    self._upstream_cert_key,
+                    self.server_conn.cert,
+                    self.server_conn.get_alpn_proto_negotiated() if alpn else None
+                )
         except exceptions.InvalidCertificateException as e:
             raise exceptions.InvalidServerCertificate(str(e))
         except exceptions.TlsException as e:
@@ -570,8 +716,8 @@ class TlsLayer(base.Layer):
                 )
             )
 
-        proto = self.alpn_for_client_connection.decode() if self.alpn_for_client_connection else '-'
-        self.log("ALPN selected by server: {}".format(proto), "debug")
+        alpn = self.server_conn.get_alpn_proto_negotiated()
+        self.log("ALPN selected by server: {}".format(alpn.decode() if alpn else '-'), "debug")
 
     def _find_cert(self):
         """
@@ -594,11 +740,14 @@ class TlsLayer(base.Layer):
             self.config.options.upstream_cert
         )
         if use_upstream_cert:
-            upstream_cert = self.server_conn.cert
-            sans.update(upstream_cert.altnames)
-            if upstream_cert.cn:
+            upstream_cn, upstream_altnames = self.server_conn.cert.cn, self.server_conn.cert.altnames
+        elif self._upstream_cert_details:
+            upstream_cn, upstream_altnames, _ = self._upstream_cert_details
+        if use_upstream_cert or self._upstream_cert_details:
+            sans.update(upstream_altnames)
+            if upstream_cn:
                 sans.add(host)
-                host = upstream_cert.cn.decode("utf8").encode("idna")
+                host = upstream_cn.decode("utf8").encode("idna")
         # Also add SNI values.
         if self._client_hello.sni:
             sans.add(self._client_hello.sni.encode("idna"))
@@ -609,4 +758,9 @@ class TlsLayer(base.Layer):
         # In other words, the Common Name is irrelevant then.
         if host:
             sans.add(host)
-        return self.config.certstore.get_cert(host, list(sans))
+
+        # Fall back to RSA for clients that can't use ECDSA certificates.
+        key_type = self.config.options.cert_key_type
+        if key_type == "ecdsa" and not (self._client_hello and self._client_hello.supports_ecdsa):
+            key_type = "rsa"
+        return self.config.certstore.get_cert(host, list(sans), key_type)
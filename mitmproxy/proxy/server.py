@@ -41,6 +41,7 @@ class ProxyServer(tcp.TCPServer):
             Raises ServerException if there's a startup problem.
         """
         self.config = config
+        self.request_queue_size = config.options.listen_backlog
         try:
             super().__init__(
                 (config.options.listen_host, config.options.listen_port)
@@ -55,8 +56,51 @@ class ProxyServer(tcp.TCPServer):
             ) from e
         self.channel = None  # type: controller.Channel
 
+    @property
+    def reuse_port(self):
+        return self.config.options.workers > 1
+
+    @property
+    def connection_limit(self):
+        return self.config.options.connection_limit
+
+    @property
+    def connection_queue_size(self):
+        return self.config.options.connection_queue_size
+
+    @property
+    def connection_overflow(self):
+        return self.config.options.connection_overflow
+
     def set_channel(self, channel):
         self.channel = channel
+        self.config.upstream_pool.channel = channel
+
+    def handle_shutdown(self):
+        self.config.upstream_pool.clear()
+        self.config.certstore.shutdown(wait=False)
+
+    def handle_overload(self, conn, client_address):
+        if self.channel:
+            self.channel.tell("log", log.LogEntry(
+                "{}: connection limit reached ({} active, {} queued), "
+                "rejecting connection ({} rejected so far)".format(
+                    human.format_address(client_address),
+                    self.active_connections,
+                    self.queued_connections,
+                    self.rejected_connections,
+                ),
+                "warn"
+            ))
+        # Clients in the other modes may speak TLS or some other protocol
+        # first, so they would only see garbage.
+        mode = self.config.options.mode
+        if mode == "regular" or mode.startswith("upstream:"):
+            try:
+                error_response = http.make_error_response(503, "Proxy connection limit reached.")
+                conn.sendall(http1.assemble_response(error_response))
+            except OSError:
+                pass
 
     def handle_client_connection(self, conn, client_address):
         h = ConnectionHandler(
@@ -68,6 +112,13 @@ class ProxyServer(tcp.TCPServer):
         h.handle()
 
 
+class AsyncProxyServer(ProxyServer, tcp.AsyncTCPServer):
+    """
+        A ProxyServer that parks idle client connections on an asyncio event
+        loop instead of starting one thread per accepted connection.
+    """
+
+
 class ConnectionHandler:
 
     def __init__(self, client_conn, client_address, config, channel):
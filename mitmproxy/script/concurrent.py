@@ -1,14 +1,60 @@
 """
 This module provides a @concurrent decorator primitive to
 offload computations from mitmproxy's main master thread.
+
+Decorated hooks run on a shared pool of threads, sized by the
+concurrent_threads option. At most concurrent_queue_size invocations wait
+for a free thread; beyond that, each invocation gets a thread of its own,
+so that the master never blocks on the pool. The ScriptLoader addon applies
+both options to the pool.
 """
+import threading
+import time
+import traceback
+import typing  # noqa
 
+from mitmproxy import ctx
 from mitmproxy import eventsequence
+from mitmproxy import log
+from mitmproxy.net import tcp
 from mitmproxy.types import basethread
 
 
-class ScriptThread(basethread.BaseThread):
-    name = "ScriptThread"
+class HookStats:
+    """
+        Queue wait and run times of a @concurrent hook, in seconds.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_run = 0.0
+        self.max_run = 0.0
+
+    def add(self, wait, run):
+        with self.lock:
+            self.count += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            self.total_run += run
+            self.max_run = max(self.max_run, run)
+
+    def __str__(self):
+        return "{} calls, wait {:.1f}ms avg, {:.1f}ms max, run {:.1f}ms avg, {:.1f}ms max".format(
+            self.count,
+            self.total_wait / self.count * 1000 if self.count else 0,
+            self.max_wait * 1000,
+            self.total_run / self.count * 1000 if self.count else 0,
+            self.max_run * 1000,
+        )
+
+
+pool = tcp.WorkerPool("script.concurrent", max_workers=16, max_queue=100)
+stats = {}  # type: typing.Dict[str, HookStats]
 
 
 def concurrent(fn):
@@ -16,19 +62,38 @@ def concurrent(fn):
         raise NotImplementedError(
             "Concurrent decorator not supported for '%s' method." % fn.__name__
         )
+    hook_stats = stats.setdefault(
+        "%s.%s" % (fn.__module__, fn.__qualname__), HookStats()
+    )
 
     def _concurrent(obj):
-        def run():
-            fn(obj)
-            if obj.reply.state == "taken":
-                if not obj.reply.has_message:
-                    obj.reply.ack()
-                obj.reply.commit()
+        master = ctx.master
+
+        def run(submitted):
+            start = time.monotonic()
+            try:
+                fn(obj)
+            except Exception:
+                # The master's log is not thread-safe, send the error through
+                # the event queue.
+                msg = "Addon error: %s" % traceback.format_exc()
+                master.tell("log", log.LogEntry(msg, "error"))
+            finally:
+                if obj.reply.state == "taken":
+                    if not obj.reply.has_message:
+                        obj.reply.ack()
+                    obj.reply.commit()
+            hook_stats.add(start - submitted, time.monotonic() - start)
         obj.reply.take()
-        ScriptThread(
-            "script.concurrent (%s)" % fn.__name__,
-            target=run
-        ).start()
+        submitted = time.monotonic()
+        if not pool.try_submit(run, submitted):
+            # Blocking here could deadlock: the hooks in the pool may be
+            # waiting for the master themselves.
+            basethread.BaseThread(
+                "script.concurrent (%s)" % fn.__name__,
+                target=run,
+                args=(submitted,)
+            ).start()
     # Support @concurrent for class-based addons
     if "." in fn.__qualname__:
         return staticmethod(_concurrent)
@@ -68,6 +68,9 @@ def common_options(parser, opts):
     opts.make_parser(group, "listen_host", metavar="HOST")
     opts.make_parser(group, "listen_port", metavar="PORT", short="p")
     opts.make_parser(group, "server", short="n")
+    opts.make_parser(group, "server_event_loop")
+    opts.make_parser(group, "connection_limit", metavar="N")
+    opts.make_parser(group, "connection_overflow")
     opts.make_parser(group, "ignore_hosts", metavar="HOST")
     opts.make_parser(group, "tcp_hosts", metavar="HOST")
     opts.make_parser(group, "upstream_auth", metavar="USER:PASS")
@@ -119,6 +122,7 @@ def mitmdump(opts):
 
     common_options(parser, opts)
     opts.make_parser(parser, "flow_detail", metavar = "LEVEL")
+    opts.make_parser(parser, "workers", metavar = "N")
     parser.add_argument(
         'filter_args',
         nargs="...",
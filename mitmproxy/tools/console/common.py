@@ -220,9 +220,9 @@ def format_flow(f, focus, extended=False, hostheader=False, max_url_len=False):
         marked = f.marked,
     )
     if f.response:
-        if f.response.raw_content:
-            contentdesc = human.pretty_size(len(f.response.raw_content))
-        elif f.response.raw_content is None:
+        if f.response.raw_content_view:
+            contentdesc = human.pretty_size(len(f.response.raw_content_view))
+        elif f.response.raw_content_view is None:
             contentdesc = "[content missing]"
         else:
             contentdesc = "[no content]"
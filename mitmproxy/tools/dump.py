@@ -2,6 +2,7 @@ from mitmproxy import addons
 from mitmproxy import options
 from mitmproxy import master
 from mitmproxy.addons import dumper, termlog, termstatus, keepserving, readfile
+from mitmproxy.tools import workers
 
 
 class ErrorCheck:
@@ -20,11 +21,16 @@ class DumpMaster(master.Master):
         options: options.Options,
         with_termlog=True,
         with_dumper=True,
+        with_workers=True,
     ) -> None:
         super().__init__(options)
         self.errorcheck = ErrorCheck()
         if with_termlog:
             self.addons.add(termlog.TermLog(), termstatus.TermStatus())
+        if with_workers:
+            # Must come before the output addons, so that flows collected
+            # while shutting down are written before they are closed.
+            self.addons.add(workers.Workers())
         self.addons.add(*addons.default_addons())
         if with_dumper:
             self.addons.add(dumper.Dumper())
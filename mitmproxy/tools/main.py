@@ -15,6 +15,7 @@ import signal  # noqa
 import typing  # noqa
 
 from mitmproxy.tools import cmdline  # noqa
+from mitmproxy.tools import workers  # noqa
 from mitmproxy import exceptions, master  # noqa
 from mitmproxy import options  # noqa
 from mitmproxy import optmanager  # noqa
@@ -87,9 +88,19 @@ def run(
         unknown = optmanager.load_paths(opts, args.conf)
         pconf = process_options(parser, opts, args)
         server = None  # type: typing.Any
-        if pconf.options.server:
+        if pconf.options.server and pconf.options.workers > 1:
+            if not master.addons.get("workers"):
+                raise exceptions.OptionsError(
+                    "Multiple workers are only supported by mitmdump."
+                )
+            server = workers.WorkerServer(pconf)
+        elif pconf.options.server:
+            if pconf.options.server_event_loop:
+                server_cls = proxy.server.AsyncProxyServer
+            else:
+                server_cls = proxy.server.ProxyServer
             try:
-                server = proxy.server.ProxyServer(pconf)
+                server = server_cls(pconf)
             except exceptions.ServerException as v:
                 print(str(v), file=sys.stderr)
                 sys.exit(1)
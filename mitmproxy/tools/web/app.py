@@ -48,9 +48,9 @@ def flow_to_json(flow: mitmproxy.flow.Flow) -> dict:
 
     if isinstance(flow, http.HTTPFlow):
         if flow.request:
-            if flow.request.raw_content:
-                content_length = len(flow.request.raw_content)
-                content_hash = hashlib.sha256(flow.request.raw_content).hexdigest()
+            if flow.request.raw_content_view:
+                content_length = len(flow.request.raw_content_view)
+                content_hash = hashlib.sha256(flow.request.raw_content_view).hexdigest()
             else:
                 content_length = None
                 content_hash = None
@@ -70,9 +70,9 @@ def flow_to_json(flow: mitmproxy.flow.Flow) -> dict:
                 "pretty_host": flow.request.pretty_host,
             }
         if flow.response:
-            if flow.response.raw_content:
-                content_length = len(flow.response.raw_content)
-                content_hash = hashlib.sha256(flow.response.raw_content).hexdigest()
+            if flow.response.raw_content_view:
+                content_length = len(flow.response.raw_content_view)
+                content_hash = hashlib.sha256(flow.response.raw_content_view).hexdigest()
             else:
                 content_length = None
                 content_hash = None
@@ -0,0 +1,193 @@
+"""
+    Multi-process mode for mitmdump.
+
+    With the workers option set to N > 1, mitmdump starts N worker processes
+    that bind the listen port with SO_REUSEPORT, so that the kernel spreads
+    incoming connections across them. Each worker runs a complete addon
+    chain. Completed flows and log messages are sent to the main process,
+    which feeds them to its terminal output and save stream in the order
+    they arrive, so that there is a single output for all workers.
+"""
+import multiprocessing
+import os
+import queue
+import signal
+import sys
+import time
+import typing  # noqa
+
+from mitmproxy import controller
+from mitmproxy import ctx
+from mitmproxy import eventsequence
+from mitmproxy import exceptions
+from mitmproxy import io
+from mitmproxy import log
+from mitmproxy import options
+from mitmproxy import optmanager
+from mitmproxy.proxy import config
+from mitmproxy.proxy import server
+
+
+class WorkerServer(server.DummyServer):
+    """
+        Stands in for the proxy server in the main process. The listen port
+        is served by the worker processes.
+    """
+    bound = True
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.address = (config.options.listen_host or "*", config.options.listen_port)
+
+
+class Forward:
+    """
+        Runs in a worker process and sends completed flows and log messages
+        to the main process.
+    """
+    def __init__(self, q):
+        self.queue = q
+
+    def send_flow(self, f):
+        self.queue.put(("flow", f.get_state()))
+
+    def log(self, e):
+        if log.log_tier(ctx.options.verbosity) >= log.log_tier(e.level):
+            self.queue.put(("log", e.msg, e.level))
+
+    def response(self, f):
+        self.send_flow(f)
+
+    def error(self, f):
+        # Flows with a response have already been sent.
+        if not f.response:
+            self.send_flow(f)
+
+    def tcp_end(self, f):
+        self.send_flow(f)
+
+    def websocket_end(self, f):
+        self.send_flow(f)
+
+
+def run_worker(master_cls, opts_text, q):  # pragma: no cover
+    opts = options.Options()
+    m = master_cls(opts, with_termlog=False, with_dumper=False, with_workers=False)
+    m.addons.add(Forward(q))
+    try:
+        state = optmanager.parse(opts_text)
+        # The main process owns the save stream and reads flow files.
+        state.update(save_stream_file=None, rfile=None)
+        unknown = opts.update_known(**state)
+        # Options registered by scripts are only known once they are loaded.
+        opts.update_known(**unknown)
+        pconf = config.ProxyConfig(opts)
+        if opts.server_event_loop:
+            server_cls = server.AsyncProxyServer
+        else:
+            server_cls = server.ProxyServer
+        m.server = server_cls(pconf)
+    except (exceptions.OptionsError, exceptions.ServerException) as e:
+        q.put(("log", str(e), "error"))
+        sys.exit(1)
+    m.addons.trigger("configure", opts.keys())
+
+    def cleankill(*args, **kwargs):
+        m.shutdown()
+
+    signal.signal(signal.SIGTERM, cleankill)
+    try:
+        m.run()
+    except KeyboardInterrupt:
+        pass
+
+
+class Workers:
+    """
+        Starts the worker processes and collects their flows and log
+        messages. Flows are only passed to the output addons, as the workers
+        have already run them through their own addon chains.
+    """
+    sinks = ("save", "dumper")
+    shutdown_timeout = 5
+
+    def __init__(self):
+        self.queue = None  # type: multiprocessing.Queue
+        self.processes = []  # type: typing.List[multiprocessing.Process]
+        self.exited = set()  # type: typing.Set[multiprocessing.Process]
+
+    def running(self):
+        if ctx.options.server and ctx.options.workers > 1:
+            self.start(ctx.options.workers)
+
+    def start(self, n):
+        # Spawn fresh interpreters rather than forking, so that the workers
+        # don't inherit our threads, open files and addon state.
+        mp = multiprocessing.get_context("spawn")
+        self.queue = mp.Queue()
+        opts_text = optmanager.serialize(ctx.options, None)
+        for i in range(n):
+            p = mp.Process(
+                target=run_worker,
+                args=(type(ctx.master), opts_text, self.queue),
+                name="mitmdump worker {}".format(i),
+                daemon=True,
+            )
+            p.start()
+            self.processes.append(p)
+        ctx.log.info("Started {} worker processes.".format(n))
+
+    def collect(self):
+        while True:
+            try:
+                msg = self.queue.get_nowait()
+            except queue.Empty:
+                return
+            if msg[0] == "flow":
+                self.output(msg[1])
+            else:
+                ctx.log(msg[1], msg[2])
+
+    def output(self, state):
+        f = io.FLOW_TYPES[state["type"]].from_state(state)
+        f.reply = controller.DummyReply()
+        sinks = [ctx.master.addons.get(i) for i in self.sinks]
+        for e, o in eventsequence.iterate(f):
+            for a in sinks:
+                if a:
+                    ctx.master.addons.invoke_addon(a, e, o)
+
+    def tick(self):
+        if not self.processes:
+            return
+        self.collect()
+        for p in self.processes:
+            if p.exitcode is not None and p not in self.exited:
+                self.exited.add(p)
+                ctx.log.error(
+                    "Worker process {} exited with code {}.".format(p.pid, p.exitcode)
+                )
+        if len(self.exited) == len(self.processes):
+            ctx.master.shutdown()
+
+    def done(self):
+        if not self.processes:
+            return
+        for p in self.processes:
+            if p.is_alive():
+                p.terminate()
+        # Keep draining the queue while the workers shut down, they can
+        # only exit once their queued messages have been consumed.
+        deadline = time.time() + self.shutdown_timeout
+        while any(p.is_alive() for p in self.processes):
+            self.collect()
+            if time.time() > deadline:
+                for p in self.processes:
+                    if p.is_alive():
+                        os.kill(p.pid, signal.SIGKILL)
+            time.sleep(0.01)
+        self.collect()
+        for p in self.processes:
+            p.join()
+        self.processes = []
+        self.exited = set()
@@ -157,12 +157,76 @@ class _MultiDict(MutableMapping, metaclass=ABCMeta):
 
 
 class MultiDict(_MultiDict, serializable.Serializable):
+    """
+    A MultiDict that keeps an index of where each key occurs in .fields,
+    so that lookups don't have to scan all fields.
+    The index is rebuilt lazily whenever .fields has been replaced.
+    """
+    # The .fields tuple the index was built for, and the index itself,
+    # mapping canonical keys to the positions of their fields in order.
+    _index_fields = None
+    _index = None
+
     def __init__(self, fields=()):
         super().__init__()
         self.fields = tuple(
             tuple(i) for i in fields
         )
 
+    def _get_index(self):
+        fields = self.fields
+        if self._index_fields is not fields:
+            index = {}
+            kconv = self._kconv
+            for i, (k, _) in enumerate(fields):
+                index.setdefault(kconv(k), []).append(i)
+            self._index = index
+            self._index_fields = fields
+        return self._index
+
+    def __contains__(self, key):
+        return self._kconv(key) in self._get_index()
+
+    def __delitem__(self, key):
+        positions = self._get_index().get(self._kconv(key))
+        if not positions:
+            raise KeyError(key)
+        positions = set(positions)
+        self.fields = tuple(
+            field for i, field in enumerate(self.fields)
+            if i not in positions
+        )
+
+    def __iter__(self):
+        fields = self.fields
+        for positions in self._get_index().values():
+            yield fields[positions[0]][0]
+
+    def __len__(self):
+        return len(self._get_index())
+
+    def get_all(self, key):
+        fields = self.fields
+        return [
+            fields[i][1]
+            for i in self._get_index().get(self._kconv(key), ())
+        ]
+
+    def set_all(self, key, values):
+        positions = self._get_index().get(self._kconv(key), ())
+        new_fields = list(self.fields)
+        for i, value in zip(positions, values):
+            new_fields[i] = (new_fields[i][0], value)
+        if len(positions) > len(values):
+            removed = set(positions[len(values):])
+            new_fields = [
+                field for i, field in enumerate(new_fields)
+                if i not in removed
+            ]
+        for value in values[len(positions):]:
+            new_fields.append((key, value))
+        self.fields = tuple(new_fields)
+
     @staticmethod
     def _reduce_values(values):
         return values[0]
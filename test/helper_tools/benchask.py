@@ -0,0 +1,82 @@
+# Measure the round-trip latency of Channel.ask, i.e. the time a connection
+# thread waits for the master to handle an event and commit the reply.
+#
+# A number of threads, standing in for connection threads, ask the master
+# concurrently. The master runs its regular event loop with a single addon
+# that handles the event.
+#
+# Requirements:
+# - pip install click
+#
+# Example:
+#   python benchask.py --threads 1,10,100 --asks 2000
+
+import statistics
+import threading
+import time
+
+import click
+
+from mitmproxy import controller
+from mitmproxy import master
+from mitmproxy import options
+
+
+class Handler:
+    def request(self, m):
+        pass
+
+
+class Msg:
+    pass
+
+
+def asker(channel, asks, latencies):
+    m = Msg()
+    for _ in range(asks):
+        start = time.perf_counter()
+        channel.ask("request", m)
+        latencies.append(time.perf_counter() - start)
+
+
+def run(threads, asks):
+    m = master.Master(options.Options())
+    m.addons.add(Handler())
+    channel = controller.Channel(m.event_queue, m.should_exit, m.addons.handles)
+    mt = threading.Thread(target=m.run, daemon=True)
+    mt.start()
+
+    latencies = []  # list.append is thread-safe
+    workers = [
+        threading.Thread(target=asker, args=(channel, asks, latencies))
+        for _ in range(threads)
+    ]
+    start = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    duration = time.perf_counter() - start
+    m.should_exit.set()
+    mt.join()
+
+    latencies.sort()
+    return dict(
+        rate=len(latencies) / duration,
+        median=statistics.median(latencies) * 1e6,
+        p99=latencies[int(len(latencies) * 0.99)] * 1e6,
+    )
+
+
+@click.command()
+@click.option('--threads', default="1,10,100", help="Comma-separated numbers of asking threads")
+@click.option('--asks', default=2000, type=click.INT, help="Asks per thread")
+def main(threads, asks):
+    print("{:>8} {:>12} {:>12} {:>12}".format("threads", "asks/s", "median (us)", "p99 (us)"))
+    for n in [int(x) for x in threads.split(",")]:
+        r = run(n, max(asks // n, 10))
+        print("{:>8} {:>12.0f} {:>12.1f} {:>12.1f}".format(n, r["rate"], r["median"], r["p99"]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+# Measure HTTP/1 body relay throughput.
+#
+# A sender thread writes a body of the given size into one socket pair, the
+# relay reads it with http1.read_body and writes every chunk into a second
+# socket pair, and a sink thread drains it. This is what mitmproxy does for
+# streamed bodies, minus parsing the head. Each size is relayed once with
+# fixed 4 KiB chunks (the previous behaviour) and once with adaptive chunks.
+#
+# Requirements:
+# - pip install click
+#
+# Example:
+#   python benchbody.py --sizes 1m,16m,256m,1g
+
+import socket
+import threading
+import time
+
+import click
+
+from mitmproxy.net import tcp
+from mitmproxy.net.http import http1
+from mitmproxy.net.http.http1.read import MAX_CHUNK_SIZE
+from mitmproxy.utils import human
+
+BLOCK = b"x" * (1024 * 1024)
+
+
+def send(sock, size):
+    with memoryview(BLOCK) as view:
+        while size:
+            n = min(size, len(BLOCK))
+            sock.sendall(view[:n])
+            size -= n
+    sock.shutdown(socket.SHUT_WR)
+
+
+def drain(sock):
+    buf = bytearray(1024 * 1024)
+    while sock.recv_into(buf):
+        pass
+
+
+def run(size, max_chunk_size):
+    in_a, in_b = socket.socketpair()
+    out_a, out_b = socket.socketpair()
+    sender = threading.Thread(target=send, args=(in_a, size), daemon=True)
+    sink = threading.Thread(target=drain, args=(out_b,), daemon=True)
+    rfile = tcp.Reader(socket.SocketIO(in_b, "rb"))
+    wfile = tcp.Writer(out_a)
+
+    start = time.perf_counter()
+    sender.start()
+    sink.start()
+    for chunk in http1.read_body(rfile, size, max_chunk_size=max_chunk_size):
+        wfile.write(chunk)
+    out_a.shutdown(socket.SHUT_WR)
+    sink.join()
+    elapsed = time.perf_counter() - start
+
+    for s in (in_a, in_b, out_a, out_b):
+        s.close()
+    return size / elapsed
+
+
+@click.command()
+@click.option('--sizes', default="1m,16m,256m", help="Comma-separated body sizes, e.g. 1m,1g")
+@click.option('--runs', default=3, type=click.INT, help="Runs per size, the best one counts")
+def main(sizes, runs):
+    print("{:>8} {:>10} {:>10}".format("size", "chunks", "MB/s"))
+    for size in sizes.split(","):
+        n = human.parse_size(size)
+        for label, max_chunk_size in (("4k", 4096), ("adaptive", MAX_CHUNK_SIZE)):
+            best = max(run(n, max_chunk_size) for _ in range(runs))
+            print("{:>8} {:>10} {:>10.0f}".format(size, label, best / 1024 / 1024))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+# Compare how the threaded and the event loop proxy server scale with the
+# number of concurrent client connections.
+#
+# For each connection count, we open that many idle keep-alive connections
+# to the proxy and then measure the latency of requests made on top of them.
+# The proxy runs in a separate process; we report its number of threads and
+# its resident memory.
+#
+# Requirements:
+# - Linux (for /proc)
+# - pip install click
+#
+# Example:
+#   python benchconcurrency.py --connections 100,1000,2000
+
+import http.server
+import multiprocessing
+import socket
+import socketserver
+import threading
+import time
+
+import click
+
+from mitmproxy import master
+from mitmproxy import options
+from mitmproxy import proxy
+
+
+class _Upstream(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+class _UpstreamHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+def start_upstream():
+    server = _Upstream(("127.0.0.1", 0), _UpstreamHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_proxy(server_cls, port_queue):
+    opts = options.Options(listen_host="127.0.0.1", listen_port=0)
+    m = master.Master(opts)
+    m.server = server_cls(proxy.ProxyConfig(opts))
+    port_queue.put(m.server.address[1])
+    m.run()
+
+
+def start_proxy(server_cls):
+    q = multiprocessing.Queue()
+    p = multiprocessing.Process(target=run_proxy, args=(server_cls, q), daemon=True)
+    p.start()
+    return p, q.get()
+
+
+def request(sock, upstream_port):
+    sock.sendall(
+        "GET http://127.0.0.1:{}/ HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n".format(upstream_port).encode()
+    )
+    data = b""
+    while not data.endswith(b"ok"):
+        chunk = sock.recv(4096)
+        if not chunk:
+            raise RuntimeError("connection closed")
+        data += chunk
+
+
+def proc_status(pid):
+    status = {}
+    with open("/proc/{}/status".format(pid)) as f:
+        for line in f:
+            k, v = line.split(":", 1)
+            status[k] = v.strip()
+    return int(status["Threads"]), int(status["VmRSS"].split()[0]) / 1024
+
+
+def run(server_cls, connections, active, upstream):
+    p, port = start_proxy(server_cls)
+    socks = []
+    try:
+        start = time.time()
+        for _ in range(connections):
+            socks.append(socket.create_connection(("127.0.0.1", port)))
+        connect_time = time.time() - start
+        # Let the server pick up all connections.
+        time.sleep(1)
+
+        start = time.time()
+        for s in socks[:active]:
+            request(s, upstream.server_address[1])
+        request_time = time.time() - start
+
+        threads, rss = proc_status(p.pid)
+        return dict(
+            threads=threads,
+            rss=rss,
+            connect=connect_time,
+            latency=request_time / max(active, 1) * 1000,
+        )
+    finally:
+        for s in socks:
+            s.close()
+        p.terminate()
+        p.join()
+
+
+@click.command()
+@click.option('--connections', default="100,500,1000", help="Comma-separated connection counts")
+@click.option('--active', default=50, type=click.INT, help="Connections that make a request")
+def main(connections, active):
+    upstream = start_upstream()
+    print("{:<18} {:>6} {:>8} {:>10} {:>10} {:>14}".format(
+        "server", "conns", "threads", "rss (MB)", "connect (s)", "latency (ms)"
+    ))
+    for n in [int(x) for x in connections.split(",")]:
+        for server_cls in (proxy.ProxyServer, proxy.AsyncProxyServer):
+            r = run(server_cls, n, min(active, n), upstream)
+            print("{:<18} {:>6} {:>8} {:>10.1f} {:>10.2f} {:>14.2f}".format(
+                server_cls.__name__, n, r["threads"], r["rss"], r["connect"], r["latency"]
+            ))
+
+
+if __name__ == '__main__':
+    main()
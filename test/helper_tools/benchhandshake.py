@@ -0,0 +1,80 @@
+# Measure TLS handshakes per second with and without the SSL context cache,
+# for RSA and ECDSA certificates.
+#
+# A TLS echo server with a certificate from a temporary mitmproxy CA runs in
+# a background thread. Clients connect one after another, complete the
+# handshake and exchange one line. Both the client and the server create
+# their contexts through mitmproxy.net, so both sides benefit from the cache.
+#
+# Requirements:
+# - pip install click
+#
+# Example:
+#   python benchhandshake.py --handshakes 500 --key-types rsa,ecdsa
+
+import tempfile
+import threading
+import time
+
+import click
+
+from mitmproxy import certs
+from mitmproxy.net import tcp
+from mitmproxy.net import tls
+
+
+class EchoServer(tcp.TCPServer):
+    def __init__(self, certstore, key_type):
+        super().__init__(("127.0.0.1", 0))
+        self.cert, self.key, self.chain_file = certstore.get_cert(b"example.com", [], key_type)
+        self.dhparams = certstore.dhparams
+
+    def handle_client_connection(self, connection, client_address):
+        h = tcp.BaseHandler(connection, client_address, self)
+        h.convert_to_ssl(
+            self.cert,
+            self.key,
+            chain_file=self.chain_file,
+            dhparams=self.dhparams,
+            alpn_select=b"http/1.1",
+        )
+        h.wfile.write(h.rfile.readline())
+        h.wfile.flush()
+        h.finish()
+
+
+def run(server, handshakes):
+    start = time.perf_counter()
+    for _ in range(handshakes):
+        c = tcp.TCPClient(server.address)
+        with c.connect():
+            c.convert_to_ssl(sni="example.com", alpn_protos=[b"http/1.1"])
+            c.wfile.write(b"echo\n")
+            c.wfile.flush()
+            assert c.rfile.readline() == b"echo\n"
+            c.finish()
+    return handshakes / (time.perf_counter() - start)
+
+
+@click.command()
+@click.option('--handshakes', default=500, type=click.INT, help="Handshakes per run")
+@click.option('--key-types', default="rsa,ecdsa", help="Comma-separated certificate key types")
+def main(handshakes, key_types):
+    print("{:>8} {:>8} {:>14}".format("key", "cache", "handshakes/s"))
+    with tempfile.TemporaryDirectory() as d:
+        certstore = certs.CertStore.from_store(d, "mitmproxy")
+        for key_type in key_types.split(","):
+            server = EchoServer(certstore, key_type)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            try:
+                for size in (0, 100):
+                    tls.context_cache.size = size
+                    tls.context_cache.clear()
+                    run(server, 10)  # warm up
+                    print("{:>8} {:>8} {:>14.0f}".format(key_type, size or "off", run(server, handshakes)))
+            finally:
+                server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+# Measure how many HTTP/1 request heads per second we can read from a socket.
+#
+# Each request head is written into one end of a socket pair and read from
+# the other end with http1.read_request_head, in three ways:
+#  - bytes: Byte by byte, which is what happens if we can't peek into the socket.
+#  - lines: Line by line, with every line read in one go.
+#  - bulk: The complete head in one go, which is what we do by default.
+#
+# Requirements:
+# - pip install click
+#
+# Example:
+#   python benchheaders.py --requests 20000
+
+import socket
+import time
+from unittest import mock
+
+import click
+
+from mitmproxy.net import tcp
+from mitmproxy.net.http import http1
+from mitmproxy.net.http.http1 import read as http1_read
+
+HEADS = {
+    "browser": (
+        b"GET /static/app.js?v=2 HTTP/1.1\r\n"
+        b"Host: www.example.com\r\n"
+        b"User-Agent: Mozilla/5.0 (X11; Linux x86_64; rv:60.0) Gecko/20100101 Firefox/60.0\r\n"
+        b"Accept: text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8\r\n"
+        b"Accept-Language: en-US,en;q=0.5\r\n"
+        b"Accept-Encoding: gzip, deflate, br\r\n"
+        b"Referer: https://www.example.com/\r\n"
+        b"Cookie: " + b"; ".join(b"c%d=%s" % (i, b"v" * 40) for i in range(20)) + b"\r\n"
+        b"Connection: keep-alive\r\n"
+        b"Upgrade-Insecure-Requests: 1\r\n"
+        b"Cache-Control: max-age=0\r\n"
+        b"\r\n"
+    ),
+    "api": (
+        b"POST /v1/items HTTP/1.1\r\n"
+        b"Host: api.example.com\r\n"
+        b"Authorization: Bearer " + b"t" * 120 + b"\r\n"
+        b"Content-Type: application/json\r\n"
+        b"Accept: application/json\r\n"
+        b"Content-Length: 0\r\n"
+        b"\r\n"
+    ),
+}
+
+
+class ByteReader(tcp.Reader):
+    def peek(self, length):
+        raise NotImplementedError()
+
+
+def run(head, requests, mode):
+    a, b = socket.socketpair()
+    reader_cls = ByteReader if mode == "bytes" else tcp.Reader
+    rfile = reader_cls(socket.SocketIO(b, "rb"))
+    peek_size = http1_read.HEAD_PEEK_SIZE if mode == "bulk" else 0
+    with mock.patch.object(http1_read, "HEAD_PEEK_SIZE", peek_size):
+        start = time.perf_counter()
+        for _ in range(requests):
+            a.sendall(head)
+            http1.read_request_head(rfile)
+        elapsed = time.perf_counter() - start
+    a.close()
+    b.close()
+    return requests / elapsed
+
+
+@click.command()
+@click.option('--requests', default=20000, type=click.INT, help="Request heads per run")
+def main(requests):
+    print("{:>8} {:>8} {:>14}".format("headers", "read", "requests/s"))
+    for name, head in HEADS.items():
+        for mode in ("bytes", "lines", "bulk"):
+            run(head, 100, mode)  # warm up
+            print("{:>8} {:>8} {:>14.0f}".format(name, mode, run(head, requests, mode)))
+
+
+if __name__ == '__main__':
+    main()
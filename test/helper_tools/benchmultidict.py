@@ -0,0 +1,115 @@
+# Measure header lookups with the indexed Headers against the linear scans
+# of the _MultiDict base class.
+#
+# Each run takes a parsed request's headers through the lookups a typical
+# HTTP/1 flow makes: content type, transfer encoding, host, cookie,
+# connection, expect and content length checks, plus a few updates.
+#
+# Requirements:
+# - pip install click
+#
+# Example:
+#   python benchmultidict.py --flows 20000
+
+import time
+from collections.abc import Mapping
+
+import click
+
+from mitmproxy.net.http import headers
+from mitmproxy.types import multidict
+
+
+class LinearHeaders(headers.Headers):
+    """
+    Headers as they were before the index: every operation scans all fields.
+    """
+    def __contains__(self, key):
+        return Mapping.__contains__(self, key)
+
+    def __delitem__(self, key):
+        multidict._MultiDict.__delitem__(self, headers._always_bytes(key))
+
+    def __iter__(self):
+        for x in multidict._MultiDict.__iter__(self):
+            yield headers._native(x)
+
+    def __len__(self):
+        return multidict._MultiDict.__len__(self)
+
+    def get_all(self, name):
+        return [
+            headers._native(x) for x in
+            multidict._MultiDict.get_all(self, headers._always_bytes(name))
+        ]
+
+    def set_all(self, name, values):
+        values = [headers._always_bytes(x) for x in values]
+        return multidict._MultiDict.set_all(self, headers._always_bytes(name), values)
+
+
+FIELDS = {
+    "browser": [
+        (b"Host", b"www.example.com"),
+        (b"User-Agent", b"Mozilla/5.0 (X11; Linux x86_64; rv:60.0) Gecko/20100101 Firefox/60.0"),
+        (b"Accept", b"text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8"),
+        (b"Accept-Language", b"en-US,en;q=0.5"),
+        (b"Accept-Encoding", b"gzip, deflate, br"),
+        (b"Referer", b"https://www.example.com/"),
+    ] + [
+        (b"Cookie", b"c%d=%s" % (i, b"v" * 40)) for i in range(20)
+    ] + [
+        (b"Connection", b"keep-alive"),
+        (b"Upgrade-Insecure-Requests", b"1"),
+        (b"Cache-Control", b"max-age=0"),
+    ],
+    "api": [
+        (b"Host", b"api.example.com"),
+        (b"Authorization", b"Bearer " + b"t" * 120),
+        (b"Content-Type", b"application/json"),
+        (b"Accept", b"application/json"),
+        (b"Content-Length", b"0"),
+    ],
+}
+
+
+def flow(h):
+    "content-type" in h
+    h.get("transfer-encoding", "")
+    h.get("content-length")
+    h.get("host")
+    h.get_all("cookie")
+    "connection" in h and h["connection"]
+    h.get("expect", "")
+    h.get("upgrade", "")
+    h.get("content-encoding")
+    h.get("proxy-connection")
+    "content-length" in h
+    h["via"] = "1.1 mitmproxy"
+    h.get("content-type", "")
+    h.get("connection", "")
+    h.get("transfer-encoding", "")
+    h.get("content-length")
+    if "proxy-connection" in h:
+        del h["proxy-connection"]
+
+
+def run(cls, fields, flows):
+    start = time.perf_counter()
+    for _ in range(flows):
+        flow(cls(fields))
+    return flows / (time.perf_counter() - start)
+
+
+@click.command()
+@click.option('--flows', default=20000, type=click.INT, help="Flows per run")
+def main(flows):
+    print("{:>8} {:>8} {:>10}".format("headers", "impl", "flows/s"))
+    for name, fields in FIELDS.items():
+        for label, cls in (("linear", LinearHeaders), ("indexed", headers.Headers)):
+            run(cls, fields, 100)  # warm up
+            print("{:>8} {:>8} {:>10.0f}".format(name, label, run(cls, fields, flows)))
+
+
+if __name__ == '__main__':
+    main()
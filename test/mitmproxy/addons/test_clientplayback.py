@@ -52,6 +52,35 @@ class TestClientPlayback:
             cp.stop_replay()
             assert not cp.flows
 
+    def test_playback_chained(self):
+        cp = clientplayback.ClientPlayback()
+        with taddons.context():
+            f1, f2, f3 = [tflow.tflow(resp=True) for _ in range(3)]
+            cp.start_replay([f1, f2, f3])
+            RP = "mitmproxy.proxy.protocol.http_replay.RequestReplayThread"
+            with mock.patch(RP) as rp:
+                rp.side_effect = lambda opts, f, *args: mock.Mock(f=f)
+                cp.tick()
+                assert cp.current_thread.f is f1
+                # Responses of other flows don't start the next replay.
+                cp.response(tflow.tflow(resp=True))
+                assert cp.current_thread.f is f1
+                # The next replay starts without waiting for a tick.
+                cp.response(f1)
+                assert cp.current_thread.f is f2
+                cp.error(f2)
+                assert cp.current_thread.f is f3
+                assert not cp.flows
+                cp.response(f3)
+                assert cp.current_thread.f is f3
+                assert rp.call_count == 3
+
+            cp.current_thread = mock.Mock(f=f1)
+            cp.flows = [f1]
+            f1.live = True
+            cp.response(f1)
+            assert cp.flows == [f1]
+
     def test_load_file(self, tmpdir):
         cp = clientplayback.ClientPlayback()
         with taddons.context():
@@ -40,3 +40,25 @@ def test_modes(m):
         tctx.configure(sa, mode = "reverse:http://localhost")
         with pytest.raises(Exception, match="Invalid server specification"):
             tctx.configure(sa, mode = "reverse:")
+
+
+def test_concurrent_threads():
+    sa = core_option_validation.CoreOptionValidation()
+    with taddons.context() as tctx:
+        tctx.configure(sa, concurrent_threads = 4)
+        with pytest.raises(exceptions.OptionsError, match="Invalid number of concurrent threads"):
+            tctx.configure(sa, concurrent_threads = 0)
+
+
+def test_workers():
+    sa = core_option_validation.CoreOptionValidation()
+    with taddons.context() as tctx:
+        tctx.configure(sa, workers = 4)
+        with pytest.raises(exceptions.OptionsError, match="Invalid number of workers"):
+            tctx.configure(sa, workers = 0)
+        with pytest.raises(exceptions.OptionsError, match="explicit listen port"):
+            tctx.configure(sa, workers = 2, listen_port = 0)
+        with mock.patch("socket.SO_REUSEPORT", create=True):
+            del core_option_validation.socket.SO_REUSEPORT
+            with pytest.raises(exceptions.OptionsError, match="not supported"):
+                tctx.configure(sa, workers = 2)
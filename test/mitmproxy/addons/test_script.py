@@ -105,6 +105,22 @@ class TestScript:
             sc.tick()
             assert tctx.master.has_log("Loading")
 
+    def test_reload_subscriptions(self, tmpdir):
+        with taddons.context() as tctx:
+            f = tmpdir.join("foo.py")
+            f.ensure(file=True)
+            f.write("def request(f):\n    pass\n")
+            sc = script.Script(str(f))
+            tctx.configure(sc)
+            sc.tick()
+            assert tctx.master.addons.handles("request")
+
+            f.write("def response(f):\n    pass\n")
+            sc.last_load, sc.last_mtime = 0, 0
+            sc.tick()
+            assert not tctx.master.addons.handles("request")
+            assert tctx.master.addons.handles("response")
+
     def test_exception(self):
         with taddons.context() as tctx:
             sc = script.Script(
@@ -232,6 +248,22 @@ class TestScriptLoader:
             tctx.invoke(sc, "tick")
             assert len(tctx.master.addons) == 0
 
+    def test_reorder(self):
+        rec = tutils.test_data.path("mitmproxy/data/addonscripts/recorder")
+        sc = script.ScriptLoader()
+        sc.is_running = True
+        with taddons.context() as tctx:
+            tctx.master.addons.add(sc)
+            tctx.configure(sc, scripts = ["%s/a.py" % rec, "%s/b.py" % rec])
+            tctx.master.addons.invoke_addon(sc, "tick")
+            tctx.master.addons.trigger("request", tflow.tflow())
+
+            tctx.configure(sc, scripts = ["%s/b.py" % rec, "%s/a.py" % rec])
+            tctx.master.logs = []
+            tctx.master.addons.trigger("request", tflow.tflow())
+            debug = [i.msg for i in tctx.master.logs if i.level == "debug"]
+            assert debug == ["b request", "a request"]
+
     def test_order(self):
         rec = tutils.test_data.path("mitmproxy/data/addonscripts/recorder")
         sc = script.ScriptLoader()
@@ -1,14 +1,16 @@
+import socket
 from io import BytesIO
 from unittest.mock import Mock
 import pytest
 
 from mitmproxy import exceptions
+from mitmproxy.net import tcp
 from mitmproxy.net.http import Headers
 from mitmproxy.net.http.http1.read import (
     read_request, read_response, read_request_head,
     read_response_head, read_body, connection_close, expected_http_body_size, _get_first_line,
     _read_request_line, _parse_authority_form, _read_response_line, _check_http_version,
-    _read_headers, _read_chunked, get_header_tokens
+    _read_headers, _read_chunked, get_header_tokens, _find_head_end, _read_head
 )
 from mitmproxy.test.tutils import treq, tresp
 
@@ -102,6 +104,55 @@ def test_read_response_head():
     assert rfile.read() == b"skip"
 
 
+class TestReadHead:
+    def test_find_head_end(self):
+        assert _find_head_end(b"GET / HTTP/1.1\r\n\r\nbody", True) == 18
+        assert _find_head_end(b"GET / HTTP/1.1\nfoo: bar\n\nbody", True) == 25
+        assert _find_head_end(b"\r\nGET / HTTP/1.1\r\n\r\n", True) == 20
+        assert _find_head_end(b"GET / HTTP/1.1\r\nfoo: bar\r\n", True) is None
+        assert _find_head_end(b"\r\n\r\n", True) is None
+        assert _find_head_end(b"\r\nbody", False) == 2
+        assert _find_head_end(b"foo: bar\r\n\r\n", False) == 12
+
+    def _reader(self, data):
+        a, b = socket.socketpair()
+        a.sendall(data)
+        a.close()
+        return tcp.Reader(socket.SocketIO(b, "rb"))
+
+    def test_bulk(self):
+        rfile = self._reader(
+            b"\r\n"
+            b"GET / HTTP/1.1\r\n"
+            b"Header: one\r\n"
+            b"\ttwo\r\n"
+            b"Header: three\r\n"
+            b"\r\n"
+            b"skip"
+        )
+        head = _read_head(rfile, True)
+        assert head is not rfile
+        r = read_request_head(head)
+        assert r.headers.fields == ((b"Header", b"one\r\n two"), (b"Header", b"three"))
+        assert rfile.read(-1) == b"skip"
+
+    def test_incomplete(self):
+        rfile = self._reader(b"HTTP/1.1 200 OK\r\nfoo: bar\r\n")
+        assert _read_head(rfile, True) is rfile
+        r = read_response_head(rfile)
+        assert r.headers["foo"] == "bar"
+
+    def test_errors(self):
+        rfile = self._reader(b"GET / HTTP/1.1\r\n\tfoo: bar\r\n\r\n")
+        with pytest.raises(exceptions.HttpSyntaxException):
+            read_request_head(rfile)
+        rfile = self._reader(b"")
+        with pytest.raises(exceptions.HttpReadDisconnect):
+            read_request_head(rfile)
+        rfile = tcp.Reader(BytesIO(b"GET / HTTP/1.1\r\n\r\n"))
+        assert _read_head(rfile, True) is rfile
+
+
 class TestReadBody:
     def test_chunked(self):
         rfile = BytesIO(b"3\r\nfoo\r\n0\r\n\r\nbar")
@@ -140,6 +191,14 @@ class TestReadBody:
         assert list(read_body(rfile, -1, max_chunk_size=None)) == [b"123456"]
         rfile = BytesIO(b"123456")
         assert list(read_body(rfile, -1, max_chunk_size=1)) == [b"1", b"2", b"3", b"4", b"5", b"6"]
+        rfile = BytesIO(b"1\r\na\r\n3\r\nbcd\r\n0\r\n\r\n")
+        assert list(read_body(rfile, None, max_chunk_size=2)) == [b"a", b"bc", b"d"]
+
+    def test_chunk_size_grows(self):
+        rfile = BytesIO(b"x" * 100000)
+        chunks = list(read_body(rfile, 100000, max_chunk_size=32768))
+        assert b"".join(chunks) == b"x" * 100000
+        assert [len(c) for c in chunks] == [4096, 8192, 16384, 32768, 32768, 5792]
 
 
 def test_connection_close():
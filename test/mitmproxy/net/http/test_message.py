@@ -4,6 +4,7 @@ import pytest
 
 from mitmproxy.test import tutils
 from mitmproxy.net import http
+from mitmproxy.net.http import spool
 
 
 def _test_passthrough_attr(message, attr):
@@ -54,6 +55,11 @@ class TestMessageData:
 
         assert data1 == data2
 
+    def test_spooled(self):
+        data = tutils.tresp(content=spool.spool([b"foo", b"bar"], 0), timestamp_start=42, timestamp_end=42).data
+        assert data == tutils.tresp(content=b"foobar", timestamp_start=42, timestamp_end=42).data
+        assert data.get_state()["content"] == b"foobar"
+
 
 class TestMessage:
 
@@ -88,6 +94,23 @@ class TestMessage:
         assert resp.data.content == b"bar"
         assert resp.headers["content-length"] == "0"
 
+    def test_raw_content_access(self):
+        resp = tutils.tresp(content=b"foo")
+        assert not resp.is_spooled
+        assert resp.raw_content_view == b"foo"
+        assert resp.open_raw_content().read() == b"foo"
+
+        resp.data.content = spool.spool([b"foo", b"bar"], 0)
+        assert resp.is_spooled
+        assert resp.raw_content == b"foobar"
+        assert resp.content == b"foobar"
+        assert resp.raw_content_view == b"foobar"
+        assert resp.open_raw_content().read() == b"foobar"
+
+        resp.data.content = None
+        assert resp.raw_content_view is None
+        assert resp.open_raw_content() is None
+
     def test_headers(self):
         _test_passthrough_attr(tutils.tresp(), "headers")
 
@@ -0,0 +1,70 @@
+import io
+import pickle
+
+from mitmproxy.net.http import spool
+
+
+class TestSpooledContent:
+    def test_spooled(self):
+        c = spool.spool([b"foo", b"bar", b"baz"], 4)
+        assert isinstance(c, spool.SpooledContent)
+        assert len(c) == 9
+        assert c.read() == b"foobarbaz"
+        assert c.view()[3:6] == b"bar"
+        assert c == b"foobarbaz"
+        assert b"foobarbaz" == c
+        assert c == spool.spool([b"foobarbaz"], 4)
+        assert c != b"foo"
+        assert c != 42
+        assert list(c.chunks(4)) == [b"foob", b"arba", b"z"]
+        assert c.open().read() == b"foobarbaz"
+        assert repr(c)
+
+    def test_open(self):
+        c = spool.spool([b"foo", b"bar"], 0)
+        f1, f2 = c.open(), c.open()
+        assert f1.read(3) == b"foo"
+        assert f2.read() == b"foobar"
+        assert f1.read() == b"bar"
+        f1.seek(-2, io.SEEK_END)
+        assert f1.read() == b"ar"
+        f1.seek(1)
+        assert f1.tell() == 1
+        f1.seek(1, io.SEEK_CUR)
+        assert f1.read(1) == b"o"
+        assert c.view().obj is c.view().obj
+
+    def test_close(self):
+        c = spool.spool([b"foo", b"bar"], 0)
+        assert c.read() == b"foobar"
+        m = c._mmap
+        c.close()
+        assert m.closed
+        assert c.file.closed
+
+        # Views keep the map open.
+        c = spool.spool([b"foo", b"bar"], 0)
+        v = c.view()
+        c.close()
+        assert v == b"foobar"
+
+    def test_pickle(self):
+        c = spool.spool([b"foo", b"bar"], 0)
+        assert pickle.loads(pickle.dumps(c)) == b"foobar"
+
+    def test_empty(self):
+        c = spool.SpooledContent(None, 0)
+        assert c.read() == b""
+        assert c.open().read() == b""
+        assert list(c.chunks()) == []
+
+
+def test_spool():
+    assert spool.spool([b"foo", b"bar"], None) == b"foobar"
+    assert spool.spool([b"foo", b"bar"], 6) == b"foobar"
+    assert spool.spool([], 0) == b""
+
+
+def test_iter_chunks():
+    assert list(spool.iter_chunks(b"foo")) == [b"foo"]
+    assert b"".join(spool.iter_chunks(spool.spool([b"foo", b"bar"], 0))) == b"foobar"
@@ -0,0 +1,181 @@
+import socket
+import threading
+from unittest import mock
+
+import pytest
+
+from mitmproxy.net import dns
+
+
+def addrinfo(host, port, family=0, type=0, proto=0, flags=0):
+    return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", ("10.0.0.1", port))]
+
+
+def test_interleave_families():
+    v4 = [(socket.AF_INET, 0, 0, "", ("10.0.0.%s" % i, 80)) for i in range(2)]
+    v6 = [(socket.AF_INET6, 0, 0, "", ("::%s" % i, 80, 0, 0)) for i in range(3)]
+    assert dns.interleave_families(v6 + v4) == [v6[0], v4[0], v6[1], v4[1], v6[2]]
+    assert dns.interleave_families(v6 + v4, socket.AF_INET) == [v4[0], v6[0], v4[1], v6[1], v6[2]]
+    assert dns.interleave_families(v6, socket.AF_INET) == v6
+
+
+class TestResolverCache:
+    def test_disabled(self):
+        c = dns.ResolverCache()
+        with mock.patch("socket.getaddrinfo", side_effect=addrinfo) as m:
+            c.getaddrinfo("example.com", 80)
+            c.getaddrinfo("example.com", 80)
+        assert m.call_count == 2
+        assert not len(c)
+
+    def test_cache(self):
+        c = dns.ResolverCache(size=2)
+        with mock.patch("socket.getaddrinfo", side_effect=addrinfo) as m:
+            assert c.getaddrinfo("example.com", 80) == addrinfo("example.com", 80)
+            assert c.getaddrinfo("example.com", 80) == addrinfo("example.com", 80)
+            assert m.call_count == 1
+            c.getaddrinfo("example.com", 443)
+            c.getaddrinfo("example.org", 443)
+            assert len(c) == 2
+            c.getaddrinfo("example.com", 80)
+            assert m.call_count == 4
+            # IP addresses are not cached.
+            c.getaddrinfo("127.0.0.1", 80)
+            assert m.call_count == 5
+        assert (c.hits, c.misses) == (1, 4)
+        assert repr(c)
+        c.clear()
+        assert not len(c)
+
+    def test_ttl(self):
+        c = dns.ResolverCache(size=2, ttl=10, negative_ttl=1)
+        with mock.patch("socket.getaddrinfo", side_effect=addrinfo) as m:
+            with mock.patch("time.monotonic", return_value=100):
+                c.getaddrinfo("example.com", 80)
+            with mock.patch("time.monotonic", return_value=105):
+                c.getaddrinfo("example.com", 80)
+            assert m.call_count == 1
+            with mock.patch("time.monotonic", return_value=111):
+                c.getaddrinfo("example.com", 80)
+            assert m.call_count == 2
+
+    def test_negative(self):
+        c = dns.ResolverCache(size=2, negative_ttl=10)
+        with mock.patch("socket.getaddrinfo", side_effect=socket.gaierror("nope")) as m:
+            with mock.patch("time.monotonic", return_value=100):
+                with pytest.raises(socket.gaierror) as e1:
+                    c.getaddrinfo("example.com", 80)
+                with pytest.raises(socket.gaierror) as e2:
+                    c.getaddrinfo("example.com", 80)
+            assert m.call_count == 1
+            # Each lookup raises its own copy of the cached error.
+            assert e1.value is not e2.value
+            assert e1.value.args == e2.value.args == ("nope",)
+            with mock.patch("time.monotonic", return_value=111):
+                with pytest.raises(socket.gaierror):
+                    c.getaddrinfo("example.com", 80)
+            assert m.call_count == 2
+
+    def test_other_error(self):
+        c = dns.ResolverCache(size=2)
+        with mock.patch("socket.getaddrinfo", side_effect=UnicodeError("label empty")) as m:
+            with pytest.raises(UnicodeError):
+                c.getaddrinfo("a..b", 80)
+            # Not cached, and the next lookup doesn't wait for the failed one.
+            with pytest.raises(UnicodeError):
+                c.getaddrinfo("a..b", 80)
+        assert m.call_count == 2
+        assert not c._pending
+        assert not len(c)
+
+    def test_coalesce(self):
+        c = dns.ResolverCache(size=10)
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow_addrinfo(*args):
+            started.set()
+            release.wait(5)
+            return addrinfo(*args)
+
+        results = []
+        with mock.patch("socket.getaddrinfo", side_effect=slow_addrinfo) as m:
+            t1 = threading.Thread(target=lambda: results.append(c.getaddrinfo("example.com", 80)))
+            t1.start()
+            started.wait(5)
+            t2 = threading.Thread(target=lambda: results.append(c.getaddrinfo("example.com", 80)))
+            t2.start()
+            release.set()
+            t1.join(5)
+            t2.join(5)
+        assert m.call_count == 1
+        assert results == [addrinfo("example.com", 80)] * 2
+
+    def test_coalesce_error(self):
+        c = dns.ResolverCache(size=10)
+        started = threading.Event()
+        release = threading.Event()
+        error = socket.gaierror("nope")
+
+        def slow_addrinfo(*args):
+            started.set()
+            release.wait(5)
+            raise error
+
+        errors = []
+
+        def lookup():
+            try:
+                c.getaddrinfo("example.com", 80)
+            except socket.gaierror as e:
+                errors.append(e)
+
+        with mock.patch("socket.getaddrinfo", side_effect=slow_addrinfo) as m:
+            t1 = threading.Thread(target=lookup)
+            t1.start()
+            started.wait(5)
+            t2 = threading.Thread(target=lookup)
+            t2.start()
+            release.set()
+            t1.join(5)
+            t2.join(5)
+        assert m.call_count == 1
+        assert len(errors) == 2
+        assert error not in errors
+        assert errors[0] is not errors[1]
+
+    def test_pin(self):
+        c = dns.ResolverCache()
+        c.pin("backend", ["10.0.0.2", "::1"])
+        ret = c.getaddrinfo("backend", 80, 0, socket.SOCK_STREAM)
+        assert {i[4][0] for i in ret} == {"10.0.0.2", "::1"}
+        with mock.patch("time.monotonic", return_value=10 ** 9):
+            assert c.getaddrinfo("backend", 80, 0, socket.SOCK_STREAM) == ret
+        assert c.hits == 1
+
+        c.pin("backend")
+        with mock.patch("socket.getaddrinfo", side_effect=addrinfo) as m:
+            c.getaddrinfo("backend", 80)
+            with mock.patch("time.monotonic", return_value=10 ** 9):
+                c.getaddrinfo("backend", 80)
+            assert m.call_count == 1
+            c.unpin("backend")
+            c.getaddrinfo("backend", 80)
+            assert m.call_count == 2
+        assert not len(c)
+
+    def test_families(self):
+        v4 = (socket.AF_INET, 0, 0, "", ("10.0.0.1", 80))
+        v6 = (socket.AF_INET6, 0, 0, "", ("::1", 80, 0, 0))
+        # Independent of the size of the lookup cache.
+        c = dns.ResolverCache(size=0, families_size=1)
+        assert c.sort_addresses("example.com", [v6, v4]) == [v6, v4]
+        c.set_family("example.com", socket.AF_INET)
+        assert c.sort_addresses("example.com", [v6, v4]) == [v4, v6]
+        c.set_family("example.org", socket.AF_INET)
+        assert c.sort_addresses("example.com", [v6, v4]) == [v6, v4]
+        c.clear()
+        assert c.sort_addresses("example.org", [v6, v4]) == [v6, v4]
+        c.families_size = 0
+        c.set_family("example.com", socket.AF_INET)
+        assert c.sort_addresses("example.com", [v6, v4]) == [v6, v4]
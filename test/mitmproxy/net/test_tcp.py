@@ -1,4 +1,4 @@
-from io import BytesIO
+from io import BytesIO, StringIO
 import queue
 import time
 import socket
@@ -6,10 +6,12 @@ import random
 import threading
 import pytest
 from unittest import mock
-from OpenSSL import SSL
+from OpenSSL import SSL, crypto
 
 from mitmproxy import certs
+from mitmproxy.net import dns
 from mitmproxy.net import tcp
+from mitmproxy.net import tls
 from mitmproxy import exceptions
 from mitmproxy.test import tutils
 from ...conftest import skip_no_ipv6
@@ -90,6 +92,244 @@ class TestServer(tservers.ServerTestBase):
         self.test_echo()
 
 
+class TestAsyncServer(tservers.ServerTestBase):
+    handler = EchoHandler
+    server_class = tservers._TAsyncServer
+
+    def test_echo(self):
+        testval = b"echo!\n"
+        for _ in range(3):
+            c = tcp.TCPClient(("127.0.0.1", self.port))
+            with c.connect():
+                c.wfile.write(testval)
+                c.wfile.flush()
+                assert c.rfile.readline() == testval
+        assert self.server.server.pool.workers >= 1
+
+    def test_parked(self):
+        s = self.server.server
+        c = tcp.TCPClient(("127.0.0.1", self.port))
+        with c.connect():
+            for _ in range(50):
+                if s.parked_count:
+                    break
+                time.sleep(0.05)
+            assert s.parked_count == 1
+            assert s.handler_counter.count == 0
+            c.wfile.write(b"parked\n")
+            c.wfile.flush()
+            assert c.rfile.readline() == b"parked\n"
+        assert s.parked_count == 0
+
+
+def _wait_for(cond):
+    for _ in range(100):
+        if cond():
+            return
+        time.sleep(0.05)
+    raise AssertionError("Timeout")
+
+
+class _ConnectionLimitTest(tservers.ServerTestBase):
+    handler = EchoHandler
+
+    def connect(self, data=b"x"):
+        # The event loop server only dispatches connections that have sent data.
+        c = tcp.TCPClient(("127.0.0.1", self.port))
+        c.connect()
+        c.wfile.write(data)
+        c.wfile.flush()
+        return c
+
+    def finish(self, c):
+        c.wfile.write(b"\n")
+        c.wfile.flush()
+        assert c.rfile.readline() == b"x\n"
+        c.close()
+
+
+class TestConnectionLimitQueue(_ConnectionLimitTest):
+    class server_class(tservers._TServer):
+        connection_limit = 1
+        connection_queue_size = 1
+
+    def test_queue(self):
+        s = self.server.server
+        c1 = self.connect()
+        _wait_for(lambda: s.active_connections == 1)
+        c2 = self.connect()
+        _wait_for(lambda: s.queued_connections == 1)
+        c3 = self.connect()
+        assert not c3.rfile.read(1)
+        assert s.rejected_connections == 1
+        self.finish(c1)
+        self.finish(c2)
+        _wait_for(lambda: s.active_connections == 0)
+        assert s.queued_connections == 0
+
+    def test_start_error(self):
+        s = self.server.server
+        conn, queued = mock.Mock(), mock.Mock()
+        s.pending.append((queued, ("127.0.0.1", 2)))
+        with mock.patch.object(s, "handle_error"):
+            # The queued connection gets the slot, and fails to start as well.
+            with mock.patch.object(s, "start_handler", side_effect=threading.ThreadError("nonewthread")) as m:
+                s.admit(conn, ("127.0.0.1", 1))
+            assert m.call_count == 2
+            assert conn.close.called
+            assert queued.close.called
+            assert s.queued_connections == 0
+            assert s.active_connections == 0
+
+            s.pending.append((queued, ("127.0.0.1", 2)))
+            with mock.patch.object(s, "start_handler", side_effect=[threading.ThreadError("nonewthread"), None]) as m:
+                s.admit(conn, ("127.0.0.1", 1))
+            m.assert_called_with(queued, ("127.0.0.1", 2))
+            assert s.queued_connections == 0
+            assert s.active_connections == 1
+        s.active_connections = 0
+
+
+class TestConnectionLimitReject(_ConnectionLimitTest):
+    class server_class(tservers._TServer):
+        connection_limit = 1
+        connection_overflow = "reject"
+
+    def test_reject(self):
+        s = self.server.server
+        c1 = self.connect()
+        _wait_for(lambda: s.active_connections == 1)
+        c2 = self.connect()
+        assert not c2.rfile.read(1)
+        self.finish(c1)
+        _wait_for(lambda: s.active_connections == 0)
+        self.finish(self.connect())
+
+
+class TestConnectionLimitPause(_ConnectionLimitTest):
+    class server_class(tservers._TServer):
+        connection_limit = 1
+        connection_overflow = "pause"
+
+    def test_pause(self):
+        s = self.server.server
+        c1 = self.connect()
+        _wait_for(lambda: s.active_connections == 1)
+        c2 = self.connect()
+        time.sleep(0.2)
+        assert s.active_connections == 1
+        assert s.rejected_connections == 0
+        self.finish(c1)
+        self.finish(c2)
+
+
+class TestAsyncConnectionLimitQueue(TestConnectionLimitQueue):
+    class server_class(tservers._TAsyncServer):
+        connection_limit = 1
+        connection_queue_size = 1
+
+
+class TestAsyncConnectionLimitPause(TestConnectionLimitPause):
+    class server_class(tservers._TAsyncServer):
+        connection_limit = 1
+        connection_overflow = "pause"
+
+    def test_pause(self):
+        super().test_pause()
+        assert not self.server.server.paused
+
+
+class TestWorkerPool:
+
+    def test_reuse(self):
+        p = tcp.WorkerPool("test")
+        done = queue.Queue()
+        for i in range(5):
+            p.submit(done.put, i)
+            assert done.get(timeout=5) == i
+            # give the worker a chance to become idle again
+            for _ in range(50):
+                if p.idle:
+                    break
+                time.sleep(0.01)
+        assert p.workers == 1
+        p.shutdown()
+
+    def test_max_workers(self):
+        p = tcp.WorkerPool("test", max_workers=2)
+        ev = threading.Event()
+        for _ in range(4):
+            p.submit(ev.wait)
+        assert p.workers == 2
+        assert p.busy == 2
+        ev.set()
+        p.shutdown()
+
+    def test_max_queue(self):
+        p = tcp.WorkerPool("test", max_workers=1, max_queue=1)
+        ev = threading.Event()
+        p.submit(ev.wait)
+        p.submit(ev.wait)
+        submitted = threading.Event()
+
+        def submit():
+            p.submit(ev.wait)
+            submitted.set()
+        threading.Thread(target=submit, daemon=True).start()
+        assert not submitted.wait(0.1)
+        ev.set()
+        assert submitted.wait(5)
+        p.shutdown()
+
+    def test_try_submit(self):
+        p = tcp.WorkerPool("test", max_workers=1, max_queue=1)
+        ev = threading.Event()
+        assert p.try_submit(ev.wait)
+        # wait for the worker to take the first task
+        for _ in range(50):
+            if not p._tasks:
+                break
+            time.sleep(0.01)
+        assert p.try_submit(ev.wait)
+        assert not p.try_submit(ev.wait)
+        ev.set()
+        p.shutdown()
+
+    def test_error(self):
+        def fail():
+            raise ValueError("oops")
+
+        p = tcp.WorkerPool("test")
+        done = queue.Queue()
+        with mock.patch.object(p, "handle_error", side_effect=done.put):
+            p.submit(fail)
+            assert done.get(timeout=5) is fail
+            # The worker survives the error.
+            for _ in range(50):
+                if p.idle:
+                    break
+                time.sleep(0.01)
+            p.submit(done.put, 42)
+            assert done.get(timeout=5) == 42
+        assert p.workers == 1
+        p.shutdown()
+        for _ in range(50):
+            if not p.workers:
+                break
+            time.sleep(0.01)
+        assert p.workers == 0
+
+    def test_handle_error(self):
+        p = tcp.WorkerPool("test")
+        s = StringIO()
+        try:
+            raise ValueError("oops")
+        except ValueError:
+            p.handle_error(print, s)
+        assert "Error in test task" in s.getvalue()
+        assert "oops" in s.getvalue()
+
+
 class TestServerBind(tservers.ServerTestBase):
 
     class handler(tcp.BaseHandler):
@@ -187,6 +427,45 @@ class TestServerSSL(tservers.ServerTestBase):
             assert "AES" in ret[0]
 
 
+class TestSessionResumption(tservers.ServerTestBase):
+
+    class handler(EchoHandler):
+        context = None
+
+        def handle(self):
+            # Resumption needs a server context shared across connections.
+            if not self.context:
+                key = tutils.test_data.path("mitmproxy/net/data/server.key")
+                with open(key) as f:
+                    key = crypto.load_privatekey(crypto.FILETYPE_PEM, f.read())
+                type(self).context = tls.create_server_context(
+                    tutils.test_data.path("mitmproxy/net/data/server.crt"), key
+                )
+            self.connection = SSL.Connection(self.context, self.connection)
+            self.connection.set_accept_state()
+            self.connection.do_handshake()
+            self.rfile.set_descriptor(self.connection)
+            self.wfile.set_descriptor(self.connection)
+            super().handle()
+
+    def test_session_resumption(self):
+        cache = tls.SessionCache(size=10)
+        for _ in range(3):
+            c = tcp.TCPClient(("127.0.0.1", self.port))
+            with c.connect():
+                c.convert_to_ssl(sni="foo.com", session_cache=cache)
+                c.wfile.write(b"echo!\n")
+                c.wfile.flush()
+                assert c.rfile.readline() == b"echo!\n"
+                c.finish()
+        assert c.tls_session_resumed
+        assert len(cache) == 1
+        assert cache.misses == 1
+        assert cache.hits == 2
+        assert cache.resumed == 2
+        assert cache.hit_rate == 2 / 3
+
+
 class TestSSLv3Only(tservers.ServerTestBase):
     handler = EchoHandler
     ssl = dict(
@@ -615,6 +894,62 @@ class TestTCPClient(tservers.ServerTestBase):
         with c.create_connection(timeout=20) as conn:
             assert conn.gettimeout() == 20
 
+    def test_resolver(self):
+        resolver = dns.ResolverCache(size=10)
+        resolver.pin("backend.invalid", ["127.0.0.1"])
+        c = tcp.TCPClient(("backend.invalid", self.port))
+        with c.connect(resolver):
+            assert c.ip_address[0] == "127.0.0.1"
+        assert len(resolver) == 1
+
+    @staticmethod
+    def _unresponsive_server():
+        # Once its accept queue is full, the server doesn't answer new connection attempts.
+        s = socket.socket()
+        s.bind(("127.0.0.1", 0))
+        s.listen(0)
+        c = socket.create_connection(s.getsockname())
+        return s, c
+
+    def test_happy_eyeballs(self):
+        server, conn = self._unresponsive_server()
+        addrinfo = [
+            (socket.AF_INET, socket.SOCK_STREAM, 6, "", server.getsockname()),
+            (socket.AF_INET, socket.SOCK_STREAM, 6, "", ("127.0.0.1", self.port)),
+        ]
+        resolver = dns.ResolverCache(size=10)
+        c = tcp.TCPClient(("example.com", self.port))
+        with mock.patch("socket.getaddrinfo", return_value=addrinfo):
+            with c.connect(resolver, attempt_delay=0.01):
+                assert c.ip_address[1] == self.port
+                assert c.connection.gettimeout() is None
+        assert resolver.sort_addresses("example.com", addrinfo) == addrinfo
+        conn.close()
+        server.close()
+
+    def test_happy_eyeballs_err(self):
+        addrinfo = [
+            (socket.AF_INET, socket.SOCK_STREAM, 6, "", ("127.0.0.1", 0)),
+            (socket.AF_INET, socket.SOCK_STREAM, 6, "", ("127.0.0.1", 0)),
+        ]
+        c = tcp.TCPClient(("example.com", 0))
+        with mock.patch("socket.getaddrinfo", return_value=addrinfo):
+            with pytest.raises(exceptions.TcpException, match="Error connecting"):
+                c.connect(attempt_delay=0.01)
+
+    def test_happy_eyeballs_timeout(self):
+        server, conn = self._unresponsive_server()
+        addrinfo = [
+            (socket.AF_INET, socket.SOCK_STREAM, 6, "", server.getsockname()),
+            (socket.AF_INET, socket.SOCK_STREAM, 6, "", server.getsockname()),
+        ]
+        c = tcp.TCPClient(("example.com", 80))
+        with mock.patch("socket.getaddrinfo", return_value=addrinfo):
+            with pytest.raises(socket.timeout):
+                c.create_connection(timeout=0.1, attempt_delay=0.01)
+        conn.close()
+        server.close()
+
     def test_spoof_address(self):
         c = tcp.TCPClient(("127.0.0.1", self.port), spoof_source_address=("127.0.0.1", 0))
         with pytest.raises(exceptions.TcpException, match="Failed to spoof"):
@@ -634,6 +969,21 @@ class TestTCPServer:
                 s.wait_for_silence()
             s.shutdown()
 
+    @pytest.mark.skipif(not hasattr(socket, "SO_REUSEPORT"), reason="no SO_REUSEPORT")
+    def test_reuse_port(self):
+        class ReusePortServer(tcp.TCPServer):
+            reuse_port = True
+
+        s1 = ReusePortServer(("127.0.0.1", 0))
+        s2 = ReusePortServer(s1.address)
+        try:
+            assert s1.address == s2.address
+            with pytest.raises(socket.error):
+                tcp.TCPServer(s1.address)
+        finally:
+            s1.socket.close()
+            s2.socket.close()
+
 
 class TestFileLike:
 
@@ -696,6 +1046,55 @@ class TestFileLike:
         s.write(b"x")
         assert s.get_log() == b"xx"
 
+    def test_writer_queue(self):
+        s = tcp.Writer(BytesIO())
+        s.start_log()
+        s.queue(b"foo")
+        s.queue(b"")
+        assert s.getvalue() == b""
+        s.write(b"bar")
+        assert s.getvalue() == b"foobar"
+        s.queue(b"baz")
+        s.flush()
+        assert s.getvalue() == b"foobarbaz"
+        assert s.get_log() == b"foobarbaz"
+        s.QUEUE_LIMIT = 2
+        s.queue(b"xyz")
+        assert s.getvalue() == b"foobarbazxyz"
+
+    def test_writer_sendmsg(self):
+        a, b = socket.socketpair()
+        s = tcp.Writer(socket.SocketIO(a, "wb"))
+        with mock.patch("mitmproxy.net.tcp._sendmsg_all", wraps=tcp._sendmsg_all) as m:
+            for part in (b"HTTP/1.1 200 OK\r\n\r\n", b"foo", b"bar"):
+                s.queue(part)
+            s.flush()
+            assert m.call_count == 1
+        a.close()
+        assert b.recv(100) == b"HTTP/1.1 200 OK\r\n\r\nfoobar"
+        b.close()
+
+    def test_sendmsg_all(self):
+        sent = []
+
+        def sendmsg(buffers):
+            sent.append(b"".join(bytes(b) for b in buffers))
+            return min(len(sent[-1]), 2)
+
+        sock = mock.Mock()
+        sock.sendmsg = sendmsg
+        with mock.patch("mitmproxy.net.tcp.SENDMSG_MAX_BUFFERS", 2):
+            tcp._sendmsg_all(sock, [b"foo", b"bar", b"x"])
+        assert sent == [b"foobar", b"obar", b"arx", b"x"]
+
+    def test_writer_queue_error(self):
+        o = mock.MagicMock()
+        o.sendall = mock.MagicMock(side_effect=socket.error)
+        s = tcp.Writer(o)
+        s.queue(b"foo")
+        with pytest.raises(exceptions.TcpDisconnect):
+            s.flush()
+
     def test_writer_flush_error(self):
         s = BytesIO()
         s = tcp.Writer(s)
@@ -709,7 +1108,7 @@ class TestFileLike:
         s = BytesIO(b"foobar\nfoobar")
         s = tcp.Reader(s)
         o = mock.MagicMock()
-        o.read = mock.MagicMock(side_effect=socket.error)
+        o.readinto = mock.MagicMock(side_effect=socket.error)
         s.o = o
         with pytest.raises(exceptions.TcpDisconnect):
             s.read(10)
@@ -741,25 +1140,57 @@ class TestFileLike:
 
     def test_read_ssl_error(self):
         s = mock.MagicMock()
-        s.read = mock.MagicMock(side_effect=SSL.Error())
+        s.readinto = mock.MagicMock(side_effect=SSL.Error())
         s = tcp.Reader(s)
         with pytest.raises(exceptions.TlsException):
             s.read(1)
 
     def test_read_syscall_ssl_error(self):
         s = mock.MagicMock()
-        s.read = mock.MagicMock(side_effect=SSL.SysCallError())
+        s.readinto = mock.MagicMock(side_effect=SSL.SysCallError())
         s = tcp.Reader(s)
         with pytest.raises(exceptions.TlsException):
             s.read(1)
 
     def test_reader_readline_disconnect(self):
         o = mock.MagicMock()
-        o.read = mock.MagicMock(side_effect=socket.error)
+        o.readinto = mock.MagicMock(side_effect=socket.error)
         s = tcp.Reader(o)
         with pytest.raises(exceptions.TcpDisconnect):
             s.readline(10)
 
+    def test_readinto(self):
+        s = tcp.Reader(BytesIO(b"foobar"))
+        s.start_log()
+        buf = bytearray(4)
+        assert s.readinto(buf) == 4
+        assert buf == b"foob"
+        assert s.readinto1(buf) == 2
+        assert buf == b"arob"
+        assert s.readinto(buf) == 0
+        assert s.get_log() == b"foobar"
+
+    def test_read_grows_buffer(self):
+        s = tcp.Reader(BytesIO(b"x" * 100))
+        s.BLOCKSIZE = 3
+        assert s.read(50) == b"x" * 50
+        assert s.read(-1) == b"x" * 50
+        assert s.read(-1) == b""
+
+    def test_readline_peek(self):
+        a, b = socket.socketpair()
+        a.sendall(b"foo\nbarbaz")
+        s = tcp.Reader(socket.SocketIO(b, "rb"))
+        with mock.patch.object(s, "read", wraps=s.read) as m:
+            assert s.readline() == b"foo\n"
+            assert s.readline(3) == b"bar"
+            assert m.call_count == 2
+            a.sendall(b"\n")
+            a.close()
+            assert s.readline() == b"baz\n"
+            assert s.readline() == b""
+        b.close()
+
     def test_reader_incomplete_error(self):
         s = BytesIO(b"foobar")
         s = tcp.Reader(s)
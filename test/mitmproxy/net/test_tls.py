@@ -1,3 +1,5 @@
+from unittest import mock
+
 import pytest
 
 from mitmproxy import exceptions
@@ -53,3 +55,86 @@ class TestTLSInvalid:
 
         with pytest.raises(exceptions.TlsException, match="ALPN error"):
             tls.create_client_context(alpn_select="foo", alpn_select_callback="bar")
+
+
+class TestSessionCache:
+    def test_disabled(self):
+        c = tls.SessionCache()
+        c.put("a", "session")
+        assert c.get("a") is None
+        assert not len(c)
+
+    def test_size(self):
+        c = tls.SessionCache(size=2)
+        c.put("a", 1)
+        c.put("b", 2)
+        assert c.get("a") == 1
+        c.put("c", 3)
+        assert c.get("b") is None
+        assert c.get("a") == 1
+        assert c.get("c") == 3
+        assert (c.hits, c.misses) == (3, 1)
+        assert repr(c)
+        c.discard("a")
+        assert c.get("a") is None
+        c.clear()
+        assert not len(c)
+
+    def test_ttl(self):
+        c = tls.SessionCache(size=2, ttl=10)
+        with mock.patch("time.monotonic", return_value=100):
+            c.put("a", 1)
+        with mock.patch("time.monotonic", return_value=105):
+            assert c.get("a") == 1
+        with mock.patch("time.monotonic", return_value=111):
+            assert c.get("a") is None
+        assert not len(c)
+
+    def test_hit_rate(self):
+        c = tls.SessionCache(size=2)
+        assert c.hit_rate == 0
+        c.put("a", 1)
+        c.get("a")
+        c.get("b")
+        c.record_resumption()
+        assert c.hit_rate == 0.5
+        c.reset_stats()
+        assert c.resumed == 0
+
+
+class TestContextCache:
+    def test_cache(self):
+        c = tls.ContextCache(size=2)
+        a = c.connection(tls.create_client_context, None, sni="a", alpn_protos=[b"h2"])
+        assert c.connection(tls.create_client_context, None, sni="a", alpn_protos=[b"h2"]).get_context() is a.get_context()
+        assert c.connection(tls.create_client_context, None, sni="a").get_context() is not a.get_context()
+        assert (c.hits, c.misses) == (1, 2)
+        c.connection(tls.create_client_context, None, sni="b")
+        assert len(c) == 2
+        assert c.connection(tls.create_client_context, None, sni="a", alpn_protos=[b"h2"]).get_context() is not a.get_context()
+        assert repr(c)
+        c.clear()
+        assert not len(c)
+
+    def test_disabled(self):
+        c = tls.ContextCache(size=0)
+        a = c.connection(tls.create_client_context, None)
+        assert c.connection(tls.create_client_context, None).get_context() is not a.get_context()
+        assert not len(c)
+
+    def test_log_master_secret(self, tmpdir):
+        c = tls.ContextCache()
+        a = c.connection(tls.create_client_context, None)
+        with mock.patch("mitmproxy.net.tls.log_master_secret", tls.MasterSecretLogger(str(tmpdir.join("logfile")))):
+            assert c.connection(tls.create_client_context, None).get_context() is not a.get_context()
+        assert c.connection(tls.create_client_context, None).get_context() is a.get_context()
+
+    def test_callbacks(self):
+        c = tls.ContextCache()
+        a = c.connection(tls.create_client_context, None, alpn_select_callback=lambda conn, options: b"a")
+        b = c.connection(tls.create_client_context, None, alpn_select_callback=lambda conn, options: b"b")
+        assert a.get_context() is b.get_context()
+        assert tls._dispatch_alpn_select_callback(a, []) == b"a"
+        assert tls._dispatch_alpn_select_callback(b, []) == b"b"
+        with pytest.raises(exceptions.TlsException, match="must be a function"):
+            c.connection(tls.create_client_context, None, alpn_select_callback="foo")
@@ -26,7 +26,7 @@ class _TServer(tcp.TCPServer):
                     cert, key, request_client_cert, cipher_list,
                     dhparams, v3_only
         """
-        tcp.TCPServer.__init__(self, addr)
+        super().__init__(addr)
 
         if ssl is True:
             self.ssl = dict()
@@ -81,10 +81,15 @@ class _TServer(tcp.TCPServer):
         self.q.put(s.getvalue())
 
 
+class _TAsyncServer(_TServer, tcp.AsyncTCPServer):
+    pass
+
+
 class ServerTestBase:
     ssl = None
     handler = None
     addr = ("127.0.0.1", 0)
+    server_class = _TServer
 
     @classmethod
     def setup_class(cls, **kwargs):
@@ -97,7 +102,7 @@ class ServerTestBase:
     @classmethod
     def makeserver(cls, **kwargs):
         ssl = kwargs.pop('ssl', cls.ssl)
-        return _TServer(ssl, cls.q, cls.handler, cls.addr, **kwargs)
+        return cls.server_class(ssl, cls.q, cls.handler, cls.addr, **kwargs)
 
     @classmethod
     def teardown_class(cls):
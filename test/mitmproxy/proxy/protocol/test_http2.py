@@ -281,6 +281,70 @@ class TestSimple(_Http2Test):
         assert response_body_buffer == b'response body'
 
 
+class TestRememberedAlpn(_Http2Test):
+    # The proxy remembers that the server picked h2, and picks it for the
+    # second client right away. That client's HTTP/2 layer still needs a
+    # server connection.
+
+    @classmethod
+    def get_options(cls):
+        opts = super().get_options()
+        opts.upstream_cert_cache_size = 1000
+        return opts
+
+    @classmethod
+    def handle_server_event(cls, event, h2_conn, rfile, wfile):
+        if isinstance(event, h2.events.ConnectionTerminated):
+            return False
+        elif isinstance(event, h2.events.StreamEnded):
+            h2_conn.send_headers(event.stream_id, [(':status', '200')])
+            h2_conn.send_data(event.stream_id, b'response body')
+            h2_conn.end_stream(event.stream_id)
+            wfile.write(h2_conn.data_to_send())
+            wfile.flush()
+        return True
+
+    def _request(self):
+        h2_conn = self.setup_connection()
+        self._send_request(
+            self.client.wfile,
+            h2_conn,
+            headers=[
+                (':authority', "127.0.0.1:{}".format(self.server.server.address[1])),
+                (':method', 'GET'),
+                (':scheme', 'https'),
+                (':path', '/'),
+            ])
+
+        done = False
+        while not done:
+            try:
+                raw = b''.join(http2.read_raw_frame(self.client.rfile))
+                events = h2_conn.receive_data(raw)
+            except exceptions.HttpException:
+                print(traceback.format_exc())
+                assert False
+
+            self.client.wfile.write(h2_conn.data_to_send())
+            self.client.wfile.flush()
+
+            for event in events:
+                if isinstance(event, h2.events.StreamEnded):
+                    done = True
+
+        h2_conn.close_connection()
+        self.client.wfile.write(h2_conn.data_to_send())
+        self.client.wfile.flush()
+        self.client.close()
+
+    def test_two_connections(self):
+        self._request()
+        self._request()
+
+        assert len(self.master.state.flows) == 2
+        assert all(f.response.status_code == 200 for f in self.master.state.flows)
+
+
 class TestRequestWithPriority(_Http2Test):
 
     @classmethod
@@ -12,6 +12,7 @@ class TestClientHello:
         c = TlsClientHello(data)
         assert c.sni is None
         assert c.alpn_protocols == []
+        assert not c.supports_ecdsa
 
     def test_extensions(self):
         data = bytes.fromhex(
@@ -24,3 +25,4 @@ class TestClientHello:
         c = TlsClientHello(data)
         assert c.sni == 'example.com'
         assert c.alpn_protocols == [b'h2', b'http/1.1']
+        assert c.supports_ecdsa
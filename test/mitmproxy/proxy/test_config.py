@@ -1,3 +1,5 @@
+from unittest import mock
+
 import pytest
 
 from mitmproxy import options
@@ -36,3 +38,94 @@ class TestProxyConfig:
         opts.certs = [tutils.test_data.path("mitmproxy/data/dumpfile-011")]
         with pytest.raises(exceptions.OptionsError, match="Invalid certificate format"):
             ProxyConfig(opts)
+
+    def test_tls_sessions(self):
+        opts = options.Options()
+        p = ProxyConfig(opts)
+        assert p.tls_sessions.size == 1000
+        p.tls_sessions.put("a", "session")
+        opts.ssl_session_cache_timeout = 10
+        assert p.tls_sessions.ttl == 10
+        assert len(p.tls_sessions) == 1
+        opts.ssl_insecure = True
+        assert not len(p.tls_sessions)
+        opts.ssl_session_cache_size = 0
+        assert p.tls_sessions.size == 0
+
+    def test_upstream_certs(self):
+        opts = options.Options()
+        p = ProxyConfig(opts)
+        assert p.upstream_certs.size == 0
+        opts.upstream_cert_cache_timeout = 10
+        assert p.upstream_certs.ttl == 10
+        opts.upstream_cert_cache_size = 1000
+        assert p.upstream_certs.size == 1000
+
+    def test_upstream_pool(self):
+        opts = options.Options()
+        p = ProxyConfig(opts)
+        with mock.patch.object(p.upstream_pool, "clear") as clear:
+            opts.upstream_pool_size = 10
+            assert p.upstream_pool.max_idle == 10
+            assert clear.call_count == 1
+            opts.ssl_insecure = True
+            assert clear.call_count == 2
+            opts.anticache = True
+            assert clear.call_count == 2
+
+    def test_connect_pool(self):
+        opts = options.Options()
+        p = ProxyConfig(opts)
+        assert p.connect_pool.max_workers is None
+        opts.connection_limit = 10
+        assert p.connect_pool.max_workers == 10
+
+    def test_dns_cache(self):
+        opts = options.Options()
+        p = ProxyConfig(opts)
+        assert p.dns_cache.size == 0
+        opts.dns_cache_size = 1000
+        assert p.dns_cache.size == 1000
+        opts.dns_cache_ttl = 10
+        assert p.dns_cache.ttl == 10
+        opts.dns_pin = ["backend=10.0.0.1,10.0.0.2", "example.com"]
+        assert p.dns_cache.pinned == {"backend": ["10.0.0.1", "10.0.0.2"], "example.com": []}
+        opts.dns_pin = ["example.com"]
+        assert p.dns_cache.pinned == {"example.com": []}
+        with pytest.raises(exceptions.OptionsError, match="Invalid IP address"):
+            opts.dns_pin = ["backend=foo"]
+
+    def test_certstore(self, tmpdir):
+        opts = options.Options(cadir=str(tmpdir))
+        p = ProxyConfig(opts)
+        certstore = p.certstore
+        opts.cert_cache_size = 10
+        assert p.certstore is certstore
+        assert certstore.capacity == 10
+        opts.cadir = str(tmpdir.join("foo"))
+        assert p.certstore is not certstore
+
+    def test_cert_disk_cache(self, tmpdir):
+        opts = options.Options(cadir=str(tmpdir))
+        p = ProxyConfig(opts)
+        assert not p.certstore.disk_cache
+        opts.cert_disk_cache_size = 10
+        cache = p.certstore.disk_cache
+        assert cache.path == str(tmpdir.join("mitmproxy-certs"))
+        opts.cert_disk_cache_size = 20
+        assert p.certstore.disk_cache is cache
+        assert cache.size == 20
+        opts.cert_disk_cache_size = 0
+        assert not p.certstore.disk_cache
+
+    def test_cert_prefetch_hosts(self, tmpdir):
+        opts = options.Options(cadir=str(tmpdir), cert_prefetch_hosts=["example.com"])
+        p = ProxyConfig(opts)
+        certstore = p.certstore
+        certstore.shutdown()
+        assert (b"example.com", (b"example.com",)) in certstore.certs
+        certstore.prefetch(b"foo.com", [b"foo.com"])
+        opts.update(cadir=str(tmpdir.join("other")))
+        assert p.certstore is not certstore
+        assert not certstore.executor
+        p.certstore.shutdown()
@@ -0,0 +1,105 @@
+import socket
+from unittest import mock
+
+from mitmproxy.proxy import pool
+
+
+class Conn:
+    def __init__(self):
+        self.connection, self.peer = socket.socketpair()
+        self.closed = False
+
+    def connected(self):
+        return not self.closed
+
+    def finish(self):
+        pass
+
+    def close(self):
+        self.closed = True
+        self.connection.close()
+        self.peer.close()
+
+
+class TestConnectionPool:
+    def test_disabled(self):
+        p = pool.ConnectionPool()
+        c = Conn()
+        assert not p.checkin("a", c)
+        assert not p.checkout("a")
+        assert not len(p)
+        c.close()
+
+    def test_checkout(self):
+        p = pool.ConnectionPool(max_idle=2)
+        c1, c2 = Conn(), Conn()
+        assert p.checkin("a", c1)
+        assert p.checkin("a", c2)
+        assert len(p) == 2
+        assert not p.checkout("b")
+        assert p.checkout("a") is c2
+        assert p.checkout("a") is c1
+        assert not p.checkout("a")
+        assert (p.hits, p.misses, p.stale) == (2, 2, 0)
+        assert repr(p)
+        p.reset_stats()
+        assert p.hits == 0
+
+    def test_max_idle(self):
+        p = pool.ConnectionPool(max_idle=1)
+        c1, c2 = Conn(), Conn()
+        p.checkin("a", c1)
+        p.checkin("a", c2)
+        assert c1.closed
+        assert len(p) == 1
+        assert p.checkout("a") is c2
+
+    def test_idle_timeout(self):
+        p = pool.ConnectionPool(max_idle=2, idle_timeout=10)
+        c1, c2 = Conn(), Conn()
+        with mock.patch("time.monotonic", return_value=100):
+            p.checkin("a", c1)
+        with mock.patch("time.monotonic", return_value=115):
+            p.checkin("b", c2)
+            assert c1.closed
+            assert p.stale == 1
+        with mock.patch("time.monotonic", return_value=130):
+            assert not p.checkout("b")
+            assert c2.closed
+            assert p.stale == 2
+        assert not len(p)
+
+    def test_unhealthy(self):
+        p = pool.ConnectionPool(max_idle=2)
+        c1, c2 = Conn(), Conn()
+        p.checkin("a", c1)
+        p.checkin("a", c2)
+        c2.peer.close()
+        assert p.checkout("a") is c1
+        assert c2.closed
+        assert p.stale == 1
+
+        c3 = Conn()
+        c3.close()
+        assert not p.healthy(c3)
+
+    def test_clear(self):
+        p = pool.ConnectionPool(max_idle=2)
+        c = Conn()
+        p.checkin("a", c)
+        p.clear()
+        assert c.closed
+        assert not len(p)
+
+    def test_serverdisconnect(self):
+        p = pool.ConnectionPool(max_idle=1, idle_timeout=10)
+        p.channel = mock.Mock()
+        c1, c2 = Conn(), Conn()
+        with mock.patch("time.monotonic", return_value=100):
+            p.checkin("a", c1)
+            p.checkin("a", c2)
+        p.channel.tell.assert_called_once_with("serverdisconnect", c1)
+        with mock.patch("time.monotonic", return_value=115):
+            assert not p.checkout("a")
+        p.channel.tell.assert_called_with("serverdisconnect", c2)
+        assert p.channel.tell.call_count == 2
@@ -16,6 +16,7 @@ from mitmproxy.net import socks
 from mitmproxy.net import tcp
 from mitmproxy.net.http import http1
 from mitmproxy.proxy.config import HostMatcher
+from mitmproxy.proxy.protocol import tls
 from mitmproxy.test import tutils
 from pathod import pathoc
 from pathod import pathod
@@ -186,14 +187,15 @@ class TcpMixin:
         assert not any(f.response.status_code == 305 for f in self.master.state.flows if isinstance(f, http.HTTPFlow))
         assert not any(f.response.status_code == 306 for f in self.master.state.flows if isinstance(f, http.HTTPFlow))
 
-        # Test that we get the original SSL cert
+        # TLS is intercepted before --tcp applies, and generated certificates
+        # survive option changes.
         if self.ssl:
             i_cert = certs.SSLCert(i.sslinfo.certchain[0])
             i2_cert = certs.SSLCert(i2.sslinfo.certchain[0])
             n_cert = certs.SSLCert(n.sslinfo.certchain[0])
 
             assert i_cert == i2_cert
-            assert i_cert != n_cert
+            assert i_cert == n_cert
 
         # Make sure that TCP messages are in the event log.
         # Re-enable and fix this when we start keeping TCPFlows in the state.
@@ -261,6 +263,88 @@ class TestHTTP(tservers.HTTPProxyTest, CommonMixin):
                 assert resp
                 assert resp.status_code == 200
 
+    def test_upstream_pool(self):
+        req = "get:'%s/p/200:b@1'" % self.server.urlbase
+        pool = self.master.server.config.upstream_pool
+        self.master.options.upstream_pool_size = 1
+        try:
+            self.master.clear()
+            pool.reset_stats()
+            for _ in range(3):
+                p = self.pathoc()
+                with p.connect():
+                    assert p.request(req).status_code == 200
+                    assert p.request(req).status_code == 200
+                # Wait for the proxy to return the connection to the pool.
+                for _ in range(500):
+                    if len(pool):
+                        break
+                    time.sleep(0.01)
+                assert len(pool) == 1
+            assert pool.hits == 2
+            assert pool.misses == 1
+            assert not self.master.has_log("serverdisconnect")
+        finally:
+            self.master.options.upstream_pool_size = 0
+        assert not len(pool)
+
+    def test_upstream_pool_flows(self):
+        req = "get:'%s/p/200:b@1'" % self.server.urlbase
+        pool = self.master.server.config.upstream_pool
+        self.master.options.upstream_pool_size = 1
+        try:
+            self.master.clear()
+            pool.reset_stats()
+            p = self.pathoc()
+            with p.connect():
+                assert p.request(req).status_code == 200
+            for _ in range(500):
+                if len(pool):
+                    break
+                time.sleep(0.01)
+            first = self.master.state.flows[-1].server_conn
+            state = first.get_state()
+
+            p = self.pathoc()
+            with p.connect():
+                assert p.request(req).status_code == 200
+            second = self.master.state.flows[-1].server_conn
+            assert pool.hits == 1
+            for _ in range(500):
+                if len(pool):
+                    break
+                time.sleep(0.01)
+        finally:
+            self.master.options.upstream_pool_size = 0
+        # The pool closed the connection, which the first client's flow
+        # doesn't get to see.
+        assert second.timestamp_end
+        assert second.id == first.id
+        assert second is not first
+        assert first.get_state() == state
+
+    def test_upstream_pool_retry(self):
+        pool = self.master.server.config.upstream_pool
+        self.master.options.upstream_pool_size = 1
+        try:
+            for method, retried in (("post", False), ("get", True)):
+                self.master.clear()
+                p = self.pathoc()
+                with p.connect():
+                    assert p.request("get:'%s/p/200'" % self.server.urlbase).status_code == 200
+                for _ in range(500):
+                    if len(pool):
+                        break
+                    time.sleep(0.01)
+                # The server drops the pooled connection without a response.
+                p = self.pathoc()
+                with p.connect():
+                    req = "%s:'%s/p/200:d0'" % (method, self.server.urlbase)
+                    assert p.request(req).status_code == 502
+                assert self.master.has_log("retrying request") == retried
+        finally:
+            self.master.options.upstream_pool_size = 0
+
     def test_get_connection_switching(self):
         req = "get:'%s/p/200:b@1'"
         p = self.pathoc()
@@ -488,6 +572,122 @@ class TestHTTPSNoCommonName(tservers.HTTPProxyTest):
         assert f.sslinfo.certchain[0].get_subject().CN == "127.0.0.1"
 
 
+class TestHTTPSECDSA(tservers.HTTPProxyTest):
+    ssl = True
+
+    @classmethod
+    def get_options(cls):
+        opts = tservers.HTTPProxyTest.get_options()
+        opts.cert_key_type = "ecdsa"
+        return opts
+
+    def test_http(self):
+        f = self.pathod("202")
+        assert f.status_code == 202
+        assert certs.get_key_type(f.sslinfo.certchain[0].get_pubkey()) == "ecdsa"
+
+
+class TestHTTPSUpstreamCertCache(tservers.HTTPProxyTest):
+    ssl = True
+
+    @classmethod
+    def get_options(cls):
+        opts = tservers.HTTPProxyTest.get_options()
+        opts.upstream_cert_cache_size = 1000
+        return opts
+
+    def test_http(self):
+        upstream_certs = self.master.server.config.upstream_certs
+        upstream_certs.clear()
+        f1 = self.pathod("202")
+        f2 = self.pathod("202")
+        assert f2.status_code == 202
+        assert upstream_certs.hits
+        assert f2.sslinfo.certchain[0].get_subject().CN == f1.sslinfo.certchain[0].get_subject().CN
+
+
+class TestHTTPBodySpill(tservers.HTTPProxyTest):
+
+    @classmethod
+    def get_options(cls):
+        opts = tservers.HTTPProxyTest.get_options()
+        opts.body_spill_size = "10k"
+        return opts
+
+    def test_spill(self):
+        self.master.clear()
+        assert len(self.pathod("200:b@50k").content) == 1024 * 50
+        f = self.master.state.flows[-1]
+        assert f.response.is_spooled
+        assert len(f.response.raw_content) == 1024 * 50
+        assert not f.request.is_spooled
+
+        assert len(self.pathod("200:b@5k").content) == 1024 * 5
+        assert not self.master.state.flows[-1].response.is_spooled
+
+
+class TestHTTPSParallelConnect(tservers.HTTPProxyTest):
+    ssl = True
+
+    @classmethod
+    def get_options(cls):
+        opts = tservers.HTTPProxyTest.get_options()
+        opts.upstream_cert = False
+        opts.upstream_parallel_connect = True
+        return opts
+
+    def test_http(self):
+        connect_pool = self.master.server.config.connect_pool
+        with mock.patch.object(connect_pool, "submit", wraps=connect_pool.submit) as m:
+            assert self.pathod("200").status_code == 200
+        assert m.called
+
+    def test_server_error(self):
+        self.master.clear()
+        self.options.ssl_insecure = False
+        assert self.pathod("200").status_code == 502
+        assert self.proxy.tmaster.has_log("Parallel server connect failed")
+
+    def test_no_worker(self):
+        # If no worker picks up the connect in time, we connect when the
+        # server is first needed.
+        self.master.clear()
+        self.options.ssl_insecure = True
+        connect_pool = self.master.server.config.connect_pool
+        with mock.patch.object(tls, "PARALLEL_CONNECT_TIMEOUT", 0.01):
+            with mock.patch.object(connect_pool, "submit") as m:
+                assert self.pathod("200").status_code == 200
+        assert m.called
+        assert self.proxy.tmaster.has_log("did not start in time")
+
+    def test_client_error(self):
+        # A server connect that times out does not hide the client's error.
+        self.master.clear()
+        errors = []
+
+        class RecordErrors:
+            def error(self, f):
+                errors.append(f.error.msg)
+
+        self.master.addons.add(RecordErrors())
+
+        def slow_server_tls(layer):
+            time.sleep(0.5)
+
+        client_error = exceptions.ClientHandshakeException("client failed", "127.0.0.1")
+        with mock.patch.object(tls, "PARALLEL_CONNECT_TIMEOUT", 0.01):
+            with mock.patch.object(tls.TlsLayer, "_establish_tls_with_server", slow_server_tls):
+                with mock.patch.object(tls.TlsLayer, "_establish_tls_with_client", side_effect=client_error):
+                    with pytest.raises(pathoc.PathocError):
+                        self.pathod("200")
+        for _ in range(500):
+            if self.proxy.tmaster.has_log("clientdisconnect"):
+                break
+            time.sleep(0.01)
+        assert errors == ["client failed"]
+        assert self.proxy.tmaster.has_log("Parallel server connect failed: Timed out")
+
+
 class TestReverse(tservers.ReverseProxyTest, CommonMixin, TcpMixin):
     reverse = True
 
@@ -851,6 +1051,40 @@ class TestStreamRequest(tservers.HTTPProxyTest):
 
         connection.close()
 
+    def _request(self, spec):
+        connection = socket.create_connection(("127.0.0.1", self.proxy.port))
+        connection.settimeout(5)
+        connection.send(
+            b"GET %s/p/%s HTTP/1.1\r\n\r\n" %
+            (self.server.urlbase.encode(), spec.encode()))
+        return connection, connection.makefile("rb")
+
+    def test_stream_head_first(self):
+        # The server pauses for two seconds after the head, the client gets
+        # the head before the body.
+        self.proxy.tmaster.addons.add(AStreamRequest())
+        connection, fconn = self._request('200:r:h"Content-Length"="4":b"abcd":p38,2')
+        start = time.time()
+        resp = http1.read_response_head(fconn)
+        assert resp.status_code == 200
+        assert time.time() - start < 1
+        assert fconn.read(4) == b"abcd"
+        assert time.time() - start >= 1
+        connection.close()
+
+    @pytest.mark.parametrize("stream", [True, False])
+    def test_empty_body(self, stream):
+        # The server keeps the connection open after an empty response.
+        if stream:
+            self.proxy.tmaster.addons.add(AStreamRequest())
+        connection, fconn = self._request('200:r:h"Content-Length"="0":pa,2')
+        start = time.time()
+        resp = http1.read_response_head(fconn)
+        assert resp.status_code == 200
+        assert resp.headers["Content-Length"] == "0"
+        assert time.time() - start < 1
+        connection.close()
+
 
 class AFakeResponse:
     def request(self, f):
@@ -880,6 +1114,12 @@ class TestServerConnect(tservers.HTTPProxyTest):
         assert self.pathod("200").status_code == 200
         assert not self.proxy.tmaster.has_log("serverconnect")
 
+    def test_prefetch_cert(self):
+        certstore = self.master.server.config.certstore
+        with mock.patch.object(certstore, "prefetch", wraps=certstore.prefetch) as m:
+            assert self.pathod("200").status_code == 200
+        m.assert_called_with(b"127.0.0.1", [b"127.0.0.1"], "rsa")
+
 
 class AKillRequest:
 
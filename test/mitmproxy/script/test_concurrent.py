@@ -3,6 +3,10 @@ from mitmproxy.test import tutils
 from mitmproxy.test import taddons
 
 from mitmproxy import controller
+from mitmproxy.addons import script
+from mitmproxy.script import concurrent
+from mitmproxy.script.concurrent import HookStats, pool, stats
+import threading
 import time
 
 from .. import tservers
@@ -14,6 +18,21 @@ class Thing:
         self.live = True
 
 
+@concurrent
+def request(f):
+    raise ValueError("oops")
+
+
+blocked = threading.Event()
+threads = []
+
+
+@concurrent
+def response(f):
+    threads.append(threading.current_thread().name)
+    blocked.wait(5)
+
+
 class TestConcurrent(tservers.MasterTest):
     def test_concurrent(self):
         with taddons.context() as tctx:
@@ -55,3 +74,73 @@ class TestConcurrent(tservers.MasterTest):
                     if f1.reply.state == f2.reply.state == "committed":
                         return
                 raise ValueError("Script never acked")
+
+    def test_pool(self):
+        with taddons.context() as tctx:
+            sl = script.ScriptLoader()
+            tctx.configure(sl, concurrent_threads=2)
+            sc = tctx.script(
+                tutils.test_data.path(
+                    "mitmproxy/data/addonscripts/concurrent_decorator.py"
+                )
+            )
+            flows = [tflow.tflow() for _ in range(4)]
+            for f in flows:
+                tctx.cycle(sc, f)
+            assert pool.max_workers == 2
+            assert pool.workers <= 2
+            start = time.time()
+            while time.time() - start < 5:
+                if all(f.reply.state == "committed" for f in flows):
+                    break
+            else:
+                raise ValueError("Script never acked")
+            s = [v for k, v in stats.items() if k.endswith(".request")]
+            assert sum(i.count for i in s) >= 4
+            tctx.configure(sl, concurrent_threads=16)
+            assert pool.max_workers == 16
+
+    def test_full_queue(self):
+        with taddons.context() as tctx:
+            sl = script.ScriptLoader()
+            tctx.configure(sl, concurrent_threads=1, concurrent_queue_size=1)
+            flows = [tflow.tflow(resp=True) for _ in range(pool.workers + 3)]
+            try:
+                # None of these block, even though the pool is full.
+                for f in flows:
+                    response(f)
+                blocked.set()
+                start = time.time()
+                while time.time() - start < 5:
+                    if all(f.reply.state == "committed" for f in flows):
+                        break
+                else:
+                    raise ValueError("Script never acked")
+            finally:
+                blocked.set()
+                tctx.configure(sl, concurrent_threads=16, concurrent_queue_size=100)
+            assert "script.concurrent (response)" in threads
+
+    def test_error(self):
+        with taddons.context() as tctx:
+            f = tflow.tflow()
+            request(f)
+            start = time.time()
+            while time.time() - start < 5:
+                if f.reply.state == "committed":
+                    break
+            assert f.reply.state == "committed"
+            tctx.master.tick(0)
+            assert tctx.master.has_log("oops", "error")
+
+
+def test_hookstats():
+    s = HookStats()
+    assert str(s).startswith("0 calls")
+    s.add(0.001, 0.002)
+    s.add(0.003, 0.004)
+    assert s.count == 2
+    assert s.max_wait == 0.003
+    assert "2 calls, wait 2.0ms avg, 3.0ms max, run 3.0ms avg, 4.0ms max" == str(s)
+    s.reset()
+    assert s.count == 0
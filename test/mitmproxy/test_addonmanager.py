@@ -1,3 +1,5 @@
+from unittest import mock
+
 import pytest
 
 from mitmproxy import addons
@@ -5,6 +7,8 @@ from mitmproxy import addonmanager
 from mitmproxy import exceptions
 from mitmproxy import options
 from mitmproxy import command
+from mitmproxy import controller
+from mitmproxy import ctx
 from mitmproxy import master
 from mitmproxy.test import taddons
 from mitmproxy.test import tflow
@@ -179,6 +183,160 @@ def test_nesting():
     assert not a.get("four")
 
 
+class TRequest:
+    def request(self, f):
+        pass
+
+
+def test_subscriptions():
+    o = options.Options()
+    m = master.Master(o)
+    a = addonmanager.AddonManager(m)
+    assert not a.handles("request")
+
+    a.add(TAddon("one", addons=[TRequest()]))
+    assert a.handles("request")
+    assert a.handles("done")
+    assert not a.handles("response")
+    assert a.subscriptions["request"] == (a.get("trequest"),)
+
+    a.remove(a.get("trequest"))
+    assert not a.handles("request")
+    assert a.handles("done")
+
+
+def test_dispatch_table():
+    o = options.Options()
+    m = master.Master(o)
+    a = addonmanager.AddonManager(m)
+    one = TAddon("one", addons=[TRequest()])
+    two = TAddon("two")
+    a.add(one, THalt(), two)
+
+    assert a.dispatch_table("request") == [(a.get("trequest").request,)]
+    assert a.dispatch_table("custom") == [
+        (one.event_custom,),
+        (a.get("thalt").event_custom,),
+        (two.event_custom,),
+    ]
+    assert "custom" in a.dispatch
+    a.trigger("custom")
+    assert one.custom_called
+    assert not two.custom_called
+
+    a.remove(a.get("trequest"))
+    assert not a.dispatch
+    assert a.dispatch_table("request") == []
+    a.remove(a.get("thalt"))
+    a.trigger("custom")
+    assert two.custom_called
+
+
+class TInline:
+    threadsafe = True
+
+    def __init__(self, name, halt=False):
+        self.name = name
+        self.halt = halt
+
+    def request(self, f):
+        f.request.headers[self.name] = "1"
+        if self.halt:
+            raise exceptions.AddonHalt
+
+    def response(self, f):
+        raise ValueError("oops")
+
+
+def test_inline():
+    with taddons.context() as tctx:
+        a = tctx.master.addons
+        one, two = TInline("one"), TInline("two")
+        a.add(one, TRequest(), TAddon("parent", addons=[two]))
+
+        # Handlers after the first one that is not thread-safe stay on the
+        # master, so that they keep their order.
+        assert a.inline_handlers("request") == (one.request,)
+        assert a.dispatch_table("request", inlined=True) == [
+            (a.get("trequest").request,),
+            (two.request,),
+        ]
+        assert len(a.dispatch_table("request")) == 3
+        # TInline handles response, TRequest doesn't.
+        assert a.inline_handlers("response") == (one.response, two.response)
+        assert a.dispatch_table("response", inlined=True) == []
+
+        f = tflow.tflow(resp=True)
+        assert a.invoke_inline("request", f)
+        assert f.request.headers["one"] == "1"
+        assert "two" not in f.request.headers
+
+        assert not a.invoke_inline("response", f)
+        assert tctx.master.event_queue.qsize() == 2
+        tctx.master.tick(0)
+        assert tctx.master.has_log("oops", "error")
+
+        a.remove(a.get("trequest"))
+        assert a.inline_handlers("request") == (one.request, two.request)
+        assert not a.invoke_inline("request", f)
+
+        a.add(TInline("three", halt=True), TInline("four"))
+        f = tflow.tflow()
+        assert not a.invoke_inline("request", f)
+        assert "three" in f.request.headers
+        assert "four" not in f.request.headers
+
+
+def test_inline_tables():
+    with taddons.context() as tctx:
+        a = tctx.master.addons
+        one = TInline("one")
+        parent = TAddon("parent")
+        parent.addons = []
+        a.add(parent, one)
+        # Connection threads only read the tables built on the master.
+        assert a.inline["request"] == ((one.request,), False)
+        with mock.patch.object(a, "_handlers", side_effect=AssertionError):
+            assert a.inline_handlers("request") == (one.request,)
+            assert a.inline_handlers("clientconnect") == ()
+
+        two = TInline("two")
+        a.register(two)
+        parent.addons.append(two)
+        assert a.inline_handlers("request") == (one.request,)
+        a.invalidate()
+        assert a.inline_handlers("request") == (two.request, one.request)
+
+
+class TInlineCtx(TInline):
+    def request(self, f):
+        ctx.log.info("request")
+
+
+def test_inline_ctx():
+    with taddons.context() as tctx:
+        with pytest.raises(exceptions.AddonManagerError, match="uses mitmproxy.ctx"):
+            tctx.master.addons.add(TInlineCtx("ctx"))
+        assert not tctx.master.addons.get("ctx")
+
+
+def test_handle_lifecycle_inlined():
+    with taddons.context() as tctx:
+        a = tctx.master.addons
+        inline = TInline("inline")
+        a.add(inline)
+        f = tflow.tflow()
+        f.reply = controller.Reply(f)
+        f.reply.inlined = True
+        a.handle_lifecycle("request", f)
+        assert "inline" not in f.request.headers
+        assert f.reply.state == "committed"
+
+        f = tflow.tflow()
+        a.handle_lifecycle("request", f)
+        assert "inline" in f.request.headers
+
+
 class D:
     def __init__(self):
         self.w = None
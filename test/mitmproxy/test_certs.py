@@ -1,4 +1,9 @@
 import os
+import threading
+from unittest import mock
+
+import pytest
+
 from mitmproxy import certs
 from mitmproxy.test import tutils
 
@@ -72,7 +77,7 @@ class TestCertStore:
 
     def test_expire(self, tmpdir):
         ca = certs.CertStore.from_store(str(tmpdir), "test")
-        ca.STORE_CAP = 3
+        ca.capacity = 3
         ca.get_cert(b"one.com", [])
         ca.get_cert(b"two.com", [])
         ca.get_cert(b"three.com", [])
@@ -89,11 +94,27 @@ class TestCertStore:
 
         ca.get_cert(b"four.com", [])
 
-        assert (b"one.com", ()) not in ca.certs
-        assert (b"two.com", ()) in ca.certs
+        # one.com was used more recently than two.com
+        assert (b"one.com", ()) in ca.certs
+        assert (b"two.com", ()) not in ca.certs
         assert (b"three.com", ()) in ca.certs
         assert (b"four.com", ()) in ca.certs
 
+        assert (ca.hits, ca.misses, ca.evictions) == (1, 4, 1)
+
+    def test_expire_custom_certs(self, tmpdir):
+        ca = certs.CertStore.from_store(str(tmpdir), "test")
+        ca.capacity = 1
+        dc = ca.get_cert(b"foo.com", [])
+        dcp = tmpdir.join("dc")
+        dcp.write(dc[0].to_pem())
+        ca.add_cert_file("*.foo.com", str(dcp))
+        ca.get_cert(b"bar.com", [])
+        ca.get_cert(b"baz.com", [])
+        # Certificates that were added explicitly are never evicted.
+        assert ca.get_cert(b"www.foo.com", [])[0].serial == dc[0].serial
+        assert len(ca.expire_queue) == 1
+
     def test_overrides(self, tmpdir):
         ca1 = certs.CertStore.from_store(str(tmpdir.join("ca1")), "test")
         ca2 = certs.CertStore.from_store(str(tmpdir.join("ca2")), "test")
@@ -107,12 +128,188 @@ class TestCertStore:
         ret = ca1.get_cert(b"foo.com", [])
         assert ret[0].serial == dc[0].serial
 
+    def test_coalesce(self, tmpdir):
+        ca = certs.CertStore.from_store(str(tmpdir), "test")
+        started = threading.Event()
+        done = threading.Event()
+        dummy_cert = certs.dummy_cert
+
+        def slow_dummy_cert(*args):
+            started.set()
+            done.wait(5)
+            return dummy_cert(*args)
+
+        with mock.patch("mitmproxy.certs.dummy_cert", side_effect=slow_dummy_cert) as m:
+            t = threading.Thread(target=ca.get_cert, args=(b"foo.com", []))
+            t.start()
+            started.wait(5)
+            assert (b"foo.com", ()) in ca.pending
+            threading.Timer(0.1, done.set).start()
+            c = ca.get_cert(b"foo.com", [])
+            t.join()
+            assert m.call_count == 1
+        assert not ca.pending
+        assert c[0] is ca.get_cert(b"foo.com", [])[0]
+
+    def test_generate_error(self, tmpdir):
+        ca = certs.CertStore.from_store(str(tmpdir), "test")
+        with mock.patch("mitmproxy.certs.dummy_cert", side_effect=ValueError):
+            with pytest.raises(ValueError):
+                ca.get_cert(b"foo.com", [])
+        assert not ca.pending
+
+    def test_prefetch(self, tmpdir):
+        ca = certs.CertStore.from_store(str(tmpdir), "test")
+        ca.prefetch(b"foo.com", [b"foo.com"])
+        ca.shutdown()
+        assert not ca.executor
+        assert (b"foo.com", (b"foo.com",)) in ca.certs
+        with mock.patch.object(ca, "executor") as m:
+            ca.prefetch(b"foo.com", [b"foo.com"])
+            assert not m.submit.called
+        ca.get_cert(b"foo.com", [b"foo.com"])
+        assert ca.hits == 1
+        ca.prefetch(b"bar.com", [b"bar.com"])
+        ca.shutdown()
+        assert (b"bar.com", (b"bar.com",)) in ca.certs
+        ca.shutdown()
+
     def test_create_dhparams(self, tmpdir):
         filename = str(tmpdir.join("dhparam.pem"))
         certs.CertStore.load_dhparam(filename)
         assert os.path.exists(filename)
 
 
+class TestKeyTypes:
+
+    def test_create_key(self):
+        assert certs.get_key_type(certs.create_key("rsa")) == "rsa"
+        assert certs.get_key_type(certs.create_key("ecdsa")) == "ecdsa"
+        with pytest.raises(ValueError):
+            certs.create_key("foo")
+
+    def test_ecdsa_leaf(self, tmpdir):
+        ca = certs.CertStore.from_store(str(tmpdir), "test")
+        cert, key, _ = ca.get_cert(b"foo.com", [], "ecdsa")
+        assert certs.get_key_type(key) == "ecdsa"
+        assert certs.get_key_type(cert.x509.get_pubkey()) == "ecdsa"
+        assert ca.get_cert(b"foo.com", [])[1] is ca.default_privatekey
+        assert ca.get_cert(b"foo.com", [], "rsa")[1] is ca.default_privatekey
+
+        # The leaf key is kept in the store.
+        ca = certs.CertStore.from_store(str(tmpdir), "test")
+        assert ca.get_cert(b"foo.com", [], "ecdsa")[0].x509.get_pubkey().to_cryptography_key().public_numbers() == \
+            cert.x509.get_pubkey().to_cryptography_key().public_numbers()
+
+    def test_ecdsa_ca(self, tmpdir):
+        ca = certs.CertStore.from_store(str(tmpdir), "test", "ecdsa")
+        assert ca.default_key_type == "ecdsa"
+        assert ca.get_cert(b"foo.com", [], "ecdsa")[1] is ca.default_privatekey
+        cert, key, _ = ca.get_cert(b"foo.com", [], "rsa")
+        assert certs.get_key_type(key) == "rsa"
+        assert os.path.exists(str(tmpdir.join("test-rsa.pem")))
+
+    def test_disk_cache(self, tmpdir):
+        ca = certs.CertStore.from_store(str(tmpdir), "test")
+        ca.disk_cache = certs.CertDiskCache(str(tmpdir.join("certs")), ca.default_ca, 10)
+        c1 = ca.get_cert(b"foo.com", [], "ecdsa")[0]
+        c2 = ca.get_cert(b"foo.com", [], "rsa")[0]
+        assert len(os.listdir(ca.disk_cache.path)) == 2
+        ca = certs.CertStore.from_store(str(tmpdir), "test")
+        ca.disk_cache = certs.CertDiskCache(str(tmpdir.join("certs")), ca.default_ca, 10)
+        assert ca.get_cert(b"foo.com", [], "ecdsa")[0].serial == c1.serial
+        assert ca.get_cert(b"foo.com", [])[0].serial == c2.serial
+
+
+class TestCertDiskCache:
+
+    def test_restart(self, tmpdir):
+        ca = certs.CertStore.from_store(str(tmpdir), "test")
+        ca.disk_cache = certs.CertDiskCache(str(tmpdir.join("certs")), ca.default_ca, 10)
+        c1 = ca.get_cert(b"foo.com", [b"foo.com", b"1.2.3.4"])[0]
+        assert ca.disk_cache.misses == 1
+
+        ca = certs.CertStore.from_store(str(tmpdir), "test")
+        ca.disk_cache = certs.CertDiskCache(str(tmpdir.join("certs")), ca.default_ca, 10)
+        c2 = ca.get_cert(b"foo.com", [b"foo.com", b"1.2.3.4"])[0]
+        assert ca.disk_cache.hits == 1
+        assert c2.serial == c1.serial
+        assert ca.get_cert(b"foo.com", [])[0].serial != c1.serial
+
+    def test_other_ca(self, tmpdir):
+        ca1 = certs.CertStore.from_store(str(tmpdir.join("ca1")), "test")
+        ca2 = certs.CertStore.from_store(str(tmpdir.join("ca2")), "test")
+        c1 = certs.CertDiskCache(str(tmpdir.join("certs")), ca1.default_ca, 10)
+        c2 = certs.CertDiskCache(str(tmpdir.join("certs")), ca2.default_ca, 10)
+        c1.put(b"foo.com", [], ca1.get_cert(b"foo.com", [])[0])
+        assert c1.get(b"foo.com", [])
+        assert not c2.get(b"foo.com", [])
+
+    def test_invalid(self, tmpdir):
+        ca = certs.CertStore.from_store(str(tmpdir), "test")
+        c = certs.CertDiskCache(str(tmpdir.join("certs")), ca.default_ca, 10)
+        with open(c._filename(b"foo.com", []), "wb") as f:
+            f.write(b"garbage")
+        assert not c.get(b"foo.com", [])
+
+        c.put(b"foo.com", [], ca.get_cert(b"foo.com", [])[0])
+        c.MIN_VALIDITY = certs.DEFAULT_EXP
+        assert not c.get(b"foo.com", [])
+
+    def test_cleanup(self, tmpdir):
+        ca = certs.CertStore.from_store(str(tmpdir), "test")
+        c = certs.CertDiskCache(str(tmpdir.join("certs")), ca.default_ca, 2)
+        cert = ca.get_cert(b"foo.com", [])[0]
+        c.put(b"one.com", [], cert)
+        c.put(b"two.com", [], cert)
+        os.utime(c._filename(b"one.com", []), (0, 0))
+        tmpdir.join("certs", "leftover.tmp").write("")
+        os.utime(str(tmpdir.join("certs", "leftover.tmp")), (0, 0))
+        c.put(b"three.com", [], cert)
+        c.cleanup()
+        assert sorted(os.listdir(c.path)) == sorted(
+            os.path.basename(c._filename(i, [])) for i in (b"two.com", b"three.com")
+        )
+
+
+class TestUpstreamCertCache:
+
+    @staticmethod
+    def _cert():
+        with open(tutils.test_data.path("mitmproxy/net/data/text_cert"), "rb") as f:
+            return certs.SSLCert.from_pem(f.read())
+
+    def test_cache(self):
+        cert = self._cert()
+        c = certs.UpstreamCertCache()
+        c.put("a", cert, b"h2")
+        assert c.get("a") is None
+        assert not len(c)
+
+        c = certs.UpstreamCertCache(size=2)
+        c.put("a", cert, b"h2")
+        c.put("b", cert, None)
+        assert c.get("a") == (cert.cn, tuple(cert.altnames), b"h2")
+        c.put("c", cert, None)
+        assert c.get("b") is None
+        assert c.get("c")[2] is None
+        assert (c.hits, c.misses) == (2, 1)
+        assert repr(c)
+        c.clear()
+        assert not len(c)
+
+    def test_ttl(self):
+        cert = self._cert()
+        c = certs.UpstreamCertCache(size=2, ttl=10)
+        with mock.patch("time.monotonic", return_value=100):
+            c.put("a", cert, None)
+        with mock.patch("time.monotonic", return_value=105):
+            assert c.get("a")
+        with mock.patch("time.monotonic", return_value=111):
+            assert c.get("a") is None
+        assert not len(c)
+
+
 class TestDummyCert:
 
     def test_with_ca(self, tmpdir):
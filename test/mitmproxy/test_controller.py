@@ -5,6 +5,7 @@ import pytest
 
 from mitmproxy.exceptions import Kill, ControlException
 from mitmproxy import controller
+from mitmproxy import log
 from mitmproxy import master
 from mitmproxy import proxy
 from mitmproxy.test import taddons
@@ -29,6 +30,86 @@ class TestMaster:
             ctx.master.run()
             assert ctx.master.should_exit.is_set()
 
+    def test_batch(self):
+        class tAddon:
+            def __init__(self):
+                self.ticks = 0
+                self.logs = 0
+
+            def tick(self):
+                self.ticks += 1
+
+            def log(self, _):
+                self.logs += 1
+
+        with taddons.context() as ctx:
+            a = tAddon()
+            ctx.master.addons.add(a)
+            ctx.options.event_batch_size = 2
+            for _ in range(5):
+                ctx.master.tell("log", TMsg())
+            assert ctx.master.tick(0)
+            assert a.logs == 2
+            assert a.ticks == 1
+            # The tick event runs on its own schedule, not per batch.
+            assert ctx.master.tick(0)
+            assert a.logs == 4
+            assert a.ticks == 1
+            ctx.master.wake()
+            assert ctx.master.tick(0)
+            assert not ctx.master.tick(0)
+            assert a.logs == 5
+            assert a.ticks == 2
+            # New addons get their first tick right away.
+            ctx.master.addons.add(TMsg())
+            assert not ctx.master.tick(0)
+            assert a.ticks == 3
+
+            ctx.options.event_batch_size = 100
+            ctx.options.event_batch_time = 0
+            for _ in range(3):
+                ctx.master.tell("log", TMsg())
+            ctx.master.tick(0)
+            assert a.logs == 6
+
+    def test_stats(self):
+        with taddons.context() as ctx:
+            q = ctx.master.event_queue
+            ctx.master.tell("log", log.LogEntry("foo", "info"))
+            ctx.master.tell("log", log.LogEntry("foo", "info"))
+            ctx.master.tick(0)
+            assert q.count == 2
+            assert q.max_wait >= q.wait
+            assert q.total_wait >= q.max_wait
+
+            ctx.master.tell("log", log.LogEntry("foo", "info"))
+            assert q.qsize() == 1
+            assert q.max_depth == 2
+            assert repr(q).startswith("EventQueue(1 pending, 2 max, 2 handled")
+            ctx.master.log_stats()
+            assert ctx.master.has_log("EventQueue(1 pending")
+            # The numbers stay available after logging.
+            assert q.count == 2
+
+            ctx.master.clear()
+            ctx.master.log_stats()
+            assert not ctx.master.logs
+
+            q.reset_stats()
+            assert q.count == 0
+            assert q.max_depth == 1
+
+    def test_log_from_thread(self):
+        with taddons.context() as ctx:
+            ctx.master.tick(0)
+            assert ctx.master.thread
+            t = Thread(target=ctx.master.add_log, args=("foo", "info"))
+            t.start()
+            t.join()
+            assert not ctx.master.logs
+            ctx.master.tick(0)
+            assert ctx.master.has_log("foo")
+
     def test_server_simple(self):
         m = master.Master(None)
         m.server = proxy.DummyServer()
@@ -70,6 +151,40 @@ class TestChannel:
         channel = controller.Channel(q, Event())
         assert channel.ask("test", Mock(name="test_ask_simple")) == 42
 
+    def test_ask_unhandled(self):
+        q = queue.Queue()
+        channel = controller.Channel(q, Event(), lambda mtype: mtype == "handled")
+        m = Mock(name="test_ask_unhandled")
+        assert channel.ask("unhandled", m) is m
+        assert q.empty()
+        channel.tell("unhandled", m)
+        assert q.get() == ("unhandled", m)
+
+    def test_ask_inline(self):
+        q = queue.Queue()
+        seen = []
+
+        def inline(mtype, m):
+            seen.append(m.reply.state)
+            return mtype == "handled"
+
+        channel = controller.Channel(q, Event(), inline=inline)
+        m = Mock(name="test_ask_inline")
+        assert channel.ask("inline", m) is m
+        assert seen == ["start"]
+        assert m.reply.state == "committed"
+        assert q.empty()
+
+        def reply():
+            _, obj = q.get()
+            assert obj.reply.inlined
+            obj.reply.take()
+            obj.reply.send(42)
+            obj.reply.commit()
+
+        Thread(target=reply).start()
+        assert channel.ask("handled", m) == 42
+
     def test_ask_shutdown(self):
         q = queue.Queue()
         done = Event()
@@ -90,32 +205,32 @@ class TestReply:
         reply.take()
         assert reply.state == "taken"
 
-        with pytest.raises(queue.Empty):
-            reply.q.get_nowait()
+        assert reply.wait(timeout=0) is controller.NO_REPLY
         reply.commit()
         assert reply.state == "committed"
-        assert reply.q.get() == "foo"
+        assert reply.wait() == "foo"
+        assert reply.wait(timeout=0) == "foo"
 
     def test_kill(self):
         reply = controller.Reply(43)
         reply.kill()
         reply.take()
         reply.commit()
-        assert reply.q.get() == Kill
+        assert reply.wait() == Kill
 
     def test_ack(self):
         reply = controller.Reply(44)
         reply.ack()
         reply.take()
         reply.commit()
-        assert reply.q.get() == 44
+        assert reply.wait() == 44
 
     def test_reply_none(self):
         reply = controller.Reply(45)
         reply.send(None)
         reply.take()
         reply.commit()
-        assert reply.q.get() is None
+        assert reply.wait() is None
 
     def test_commit_no_reply(self):
         reply = controller.Reply(46)
@@ -182,8 +297,10 @@ class TestDummyReply:
         reply.commit()
         reply.mark_reset()
         assert reply.state == "committed"
+        assert reply.wait(timeout=0) is None
         reply.reset()
         assert reply.state == "start"
+        assert reply.wait(timeout=0) is controller.NO_REPLY
 
     def test_del(self):
         reply = controller.DummyReply()
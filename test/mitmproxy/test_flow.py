@@ -11,6 +11,7 @@ from mitmproxy.exceptions import FlowReadException, ReplayException, ControlExce
 from mitmproxy import flow
 from mitmproxy import http
 from mitmproxy.net import http as net_http
+from mitmproxy.net.http import spool
 from mitmproxy import master
 from . import tservers
 
@@ -35,6 +36,20 @@ class TestSerialize:
         assert f2.request == f.request
         assert f2.marked
 
+    def test_roundtrip_spooled(self):
+        sio = io.BytesIO()
+        f = tflow.tflow(resp=True)
+        f.response.data.content = spool.spool([b"foo", b"bar"], 0)
+        w = mitmproxy.io.FlowWriter(sio)
+        with mock.patch.object(spool.SpooledContent, "read", side_effect=AssertionError):
+            w.add(f)
+        assert f.response.is_spooled
+
+        sio.seek(0)
+        f2 = list(mitmproxy.io.FlowReader(sio).stream())[0]
+        assert f2.response.raw_content == b"foobar"
+        assert f2.get_state() == f.get_state()
+
     def test_filter(self):
         sio = io.BytesIO()
         flt = flowfilter.parse("~c 200")
@@ -1,4 +1,5 @@
 import argparse
+import socket
 from unittest import mock
 from OpenSSL import SSL
 import pytest
@@ -7,7 +8,7 @@ from mitmproxy.tools import cmdline
 from mitmproxy.tools import main
 from mitmproxy import options
 from mitmproxy.proxy import ProxyConfig
-from mitmproxy.proxy.server import DummyServer, ProxyServer, ConnectionHandler
+from mitmproxy.proxy.server import DummyServer, ProxyServer, AsyncProxyServer, ConnectionHandler
 from mitmproxy.proxy import config
 from mitmproxy.test import tutils
 
@@ -69,6 +70,42 @@ class TestProxyServer:
         with pytest.raises(Exception, match="Error starting proxy server"):
             ProxyServer(conf)
 
+    def test_overload(self):
+        conf = ProxyConfig(options.Options(
+            listen_host="127.0.0.1", listen_port=0, connection_limit=1, listen_backlog=5
+        ))
+        s = ProxyServer(conf)
+        assert s.connection_limit == 1
+        s.set_channel(mock.Mock())
+        a, b = socket.socketpair()
+        s.handle_overload(a, ("127.0.0.1", 1234))
+        assert b.recv(1024).startswith(b"HTTP/1.1 503")
+        assert s.channel.tell.called
+        a.close()
+        b.close()
+
+        conf.options.mode = "transparent"
+        a, b = socket.socketpair()
+        s.handle_overload(a, ("127.0.0.1", 1234))
+        a.close()
+        assert b.recv(1024) == b""
+        b.close()
+        s.shutdown()
+
+    def test_shutdown(self):
+        conf = ProxyConfig(options.Options(listen_host="127.0.0.1", listen_port=0))
+        s = ProxyServer(conf)
+        conf.certstore.prefetch(b"example.com", [b"example.com"])
+        assert conf.certstore.executor
+        s.shutdown()
+        assert not conf.certstore.executor
+
+    def test_event_loop(self):
+        conf = ProxyConfig(options.Options(listen_host="127.0.0.1", listen_port=0))
+        s = AsyncProxyServer(conf)
+        assert s.parked_count == 0
+        s.shutdown()
+
 
 class TestDummyServer:
 
@@ -0,0 +1,103 @@
+import queue
+from unittest import mock
+
+from mitmproxy import log
+from mitmproxy import options
+from mitmproxy.proxy import config
+from mitmproxy.test import taddons
+from mitmproxy.test import tflow
+from mitmproxy.tools import workers
+
+
+class Dumper:
+    def __init__(self):
+        self.events = []
+
+    def request(self, f):
+        self.events.append(("request", f.request.path))
+
+    def response(self, f):
+        self.events.append(("response", f.request.path))
+
+    def error(self, f):
+        self.events.append(("error", f.request.path))
+
+
+def test_worker_server():
+    opts = options.Options(listen_host="", listen_port=8080)
+    s = workers.WorkerServer(config.ProxyConfig(opts))
+    assert s.bound
+    assert s.address == ("*", 8080)
+
+
+def test_forward():
+    q = queue.Queue()
+    fwd = workers.Forward(q)
+    with taddons.context() as tctx:
+        f = tflow.tflow(resp=True)
+        fwd.response(f)
+        assert q.get_nowait() == ("flow", f.get_state())
+        f.error = tflow.terr()
+        fwd.error(f)
+        assert q.empty()
+        f = tflow.tflow(err=True)
+        fwd.error(f)
+        assert q.get_nowait()[1]["error"]
+        f = mock.Mock()
+        fwd.tcp_end(f)
+        fwd.websocket_end(f)
+        assert q.qsize() == 2
+        assert f.get_state.call_count == 2
+        q.queue.clear()
+
+        tctx.configure(fwd, verbosity="info")
+        fwd.log(log.LogEntry("foo", "debug"))
+        assert q.empty()
+        fwd.log(log.LogEntry("foo", "warn"))
+        assert q.get_nowait() == ("log", "foo", "warn")
+
+
+def test_collect():
+    w = workers.Workers()
+    w.queue = queue.Queue()
+    d = Dumper()
+    with taddons.context() as tctx:
+        tctx.master.addons.add(d)
+        w.queue.put(("flow", tflow.tflow(resp=True).get_state()))
+        w.queue.put(("log", "foo", "warn"))
+        w.queue.put(("flow", tflow.tflow(err=True).get_state()))
+        w.collect()
+        assert d.events == [
+            ("request", "/path"), ("response", "/path"),
+            ("request", "/path"), ("error", "/path"),
+        ]
+        assert tctx.master.has_log("foo", "warn")
+        # Flows only go to the output addons, not to the whole chain.
+        assert not tctx.master.has_event("response")
+
+
+def test_lifecycle():
+    w = workers.Workers()
+    with taddons.context() as tctx:
+        tctx.configure(w, workers=1)
+        w.running()
+        assert not w.processes
+        w.tick()
+        w.done()
+
+        w.queue = queue.Queue()
+        p = mock.Mock(exitcode=None, pid=42)
+        p.is_alive.return_value = True
+        w.processes = [p]
+        w.tick()
+        assert not tctx.master.should_exit.is_set()
+        p.exitcode = 1
+        w.tick()
+        assert tctx.master.has_log("exited with code 1", "error")
+        assert tctx.master.should_exit.is_set()
+
+        p.is_alive.side_effect = [True, False]
+        w.done()
+        assert p.terminate.called
+        assert p.join.called
+        assert not w.processes
@@ -137,6 +137,22 @@ class TestMultiDict:
             ("e", "f"),
         )
 
+    def test_index(self):
+        md = self._multi()
+        assert "BAR" in md
+        assert md.get_all("bar") == ["baz", "bam"]
+        md.fields = (("Bar", "x"), ("foo", "y"), ("bar", "z"))
+        assert md.get_all("bar") == ["x", "z"]
+        assert list(md) == ["Bar", "foo"]
+        assert len(md) == 2
+        md.add("baz", "1")
+        assert "baz" in md
+        del md["BAR"]
+        assert md.fields == (("foo", "y"), ("baz", "1"))
+        assert "bar" not in md
+        with pytest.raises(KeyError):
+            del md["bar"]
+
     def test_add(self):
         md = self._multi()
         md.add("foo", "foo")